@@ -307,10 +307,11 @@ def write_geojson(features: List[Dict], output_path: Path):
         json.dump(geojson, f)
 
 
-def write_parquet(all_features: Dict[int, List[Dict]], output_path: Path):
+def write_parquet(all_features: Dict[int, List[Dict]], output_path: Path, h3_uint64: bool = False):
     """
     Escribe todos los features a un archivo Parquet.
     Solo guarda h3_index, value y h3_res (sin geometría).
+    Con h3_uint64, h3_index se guarda como uint64 (h3.str_to_int) en lugar de texto.
     """
     if not PARQUET_AVAILABLE:
         print("  Error: pyarrow no está instalado. Ejecuta: pip install pyarrow")
@@ -326,8 +327,13 @@ def write_parquet(all_features: Dict[int, List[Dict]], output_path: Path):
             values.append(feature['properties']['value'])
             h3_resolutions.append(h3_res)
 
+    if h3_uint64:
+        h3_column = pa.array([h3.str_to_int(c) for c in h3_indices], type=pa.uint64())
+    else:
+        h3_column = pa.array(h3_indices, type=pa.string())
+
     table = pa.table({
-        'h3_index': pa.array(h3_indices, type=pa.string()),
+        'h3_index': h3_column,
         'value': pa.array(values, type=pa.float32()),
         'h3_res': pa.array(h3_resolutions, type=pa.uint8())
     })
@@ -396,12 +402,14 @@ def process_tif_to_pmtiles(
     h3_config: List[Dict] = None,
     keep_geojson: bool = False,
     generate_parquet: bool = False,
-    force_detailed: bool = False
+    force_detailed: bool = False,
+    h3_uint64: bool = False
 ):
     """
     Procesa un archivo TIF y genera PMTiles con hexágonos H3.
 
     force_detailed: Forzar uso de resoluciones altas (solo para áreas pequeñas)
+    h3_uint64: Guardar h3_index como uint64 en el Parquet
     """
     # La configuración se determina después de leer el raster
     config_to_use = h3_config
@@ -500,7 +508,7 @@ def process_tif_to_pmtiles(
         if generate_parquet and all_features_for_parquet:
             parquet_path = output_pmtiles.with_suffix('.parquet')
             print(f"\nGenerando Parquet...")
-            write_parquet(all_features_for_parquet, parquet_path)
+            write_parquet(all_features_for_parquet, parquet_path, h3_uint64=h3_uint64)
 
         return success
 
@@ -540,7 +548,7 @@ Requisitos:
   - Sistema: tippecanoe (https://github.com/felt/tippecanoe)
 
 Estructura del Parquet:
-  - h3_index (string): Índice H3 del hexágono
+  - h3_index (string, o uint64 con --h3-uint64): Índice H3 del hexágono
   - value (float32): Valor climático
   - h3_res (uint8): Resolución H3 (1, 3, 5, 7, 8)
 
@@ -584,6 +592,12 @@ Configuración H3:
         help='Generar también archivo Parquet para consultas con DuckDB'
     )
 
+    parser.add_argument(
+        '--h3-uint64',
+        action='store_true',
+        help='Guardar h3_index como uint64 en el Parquet (más compacto; h3.int_to_str para leerlo)'
+    )
+
     parser.add_argument(
         '--detailed',
         action='store_true',
@@ -606,7 +620,8 @@ Configuración H3:
         output_pmtiles=args.output,
         keep_geojson=args.keep_geojson,
         generate_parquet=args.parquet,
-        force_detailed=args.detailed
+        force_detailed=args.detailed,
+        h3_uint64=args.h3_uint64
     )
 
     sys.exit(0 if success else 1)
@@ -1,13 +1,18 @@
+import os
+import sys
 import pandas as pd
 from datetime import datetime
 
+# Los módulos compartidos viven en scripts/ y se importan por nombre, como entre los scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from functions_stations import load_station_table
+
 
 month_num = {1:'ene', 2:'feb', 3:'mar', 4:'abr', 5:'may', 6:'jun', 7:'jul', 8:'ago', 9:'sep', 10:'oct', 11:'nov', 12:'dic'}
 
 def get_points_df(year, month, day, hour, var, airquality_hdf, estaciones_xls='informacion_estaciones_red_calidad_aire.xls'):
 
-    estaciones = pd.read_excel(estaciones_xls)
-    estaciones_dict = {n.CODIGO_CORTO:[n.LONGITUD, n.LATITUD] for i,n in estaciones.iterrows()}
+    stations = load_station_table(estaciones_xls)
     
     points_df = pd.DataFrame(columns=['sta','lon','lat', 'z'])
                                       #'H01','H02','H03','H04','H05','H06','H06','H07','H08','H09',
@@ -25,8 +30,7 @@ def get_points_df(year, month, day, hour, var, airquality_hdf, estaciones_xls='i
     points_df['sta'] = df_f['ESTACION']
     points_df['z'] = df_f['H{:02.0f}'.format(hour)]
 
-    points_df['lon'] = points_df.apply(lambda row: estaciones_dict[row.sta][0], axis=1)
-    points_df['lat'] = points_df.apply(lambda row: estaciones_dict[row.sta][1], axis=1)
+    points_df['lon'], points_df['lat'] = stations.lonlat(points_df['sta'].values)
     
     # points_df.loc[:,['sta', 'z'] ]
     return points_df  
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+Construye el cubo denso estación x hora a partir de air_quality.h5.
+
+Por cada magnitud genera un array float32 de forma (horas desde 2001-01-01, estaciones) y su
+máscara de validez (V01..V24 == 'V') como ficheros .npy mapeables en memoria, más un meta.json
+con el eje de estaciones. Así la interpolación puede leer cualquier rango de horas sin pandas
+ni volver a fundir el formato ancho de Madrid (H01..H24).
+
+Uso:
+    python scripts/01_build_airquality_cube.py \
+        --airquality-h5 madno2-viewer/public/data/air_quality.h5 \
+        --outdir madno2-viewer/public/data/air_quality_cube \
+        --magnitudes 8,12
+
+Lectura:
+    from functions_airquality import AirQualityCube
+    cube = AirQualityCube('madno2-viewer/public/data/air_quality_cube', 8)
+    values, valid = cube.slice(cube.hour_index(2024, 1, 1, 1), cube.hour_index(2025, 1, 1, 1))
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from functions_airquality import AirQualityCube, build_cube
+
+AIR_DATA_H5 = 'madno2-viewer/public/data/air_quality.h5'
+CUBE_DIR = 'madno2-viewer/public/data/air_quality_cube'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convierte air_quality.h5 en un cubo denso estación x hora por magnitud (.npy)")
+    parser.add_argument("--airquality-h5", type=str, default=AIR_DATA_H5, help=f"HDF5 de entrada (defecto={AIR_DATA_H5})")
+    parser.add_argument("--outdir", type=str, default=CUBE_DIR, help=f"Directorio del cubo (defecto={CUBE_DIR})")
+    parser.add_argument("--magnitudes", type=str, default="8,12", help="Magnitudes separadas por coma (defecto=8,12)")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+
+    try:
+        magnitudes = [int(m.strip()) for m in args.magnitudes.split(',') if m.strip()]
+    except ValueError:
+        logging.error("--magnitudes debe contener enteros separados por coma, p.ej.: 8,12")
+        sys.exit(2)
+
+    if not os.path.isfile(args.airquality_h5):
+        logging.error("No existe el HDF5 de entrada: %s", args.airquality_h5)
+        sys.exit(1)
+
+    meta = build_cube(args.airquality_h5, args.outdir, magnitudes)
+    logging.info("Cubo guardado en %s: %s horas x %s estaciones, magnitudes=%s",
+                 os.path.abspath(args.outdir), meta['n_hours'], len(meta['stations']), meta['magnitudes'])
+
+    for var in magnitudes:
+        cube = AirQualityCube(args.outdir, var)
+        logging.info("Magnitud %s: %s valores válidos", var, int(cube.valid.sum()))
+
+
+if __name__ == "__main__":
+    main()
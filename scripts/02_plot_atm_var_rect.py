@@ -11,6 +11,8 @@ import os
 from shapely.geometry import Polygon
 from matplotlib.path import Path
 
+from functions_stations import load_station_table
+
 # --- Parámetros de configuración (ajústalos desde aquí) ---
 # Interpolación RBF (extrapola y rellena todo el BBOX)
 RBF_KERNEL = 'thin_plate_spline'   # opciones: 'multiquadric', 'gaussian', 'linear', 'cubic', 'quintic'
@@ -44,8 +46,7 @@ month_num = {1:'ene', 2:'feb', 3:'mar', 4:'abr', 5:'may', 6:'jun', 7:'jul', 8:'a
 def get_points_df(year, month, day, hour, var, airquality_hdf, estaciones_xls):
     """Reads data for a specific variable and time, returning a DataFrame with coordinates."""
     print(f"Loading station data from {estaciones_xls}...")
-    estaciones = pd.read_excel(estaciones_xls, sheet_name='Hoja1')
-    estaciones_dict = {n.CODIGO_CORTO: [n.LONGITUD, n.LATITUD] for i, n in estaciones.iterrows()}
+    stations = load_station_table(estaciones_xls)
     
     timestamp = datetime(year=year, month=month, day=day).isoformat()
     df_label = f'/y{year}/{month_num[month]}_mo{str(year)[-2:]}'
@@ -63,8 +64,7 @@ def get_points_df(year, month, day, hour, var, airquality_hdf, estaciones_xls):
     points_df = pd.DataFrame()
     points_df['sta'] = df_f['ESTACION']
     points_df['z'] = df_f[hour_col]
-    points_df['lon'] = points_df.apply(lambda row: estaciones_dict.get(row.sta, [None, None])[0], axis=1)
-    points_df['lat'] = points_df.apply(lambda row: estaciones_dict.get(row.sta, [None, None])[1], axis=1)
+    points_df['lon'], points_df['lat'] = stations.lonlat(points_df['sta'].values)
     
     return points_df.dropna(subset=['lon', 'lat', 'z'])
 
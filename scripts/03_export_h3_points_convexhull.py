@@ -4,6 +4,8 @@ import os
 import geopandas as gpd
 from scipy.interpolate import RBFInterpolator
 
+from functions_interpolation import make_interpolator
+
 # --- Parámetros de configuración (ajústalos desde aquí) ---
 # Interpolación RBF (extrapola y rellena todo el BBOX)
 RBF_KERNEL = 'thin_plate_spline'   # opciones: 'multiquadric', 'gaussian', 'linear', 'cubic', 'quintic'
@@ -52,14 +54,6 @@ def main(args):
         xs, ys = wgs84_to_3857.transform(gdf['lon'].values, gdf['lat'].values)
         zs = gdf['z'].values
 
-        rbf = RBFInterpolator(
-            np.column_stack([xs, ys]),
-            zs,
-            kernel=RBF_KERNEL,
-            smoothing=RBF_SMOOTHING,
-            neighbors=RBF_NEIGHBORS,
-        )
-
         # --- Build H3 cells within convex hull of stations ---
         clip_poly_wgs84 = make_clip_polygon_convex(gdf)
         cells, cell_to_latlng = build_h3_cells_in_polygon(clip_poly_wgs84, args.h3_res)
@@ -75,7 +69,18 @@ def main(args):
             cells_list.append(cell)
 
         cx, cy = wgs84_to_3857.transform(np.array(centers_lon), np.array(centers_lat))
-        pred = rbf(np.column_stack([cx, cy]))
+        if RBF_NEIGHBORS is None:
+            # RBF global: mismo resultado que RBFInterpolator, con el sistema factorizado reutilizable
+            pred = make_interpolator('rbf', xs, ys, cx, cy, kernel=RBF_KERNEL, smoothing=RBF_SMOOTHING).predict(zs)
+        else:
+            rbf = RBFInterpolator(
+                np.column_stack([xs, ys]),
+                zs,
+                kernel=RBF_KERNEL,
+                smoothing=RBF_SMOOTHING,
+                neighbors=RBF_NEIGHBORS,
+            )
+            pred = rbf(np.column_stack([cx, cy]))
 
         # Clip valores negativos (no deberían existir)
         pred = np.clip(pred, 0, None)
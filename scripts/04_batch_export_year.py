@@ -1,6 +1,9 @@
 """
-Batch export anual: recorre todas las horas de un año y llama al script 03_export_h3_points_convexhull.py
-para generar CSV + GeoJSON por cada hora.
+Batch export anual: recorre todas las horas de un año e interpola cada hora (por defecto kriging, mismo
+proceso que 03_export_h3_points_convexhull_krigging.py) para generar CSV + GeoJSON por cada hora.
+
+Todo se ejecuta en el mismo proceso: el XLS de estaciones se lee una vez y la tabla HDF5 de cada mes
+se carga una sola vez para todas sus horas (antes se lanzaba un intérprete nuevo por hora).
 
 Uso:
     python scripts/04_batch_export_year.py \
@@ -19,14 +22,47 @@ Notas:
 - No crea el directorio de salida: debe existir previamente.
 - Nombres de salida: points_YYYYMMDD_HH_res{res}.csv y .geojson dentro de --outdir
 - Progreso: usa tqdm si está instalado; si no, logs por hora.
+- Rutas de entrada por defecto relativas a la raíz del proyecto (--airquality-h5, --estaciones-xls).
+- Paralelo: --workers N reparte los días (o meses, --chunk month) de todos los años entre N procesos.
+  Cada worker lee el XLS una vez y conserva en caché los últimos meses leídos; el proceso padre agrega
+  progreso, contadores OK/SKIP/FAIL y escribe los logs por año. Conviene lanzar con OMP_NUM_THREADS=1
+  para que BLAS no multiplique los hilos de cada worker.
+- Las celdas H3 del convex hull (y sus polígonos) se cachean por conjunto de estaciones en --cover-cache
+  (defecto: <outdir>/.h3_cover_cache), compartido entre workers y ejecuciones.
+- El sistema de kriging se factoriza una vez por conjunto de estaciones y las 24 horas de cada día se
+  resuelven juntas (un producto matriz-matriz por conjunto de estaciones).
+- Método: --method kriging|rbf|idw|nearest, con parámetros --method-opt clave=valor (repetible).
+  IDW/nearest sirven para generar años de vista rápida a una fracción del coste del kriging:
+
+    python scripts/04_batch_export_year.py --year 2024 --outdir /Volumes/MV/carto/madno2_idw \
+        --method idw --method-opt power=2 --method-opt neighbors=6
+- Formato: --format parquet escribe directamente el árbol hive <outdir>/year=YYYY/month=MM/part-YYYYMM.parquet
+  (h3_index uint64, datetime timestamp, value float32) sin CSV ni GeoJSON intermedios, así que no hace falta
+  05_from_csv_to_geoparquet.py. Cada trozo es un mes (--chunk month implícito) que se acumula en memoria y se
+  escribe al terminar; si el fichero del mes ya existe el mes se marca SKIP. Los logs van a <outdir>.
+
+    python scripts/04_batch_export_year.py --year 2001,2002 --outdir /Volumes/MV/carto/madno2Parquet \
+        --format parquet --workers 12
+  Orden, row groups, compresión y bloom filters: --parquet-sort time|cell, --row-group-size,
+  --parquet-compression, --parquet-dictionary, --parquet-bloom-filter (ver functions_parquet).
+
+    OMP_NUM_THREADS=1 python scripts/04_batch_export_year.py \
+        --year 2000,2001,2002 --outdir /Volumes/MV/carto/madno2 --h3-res 9 --variable 8 --workers 32
 """
 
 import argparse
 import logging
 import os
-import subprocess
 import sys
-from datetime import date, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+from functions_03_krigging import AIR_DATA_H5, ESTACIONES_XLS, interpolate_day, save_h3_outputs
+from functions_airquality import MonthReader
+from functions_h3cover import H3CoverCache
+from functions_interpolation import INTERPOLATORS, SolverCache, parse_method_options
+from functions_parquet import MonthPartitionWriter, ParquetWriteOptions, add_parquet_arguments, parquet_options_from_args
+from functions_stations import load_station_table
 
 
 def iter_days(year: int):
@@ -38,41 +74,220 @@ def iter_days(year: int):
         d += timedelta(days=1)
 
 
+def iter_chunks(year: int, chunk: str):
+    """Trocea el año en listas de días: un día por trozo ('day') o un mes por trozo ('month')."""
+    days = list(iter_days(year))
+    if chunk == "day":
+        for d in days:
+            yield [d]
+        return
+    for month in range(1, 13):
+        yield [d for d in days if d.month == month]
+
+
 def ensure_outdir_exists(path: str):
     if not os.path.isdir(path):
         raise FileNotFoundError(
             f"El directorio de salida no existe: {path}. Créalo antes de ejecutar el script.")
 
 
-def run_export_03(py_exe: str, script_03: str, year: int, month: int, day: int, hour: int,
-                  variable: int, h3_res: int, out_csv: str, out_geojson: str) -> subprocess.CompletedProcess:
-    """Lanza el script 03_export_h3_points_convexhull.py con los parámetros adecuados."""
-    cmd = [
-        py_exe,
-        script_03,
-        "--year", str(year),
-        "--month", str(month),
-        "--day", str(day),
-        "--hour", str(hour),
-        "--variable", str(variable),
-        "--h3-res", str(h3_res),
-        "-o", out_csv,
-        "--output-geojson", out_geojson,
-    ]
-    # stdout/stderr capturados para logging
-    return subprocess.run(cmd, capture_output=True, text=True)
+def export_day(reader: MonthReader, stations, d: date, variable: int, h3_res: int, year_dir: str,
+               covers: H3CoverCache = None, solvers: SolverCache = None, method: str = "kriging",
+               options: dict = None, writer: MonthPartitionWriter = None):
+    """Interpola en proceso las 24 horas de un día y guarda CSV + GeoJSON por hora.
+
+    reader sirve las tablas de mes desde su caché LRU, stations es la StationTable, covers la
+    caché de celdas H3 y solvers la de sistemas factorizados del método de interpolación. Las horas
+    con las mismas estaciones se resuelven juntas. Con writer las horas se acumulan en el escritor
+    Parquet en vez de escribir CSV + GeoJSON.
+    Devuelve {hora: None si todo fue bien o un texto con el error}.
+    """
+    errors, frames = {}, {}
+    for h in range(1, 25):
+        try:
+            df = reader.points(d.year, d.month, d.day, h, variable, stations)
+        except Exception as e:
+            errors[h] = f"{type(e).__name__}: {e}"
+            continue
+        if df.empty:
+            errors[h] = "No data found for the specified parameters."
+        else:
+            frames[h] = df
+
+    if frames:
+        results = interpolate_day(frames, d.year, d.month, d.day, h3_res, method, options,
+                                  cover_cache=covers, solver_cache=solvers)
+        for h, result in results.items():
+            if isinstance(result, Exception):
+                errors[h] = f"{type(result).__name__}: {result}"
+                continue
+            base = f"points_{d.strftime('%Y%m%d')}_{h:02d}_res{h3_res}"
+            out_df, cover = result
+            try:
+                if writer is not None:
+                    # Hk del día d -> d + k horas (H24 es las 00:00 del día siguiente)
+                    ts = datetime(d.year, d.month, d.day) + timedelta(hours=h)
+                    writer.add(ts, cover.cell_ids(), out_df['value'].to_numpy())
+                else:
+                    save_h3_outputs(out_df, os.path.join(year_dir, base + ".csv"),
+                                    os.path.join(year_dir, base + ".geojson"), cover=cover)
+            except Exception as e:
+                errors[h] = f"{type(e).__name__}: {e}"
+                continue
+            errors[h] = None
+    return errors
+
+
+# Estado por proceso (worker o el propio proceso en modo secuencial)
+_state = {}
+
+
+def init_worker(estaciones_xls: str, airquality_h5: str, cover_cache_dir: str = None, quiet: bool = True,
+                with_boundaries: bool = True):
+    """Inicializa un proceso exportador: lee la tabla de estaciones una sola vez.
+
+    with_boundaries: calcula los contornos de las celdas (solo los usa la salida GeoJSON, no Parquet).
+    """
+    if quiet:
+        # Los workers solo devuelven resultados; los logs los escribe el padre
+        logging.basicConfig(level=logging.WARNING, force=True)
+    _state["stations"] = load_station_table(estaciones_xls)
+    _state["reader"] = MonthReader(airquality_h5, max_months=2)
+    _state["covers"] = H3CoverCache(cover_cache_dir, with_boundaries=with_boundaries)
+    _state["solvers"] = SolverCache()
+
+
+def export_chunk(days, year_dir: str, variable: int, h3_res: int, method: str = "kriging", options: dict = None,
+                 parquet_root: str = None, parquet_options: ParquetWriteOptions = None):
+    """Exporta todas las horas de una lista de días.
+
+    Con parquet_root las horas se escriben en el árbol Parquet (un fichero por mes de destino al
+    final del trozo) en lugar de CSV + GeoJSON en year_dir.
+    Devuelve una lista de (fecha_iso, hora, base, estado, error) con estado OK, SKIP o FAIL.
+    """
+    if parquet_root:
+        return export_chunk_parquet(days, parquet_root, variable, h3_res, method, options, parquet_options)
+
+    results = []
+    for d in days:
+        # Interpolar y guardar las 24 horas del día
+        errors = export_day(_state["reader"], _state["stations"], d, variable, h3_res, year_dir,
+                            _state["covers"], _state["solvers"], method, options)
+        for h in range(1, 25):
+            base = f"points_{d.strftime('%Y%m%d')}_{h:02d}_res{h3_res}"
+            out_csv = os.path.join(year_dir, base + ".csv")
+            out_geojson = os.path.join(year_dir, base + ".geojson")
+            err = errors.get(h)
+
+            # Comprobación de resultado (y ficheros creados)
+            csv_exists = os.path.isfile(out_csv)
+            gj_exists = os.path.isfile(out_geojson)
+
+            if err is None and csv_exists and gj_exists:
+                status = "OK"
+            elif csv_exists and gj_exists:
+                # Si ya existían, marcamos skip
+                status = "SKIP"
+            else:
+                status = "FAIL"
+            results.append((d.isoformat(), h, base, status, err))
+    return results
+
+
+def export_chunk_parquet(days, parquet_root: str, variable: int, h3_res: int, method: str, options: dict,
+                         parquet_options: ParquetWriteOptions = None):
+    """Exporta una lista de días (normalmente un mes) al árbol Parquet particionado."""
+    first = days[0]
+    writer = MonthPartitionWriter(parquet_root, tag=f"{first.year}{first.month:02d}", options=parquet_options)
+    bases = [(d, h, f"points_{d.strftime('%Y%m%d')}_{h:02d}_res{h3_res}") for d in days for h in range(1, 25)]
+
+    if os.path.isfile(writer.part_path(first.year, first.month)):
+        # Ya exportado en una ejecución anterior
+        return [(d.isoformat(), h, base, "SKIP", None) for d, h, base in bases]
+
+    errors = {}
+    for d in days:
+        for h, err in export_day(_state["reader"], _state["stations"], d, variable, h3_res, None,
+                                 _state["covers"], _state["solvers"], method, options, writer).items():
+            errors[(d, h)] = err
+
+    try:
+        writer.close()
+    except Exception as e:
+        # Si falla la escritura del mes ninguna de sus horas queda guardada
+        msg = f"{type(e).__name__}: {e}"
+        errors = {key: err or msg for key, err in errors.items()}
+
+    results = []
+    for d, h, base in bases:
+        err = errors[(d, h)]
+        results.append((d.isoformat(), h, base, "OK" if err is None else "FAIL", err))
+    return results
+
+
+def open_year_logger(year: int, log_path: str) -> logging.Logger:
+    """Logger propio del año: escribe en su fichero y propaga a la consola (root)."""
+    logger = logging.getLogger(f"export.{year}")
+    logger.setLevel(logging.INFO)
+    file_handler = logging.FileHandler(log_path, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    logger.addHandler(file_handler)
+    return logger
+
+
+def close_year_logger(logger: logging.Logger):
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def log_chunk_results(logger: logging.Logger, counts: dict, results):
+    """Registra el resultado de cada hora de un trozo y acumula los contadores del año."""
+    for day_iso, h, base, status, err in results:
+        counts[status] += 1
+        if status == "OK":
+            logger.info("OK %s %02d: %s", day_iso, h, base)
+        elif status == "SKIP":
+            logger.warning("SKIP (ya existían) %s %02d: %s", day_iso, h, base)
+        else:
+            logger.error("FAIL %s %02d: %s | error=%s", day_iso, h, base, err)
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Batch export año completo -> llama al 03 por cada hora del año")
+    parser = argparse.ArgumentParser(description="Batch export año completo -> interpola cada hora del año en proceso")
     parser.add_argument("--year", type=str, required=True, help="Año(s) a procesar separados por coma (e.g., 2024 o 2001,2002,2005)")
     parser.add_argument("--outdir", type=str, required=True, help="Directorio de salida (debe existir)")
     parser.add_argument("--h3-res", type=int, default=9, help="Resolución H3 (defecto=9)")
     parser.add_argument("--variable", type=int, default=12, help="Código de variable atmosférica (defecto=12)")
     parser.add_argument("--log", type=str, default="", help="Ruta del fichero log (por defecto: en outdir)")
+    parser.add_argument("--airquality-h5", type=str, default=AIR_DATA_H5, help=f"HDF5 con los datos horarios (defecto={AIR_DATA_H5})")
+    parser.add_argument("--estaciones-xls", type=str, default=ESTACIONES_XLS, help=f"XLS de estaciones (defecto={ESTACIONES_XLS})")
+    parser.add_argument("--workers", type=int, default=1, help="Número de procesos en paralelo (defecto=1, secuencial)")
+    parser.add_argument("--chunk", choices=["day", "month"], default="day",
+                        help="Unidad de reparto entre workers: día o mes (defecto=day)")
+    parser.add_argument("--method", choices=sorted(INTERPOLATORS), default="kriging",
+                        help="Método de interpolación (defecto=kriging)")
+    parser.add_argument("--method-opt", action="append", default=[], metavar="CLAVE=VALOR",
+                        help="Parámetro del método, repetible (p.ej. kernel=thin_plate_spline, power=2, neighbors=8)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="csv: CSV + GeoJSON por hora en <outdir>/<año>; parquet: árbol hive year=/month= en <outdir> (defecto=csv)")
+    add_parquet_arguments(parser)
+    parser.add_argument("--cover-cache", type=str, default="",
+                        help="Directorio de caché de celdas H3 por conjunto de estaciones (defecto: <outdir>/.h3_cover_cache)")
     args = parser.parse_args()
 
     ensure_outdir_exists(args.outdir)
+    if args.format == "parquet":
+        # Un escritor por mes: el buffer de cada trozo es el mes completo
+        args.chunk = "month"
+    try:
+        parquet_options = parquet_options_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        method_options = parse_method_options(args.method_opt)
+    except ValueError as e:
+        parser.error(str(e))
 
     logging.basicConfig(
         level=logging.INFO,
@@ -82,13 +297,12 @@ def main():
         ],
     )
     logging.info("Inicio de exportación anual")
-    logging.info("Parámetros: year=%s, outdir=%s, h3_res=%s, variable=%s", args.year, args.outdir, args.h3_res, args.variable)
+    logging.info("Parámetros: year=%s, outdir=%s, h3_res=%s, variable=%s, method=%s %s, format=%s, workers=%s, chunk=%s",
+                 args.year, args.outdir, args.h3_res, args.variable, args.method, method_options,
+                 args.format, args.workers, args.chunk)
 
-    # Resolver ruta al script 03 (en el mismo directorio que este 04)
-    here = os.path.dirname(os.path.abspath(__file__))
-    script_03 = os.path.join(here, "03_export_h3_points_convexhull_krigging.py")
-    if not os.path.isfile(script_03):
-        logging.error("No se encuentra el script 03 en %s", script_03)
+    if not os.path.isfile(args.estaciones_xls):
+        logging.error("No se encuentra el XLS de estaciones (ejecuta desde la raíz del proyecto): %s", args.estaciones_xls)
         sys.exit(1)
 
     # Parsear lista de años (coma-separados)
@@ -109,68 +323,68 @@ def main():
         tqdm = None
         have_tqdm = False
 
-    # Procesa cada año por separado, creando su subcarpeta y su log
+    # Prepara cada año: su subcarpeta, su log y sus contadores
+    year_dirs, loggers, counts, total_hours = {}, {}, {}, {}
+    parquet_root = args.outdir if args.format == "parquet" else None
     for year in years:
-        # Crea subcarpeta por año
-        year_dir = os.path.join(args.outdir, str(year))
+        # En modo Parquet no hay carpeta por año: los logs quedan en la raíz del árbol
+        year_dir = args.outdir if parquet_root else os.path.join(args.outdir, str(year))
         os.makedirs(year_dir, exist_ok=True)
+        year_dirs[year] = year_dir
 
         # Fichero de log por año (si no se pasó --log, se crea dentro del directorio del año)
         log_path = args.log or os.path.join(year_dir, f"export_{year}_res{args.h3_res}.log")
-        file_handler = logging.FileHandler(log_path, encoding="utf-8")
-        file_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-        logging.getLogger().addHandler(file_handler)
-
-        logging.info("Inicio de exportación anual")
-        logging.info("Parámetros: year=%s, outdir=%s, h3_res=%s, variable=%s", year, year_dir, args.h3_res, args.variable)
-
-        total_hours = sum(24 for _ in iter_days(year))
-        pbar = tqdm(total=total_hours, desc=f"Export {year}") if have_tqdm else None
-
-        ok_count = skip_count = fail_count = 0
+        loggers[year] = open_year_logger(year, log_path)
+        loggers[year].info("Inicio de exportación anual")
+        loggers[year].info("Parámetros: year=%s, outdir=%s, h3_res=%s, variable=%s, method=%s %s",
+                           year, year_dir, args.h3_res, args.variable, args.method, method_options)
 
-        for d in iter_days(year):
-            for h in range(1, 25):
-                base = f"points_{d.strftime('%Y%m%d')}_{h:02d}_res{args.h3_res}"
-                out_csv = os.path.join(year_dir, base + ".csv")
-                out_geojson = os.path.join(year_dir, base + ".geojson")
+        counts[year] = {"OK": 0, "SKIP": 0, "FAIL": 0}
+        total_hours[year] = sum(24 for _ in iter_days(year))
 
-                # Ejecutar 03
-                res = run_export_03(sys.executable, script_03, d.year, d.month, d.day, h,
-                                    args.variable, args.h3_res, out_csv, out_geojson)
+    cover_cache_dir = args.cover_cache or os.path.join(args.outdir, ".h3_cover_cache")
 
-                # Comprobación de resultado (y ficheros creados)
-                csv_exists = os.path.isfile(out_csv)
-                gj_exists = os.path.isfile(out_geojson)
-
-                if res.returncode == 0 and csv_exists and gj_exists:
-                    ok_count += 1
-                    logging.info("OK %s %02d: %s", d.isoformat(), h, base)
-                else:
-                    # Si ya existían, marcamos skip
-                    if csv_exists and gj_exists:
-                        skip_count += 1
-                        logging.warning("SKIP (ya existían) %s %02d: %s", d.isoformat(), h, base)
-                    else:
-                        fail_count += 1
-                        logging.error(
-                            "FAIL %s %02d: %s | return=%s | stdout=%s | stderr=%s",
-                            d.isoformat(), h, base, res.returncode,
-                            (res.stdout or "").strip(), (res.stderr or "").strip(),
-                        )
-
-                if pbar is not None:
-                    pbar.update(1)
+    tasks = [(year, days) for year in years for days in iter_chunks(year, args.chunk)]
+    pbar = tqdm(total=sum(total_hours.values()), desc=f"Export {args.year}") if have_tqdm else None
 
+    def handle(year, results):
+        log_chunk_results(loggers[year], counts[year], results)
         if pbar is not None:
-            pbar.close()
+            pbar.update(len(results))
+
+    if args.workers <= 1:
+        init_worker(args.estaciones_xls, args.airquality_h5, cover_cache_dir, quiet=False,
+                    with_boundaries=args.format != 'parquet')
+        for year, days in tasks:
+            handle(year, export_chunk(days, year_dirs[year], args.variable, args.h3_res, args.method, method_options,
+                                      parquet_root, parquet_options))
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(args.estaciones_xls, args.airquality_h5, cover_cache_dir, True,
+                                           args.format != 'parquet')) as pool:
+            futures = {
+                pool.submit(export_chunk, days, year_dirs[year], args.variable, args.h3_res,
+                            args.method, method_options, parquet_root, parquet_options): (year, days)
+                for year, days in tasks
+            }
+            for fut in as_completed(futures):
+                year, days = futures[fut]
+                try:
+                    results = fut.result()
+                except Exception as e:
+                    # El worker ha muerto: todas las horas del trozo cuentan como FAIL
+                    results = [(d.isoformat(), h, f"points_{d.strftime('%Y%m%d')}_{h:02d}_res{args.h3_res}",
+                                "FAIL", f"{type(e).__name__}: {e}") for d in days for h in range(1, 25)]
+                handle(year, results)
+
+    if pbar is not None:
+        pbar.close()
 
-        logging.info("Fin de exportación %s: OK=%s, SKIP=%s, FAIL=%s, total_hours=%s",
-                     year, ok_count, skip_count, fail_count, total_hours)
-
-        # Quita el file handler de este año antes de pasar al siguiente
-        logging.getLogger().removeHandler(file_handler)
-        file_handler.close()
+    for year in years:
+        c = counts[year]
+        loggers[year].info("Fin de exportación %s: OK=%s, SKIP=%s, FAIL=%s, total_hours=%s",
+                           year, c["OK"], c["SKIP"], c["FAIL"], total_hours[year])
+        close_year_logger(loggers[year])
 
 
 if __name__ == "__main__":
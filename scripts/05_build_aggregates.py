@@ -0,0 +1,53 @@
+"""
+Genera o refresca los agregados por celda (functions_aggregates.py) de un árbol Parquet horario
+year=YYYY/month=MM: daily, monthly, hour_of_day y day_of_week en <raíz>_agg.
+
+Solo recalcula los meses cuyos ficheros de origen cambiaron desde la última ejecución
+(<raíz>_agg/_manifest.json). 05_from_csv_to_geoparquet.py ya lo hace para los meses que convierte;
+este script sirve para árboles generados con 04 --format parquet o tras 05_optimize_parquet.py.
+
+Uso:
+    python scripts/05_build_aggregates.py --input /Volumes/MV/carto/madno2Parquet
+    python scripts/05_build_aggregates.py --input /Volumes/MV/carto/madno2Parquet --year 2024 --tiers daily monthly --force
+
+Consulta de ejemplo (perfil horario de 2024 por celda, sin leer las filas horarias):
+    SELECT h3_index, hour, SUM(sum) / SUM(n) AS mean
+    FROM read_parquet('/Volumes/MV/carto/madno2Parquet_agg/hour_of_day/year=2024/*/*.parquet')
+    GROUP BY ALL
+"""
+import argparse
+import os
+import sys
+import time
+
+from functions_aggregates import AGGREGATE_TIERS, aggregate_root, refresh_aggregates
+from functions_parquet import iter_partitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agregados por celda (diarios, mensuales, perfiles) de un árbol Parquet horario")
+    parser.add_argument("--input", required=True, help="Raíz del árbol Parquet horario (year=/month=)")
+    parser.add_argument("--output", default="", help="Raíz de los agregados (defecto: <input>_agg)")
+    parser.add_argument("--year", type=int, action="append", help="Limita a uno o varios años (repetible)")
+    parser.add_argument("--tiers", nargs="+", choices=list(AGGREGATE_TIERS), default=list(AGGREGATE_TIERS),
+                        help="Niveles a generar (defecto: todos)")
+    parser.add_argument("--force", action="store_true", help="Recalcula aunque el origen no haya cambiado")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input):
+        print(f"Error: La carpeta de entrada '{args.input}' no existe.", file=sys.stderr)
+        sys.exit(1)
+
+    months = [(int(y), int(m)) for y, m, _ in iter_partitions(args.input)]
+    if args.year:
+        months = [(y, m) for y, m in months if y in args.year]
+    agg_root = args.output or aggregate_root(args.input)
+
+    print(f"Agregados de {args.input} -> {agg_root} ({len(months)} meses, niveles: {', '.join(args.tiers)})")
+    t0 = time.time()
+    refreshed = refresh_aggregates(args.input, agg_root, months=months, force=args.force, tiers=args.tiers)
+    print(f"\n{len(refreshed)} meses recalculados en {time.time() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,19 @@
+import argparse
 import os
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from functions_aggregates import aggregate_root, refresh_aggregates
+from functions_h3index import h3_to_uint64
+from functions_parquet import ParquetWriteOptions, PartitionManifest, StreamingParquetWriter, parquet_settings
 
 # --- CONFIGURACIÓN ---
 # Carpeta con los CSV organizados por año
@@ -11,17 +22,242 @@ input_folder = '/Volumes/MV/carto/madno2'
 # Carpeta de salida para los Parquet particionados
 #output_folder = '/Users/luisizquierdo/repos/upm/madno2/madno2-viewer/public/data/parquet'
 output_folder = '/Volumes/MV/carto/madno2Parquet'
+# Guardar h3_index como uint64 en lugar de texto hex (~la mitad de tamaño por fila).
+# Los lectores convierten con functions_h3index (h3_from_uint64 / duckdb_h3_to_text).
+H3_UINT64 = False
+# Escritura: orden dentro del mes ('cell' = (h3_index, datetime) para series de una celda,
+# 'time' = (datetime, h3_index) para snapshots), row groups, ZSTD y bloom filter opcional en h3_index
+PARQUET_OPTIONS = ParquetWriteOptions(sort='cell', row_group_size=131072, compression='zstd', bloom_filter=False)
+# Modo streaming: lee cada CSV por bloques con pyarrow.csv y va escribiendo el Parquet del mes con
+# StreamingParquetWriter. La memoria por worker queda acotada por MAX_ROWS_IN_MEMORY (y el tamaño de
+# row group), no por el tamaño del mes. Con False se usa el modo anterior (todo el mes en pandas).
+STREAMING = True
+MAX_ROWS_IN_MEMORY = 2_000_000
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+# Meses convertidos en paralelo (un proceso por mes)
+WORKERS = 4
+# Conversión incremental: <output_folder>/_manifest.json guarda tamaño y mtime de cada CSV por
+# partición; solo se reconvierten los meses con entradas nuevas, modificadas o borradas (o con
+# otros ajustes de escritura). Con USE_HASH se compara además el SHA-1 del contenido.
+USE_HASH = False
+# Tras convertir, recalcula los agregados (daily, monthly, hour_of_day, day_of_week) de los meses
+# convertidos en <output_folder>_agg (functions_aggregates.py)
+BUILD_AGGREGATES = True
+
+CSV_COLUMNS = ['h3_index', 'datetime', 'value']
+
+# --- LECTURA Y CONVERSIÓN ---
+def output_schema(h3_uint64=False):
+    """Esquema de data.parquet: mismas columnas que el modo pandas (year/month de la partición incluidas)."""
+    return pa.schema([
+        ('h3_index', pa.uint64() if h3_uint64 else pa.string()),
+        ('datetime', pa.timestamp('us')),
+        ('value', pa.float64()),
+        ('year', pa.int32()),
+        ('month', pa.int32()),
+    ])
+
+
+def csv_hour_key(csv_file):
+    """Clave de orden cronológico de points_YYYYMMDD_HH_res9.csv: (YYYYMMDD, HH)."""
+    parts = os.path.basename(csv_file).split('_')
+    return parts[1], int(parts[2])
+
+
+def csv_month_key(csv_file):
+    """Partición ('YYYY-MM') de points_YYYYMMDD_HH_res9.csv: el mes de su marca de tiempo.
+
+    La hora HH del día YYYYMMDD es YYYYMMDD + HH horas, así que la H24 del último día del mes es
+    las 00:00 del día 1 y va a la partición del mes siguiente, igual que en
+    MonthPartitionWriter (04_batch_export_year.py): cada fila está en la partición de su datetime.
+    """
+    date_str, hour = csv_hour_key(csv_file)
+    ts = datetime.strptime(date_str, '%Y%m%d') + timedelta(hours=hour)
+    return f"{ts.year}-{ts.month:02d}"
+
+
+def list_monthly_files(year_path):
+    """Agrupa los CSV de una carpeta de año por partición ('YYYY-MM' -> rutas en orden cronológico).
+
+    La H24 del 31 de diciembre cae en enero del año siguiente: la clave puede ser de otro año.
+    """
+    monthly_files = defaultdict(list)
+    for filename in os.listdir(year_path):
+        if filename.endswith('.csv') and 'points_' in filename:
+            # Extraer fecha del nombre: points_YYYYMMDD_HH_res9.csv
+            try:
+                file_path = os.path.join(year_path, filename)
+                monthly_files[csv_month_key(filename)].append(file_path)
+            except Exception as e:
+                print(f"Warning: No se pudo procesar el nombre del archivo {filename}: {e}")
+                continue
+    return {ym: sorted(files, key=csv_hour_key) for ym, files in monthly_files.items()}
+
+
+def read_csv_batches(csv_file, block_size=CSV_BLOCK_SIZE):
+    """Lee un CSV por bloques de block_size bytes (RecordBatch con h3_index, datetime, value)."""
+    reader = pacsv.open_csv(
+        csv_file,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(
+            column_types={'h3_index': pa.string(), 'datetime': pa.string(), 'value': pa.float64()},
+            include_columns=CSV_COLUMNS,
+        ),
+    )
+    for batch in reader:
+        yield batch
+
+
+def transform_batch(batch, year, month, h3_uint64=False):
+    """Lote leído del CSV -> tabla con el esquema de output_schema.
+
+    La hora 24 se guarda como 00:00 del día siguiente (H24 del día d es d + 24 horas). Las
+    columnas year/month son las de la partición (year, month) a la que va el lote.
+    """
+    dt_text = batch.column('datetime')
+    is_h24 = pc.match_substring(dt_text, ' 24:')
+    dt = pc.strptime(pc.replace_substring(dt_text, ' 24:', ' 00:'), format='%Y-%m-%d %H:%M:%S', unit='us')
+    dt = pc.if_else(is_h24, pc.add(dt, pa.scalar(timedelta(days=1), type=pa.duration('us'))), dt)
+
+    h3_index = batch.column('h3_index')
+    if h3_uint64:
+        h3_index = pa.array(h3_to_uint64(h3_index.to_pylist()), type=pa.uint64())
+
+    return pa.table({
+        'h3_index': h3_index,
+        'datetime': dt,
+        'value': batch.column('value'),
+        'year': pa.array(np.full(len(dt), year, dtype=np.int32)),
+        'month': pa.array(np.full(len(dt), month, dtype=np.int32)),
+    }, schema=output_schema(h3_uint64))
+
+
+class _MonthStats:
+    """Filas, rango temporal y celdas distintas de un mes, acumulados lote a lote."""
+
+    def __init__(self):
+        self.rows = 0
+        self.dt_min = None
+        self.dt_max = None
+        self.cells = None
+
+    def update(self, table):
+        self.rows += table.num_rows
+        mm = pc.min_max(table['datetime']).as_py()
+        self.dt_min = mm['min'] if self.dt_min is None else min(self.dt_min, mm['min'])
+        self.dt_max = mm['max'] if self.dt_max is None else max(self.dt_max, mm['max'])
+        cells = pc.unique(table['h3_index'])
+        self.cells = cells if self.cells is None else pc.unique(pa.concat_arrays([self.cells, cells]))
+
+    def as_dict(self):
+        return {'rows': self.rows, 'dt_min': self.dt_min, 'dt_max': self.dt_max,
+                'cells': len(self.cells) if self.cells is not None else 0}
+
+
+def convert_month_streaming(year, month, csv_files, output_file, h3_uint64=False, options=PARQUET_OPTIONS,
+                            max_rows=MAX_ROWS_IN_MEMORY, block_size=CSV_BLOCK_SIZE):
+    """Convierte los CSV de un mes en output_file por lotes, sin cargar el mes entero en memoria.
+
+    Cada CSV (una hora) se lee entero antes de escribirlo: un fichero con un bloque erróneo se
+    salta completo, como en el modo en memoria, en lugar de dejar sus primeros lotes en el mes.
+    """
+    stats = _MonthStats()
+    warnings = []
+    with StreamingParquetWriter(output_file, output_schema(h3_uint64), options, max_rows=max_rows) as writer:
+        for csv_file in csv_files:
+            try:
+                tables = [transform_batch(batch, year, month, h3_uint64)
+                          for batch in read_csv_batches(csv_file, block_size)]
+            except (pa.ArrowInvalid, KeyError) as e:
+                warnings.append(f"{os.path.basename(csv_file)}: {e}. Saltando...")
+                continue
+            for table in tables:
+                writer.write(table)
+                stats.update(table)
+    return stats.as_dict(), warnings
+
+
+def convert_month_in_memory(year, month, csv_files, output_file, h3_uint64=False, options=PARQUET_OPTIONS):
+    """Modo anterior: lee todo el mes con pandas, concatena y escribe de una vez."""
+    month_dfs = []
+    warnings = []
+    for csv_file in csv_files:
+        try:
+            df = pd.read_csv(csv_file)
+
+            # Validar estructura
+            if 'h3_index' not in df.columns or 'datetime' not in df.columns or 'value' not in df.columns:
+                warnings.append(f"{os.path.basename(csv_file)} no tiene las columnas esperadas. Saltando...")
+                continue
+
+            # Hora 24 -> 00 del día siguiente
+            is_h24 = df['datetime'].str.contains(' 24:', regex=False)
+            df['datetime'] = pd.to_datetime(df['datetime'].str.replace(' 24:', ' 00:', regex=False))
+            df.loc[is_h24, 'datetime'] += pd.Timedelta(days=1)
+
+            if h3_uint64:
+                df['h3_index'] = h3_to_uint64(df['h3_index'])
+
+            # Añadir columnas de partición (las de la partición, no las de datetime)
+            df['year'] = year
+            df['month'] = month
+
+            month_dfs.append(df)
+
+        except Exception as e:
+            warnings.append(f"Error al leer {os.path.basename(csv_file)}: {e}")
+            continue
+
+    if not month_dfs:
+        return {'rows': 0, 'dt_min': None, 'dt_max': None, 'cells': 0}, warnings
+
+    month_combined = pd.concat(month_dfs, ignore_index=True)
+    del month_dfs
+    table = pa.Table.from_pandas(month_combined, preserve_index=False).cast(output_schema(h3_uint64))
+    options.write(table, output_file)
+    return {'rows': len(month_combined), 'dt_min': month_combined['datetime'].min(),
+            'dt_max': month_combined['datetime'].max(), 'cells': month_combined['h3_index'].nunique()}, warnings
+
+
+def convert_month(year_month, csv_files, output_file, streaming=STREAMING, h3_uint64=H3_UINT64,
+                  options=PARQUET_OPTIONS, max_rows=MAX_ROWS_IN_MEMORY):
+    """Tarea de un worker: convierte un mes y devuelve (year_month, stats, warnings)."""
+    year, month = (int(p) for p in year_month.split('-'))
+    if streaming:
+        stats, warnings = convert_month_streaming(year, month, csv_files, output_file, h3_uint64, options, max_rows)
+    else:
+        stats, warnings = convert_month_in_memory(year, month, csv_files, output_file, h3_uint64, options)
+    return year_month, stats, warnings
+
+
+def report_month(year_month, n_files, output_file, stats, warnings):
+    print(f"\n  {year_month} ({n_files} archivos)")
+    for w in warnings:
+        print(f"    Warning: {w}")
+    if not stats['rows']:
+        print(f"    No se encontraron datos válidos para {year_month}")
+        return
+    file_size_mb = os.path.getsize(output_file) / (1024 * 1024)
+    print(f"    ✓ Guardado: {stats['rows']:,} registros en {output_file} ({file_size_mb:.2f} MB)")
+    print(f"    Rango temporal: {stats['dt_min']} - {stats['dt_max']}")
+    print(f"    H3 cells únicos: {stats['cells']:,}")
+
 
 # --- PROCESO PRINCIPAL ---
-def process_csv_to_partitioned_parquet():
+def process_csv_to_partitioned_parquet(workers=WORKERS, streaming=STREAMING, force=False, use_hash=USE_HASH,
+                                       build_aggregates=BUILD_AGGREGATES):
     """
     Lee CSVs organizados por año y genera Parquet particionados por año/mes.
     Estructura de salida: parquet/year=YYYY/month=MM/data.parquet
 
     Ventajas:
-    - Procesa en batches para no saturar memoria
+    - Incremental: solo reconvierte los meses cuyas entradas cambiaron (force=True reconvierte todo)
+    - Escritura atómica: un lector nunca ve una partición a medias
+    - Modo streaming: memoria acotada por worker, independiente del tamaño del mes
+    - Meses en paralelo (workers procesos)
     - Particionado eficiente para queries temporales
     - Compatible con DuckDB, Polars, Arrow, etc.
+    - Agregados por celda (diarios, mensuales, perfiles) refrescados solo para los meses convertidos
     """
 
     if not os.path.isdir(input_folder):
@@ -42,102 +278,67 @@ def process_csv_to_partitioned_parquet():
         return
 
     print(f"Años encontrados: {', '.join(year_folders)}")
-    print(f"Procesando datos y generando particiones en {output_folder}\n")
-
-    # Procesar cada año
+    print(f"Procesando datos y generando particiones en {output_folder}")
+    print(f"Modo: {'streaming' if streaming else 'en memoria'}, workers={workers}, orden={PARQUET_OPTIONS.sort}\n")
+
+    # Tareas: un mes por tarea, salvo los que el manifiesto da por actualizados
+    manifest = PartitionManifest(output_folder)
+    settings = parquet_settings(PARQUET_OPTIONS, h3_uint64=H3_UINT64)
+    # La H24 del 31/12 está en la carpeta de un año y en la partición de enero del siguiente
+    monthly_files = defaultdict(list)
     for year in year_folders:
-        year_path = os.path.join(input_folder, year)
-        print(f"\n{'='*60}")
-        print(f"Procesando año {year}...")
-        print(f"{'='*60}")
-
-        # Agrupar archivos CSV por mes
-        monthly_files = defaultdict(list)
-
-        for filename in os.listdir(year_path):
-            if filename.endswith('.csv') and 'points_' in filename:
-                # Extraer fecha del nombre: points_YYYYMMDD_HH_res9.csv
+        for year_month, csv_files in list_monthly_files(os.path.join(input_folder, year)).items():
+            monthly_files[year_month].extend(csv_files)
+    tasks = []
+    skipped = 0
+    for year_month, csv_files in sorted(monthly_files.items()):
+        csv_files = sorted(csv_files, key=csv_hour_key)
+        year_part, month_part = year_month.split('-')
+        key = manifest.key(year_part, month_part)
+        inputs = manifest.fingerprint_inputs(key, csv_files, use_hash)
+        if not force and manifest.is_current(key, inputs, settings):
+            skipped += 1
+            continue
+        output_file = os.path.join(output_folder, f"year={year_part}", f"month={month_part}", "data.parquet")
+        tasks.append((year_month, csv_files, output_file, key, inputs))
+
+    print(f"Meses a convertir: {len(tasks)} (sin cambios: {skipped})")
+    converted = []
+
+    def finish(task, stats, warnings):
+        year_month, csv_files, output_file, key, inputs = task
+        report_month(year_month, len(csv_files), output_file, stats, warnings)
+        if stats['rows']:
+            manifest.record(key, inputs, settings, output_file, rows=stats['rows'])
+            converted.append(tuple(int(p) for p in year_month.split('-')))
+        else:
+            manifest.forget(key)
+        # Guardar tras cada mes: si el proceso se corta, lo ya convertido no se repite
+        manifest.save()
+
+    task_args = dict(streaming=streaming, h3_uint64=H3_UINT64, options=PARQUET_OPTIONS, max_rows=MAX_ROWS_IN_MEMORY)
+    if workers <= 1:
+        for task in tasks:
+            year_month, csv_files, output_file = task[:3]
+            _, stats, warnings = convert_month(year_month, csv_files, output_file, **task_args)
+            finish(task, stats, warnings)
+    elif tasks:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futures = {ex.submit(convert_month, *task[:3], **task_args): task for task in tasks}
+            for fut in as_completed(futures):
+                task = futures[fut]
                 try:
-                    parts = filename.split('_')
-                    date_str = parts[1]  # YYYYMMDD
-                    year_from_file = date_str[:4]
-                    month = date_str[4:6]
-
-                    file_path = os.path.join(year_path, filename)
-                    monthly_files[f"{year_from_file}-{month}"].append(file_path)
+                    _, stats, warnings = fut.result()
                 except Exception as e:
-                    print(f"Warning: No se pudo procesar el nombre del archivo {filename}: {e}")
+                    print(f"\n  {task[0]}: ERROR {e}")
+                    manifest.forget(task[3])
+                    manifest.save()
                     continue
+                finish(task, stats, warnings)
 
-        # Procesar cada mes
-        for year_month, csv_files in sorted(monthly_files.items()):
-            year_part, month_part = year_month.split('-')
-
-            print(f"\n  Procesando {year_month} ({len(csv_files)} archivos)...")
-
-            # Leer todos los CSVs del mes en batches
-            month_dfs = []
-            for i, csv_file in enumerate(csv_files, 1):
-                try:
-                    df = pd.read_csv(csv_file)
-
-                    # Validar estructura
-                    if 'h3_index' not in df.columns or 'datetime' not in df.columns or 'value' not in df.columns:
-                        print(f"    Warning: Archivo {os.path.basename(csv_file)} no tiene las columnas esperadas. Saltando...")
-                        continue
-
-                    # Corregir formato de hora 24 (debería ser 00 del día siguiente)
-                    # Reemplazar hora 24 con 00 antes de parsear
-                    df['datetime'] = df['datetime'].str.replace(' 24:', ' 00:', regex=False)
-
-                    # Convertir datetime a tipo datetime
-                    df['datetime'] = pd.to_datetime(df['datetime'])
-
-                    # Añadir columnas de partición
-                    df['year'] = df['datetime'].dt.year
-                    df['month'] = df['datetime'].dt.month
-
-                    month_dfs.append(df)
-
-                    if i % 100 == 0:
-                        print(f"    Procesados {i}/{len(csv_files)} archivos...")
-
-                except Exception as e:
-                    print(f"    Error al leer {os.path.basename(csv_file)}: {e}")
-                    continue
-
-            if not month_dfs:
-                print(f"    No se encontraron datos válidos para {year_month}")
-                continue
-
-            # Concatenar todos los DataFrames del mes
-            print(f"    Concatenando {len(month_dfs)} DataFrames...")
-            month_combined = pd.concat(month_dfs, ignore_index=True)
-
-            # Crear directorio de partición
-            partition_path = os.path.join(output_folder, f"year={year_part}", f"month={month_part}")
-            os.makedirs(partition_path, exist_ok=True)
-
-            # Guardar como Parquet con compresión
-            output_file = os.path.join(partition_path, "data.parquet")
-
-            print(f"    Guardando {len(month_combined):,} registros en {output_file}...")
-            month_combined.to_parquet(
-                output_file,
-                engine='pyarrow',
-                compression='snappy',
-                index=False
-            )
-
-            # Mostrar estadísticas
-            file_size_mb = os.path.getsize(output_file) / (1024 * 1024)
-            print(f"    ✓ Guardado: {len(month_combined):,} registros ({file_size_mb:.2f} MB)")
-            print(f"    Rango temporal: {month_combined['datetime'].min()} - {month_combined['datetime'].max()}")
-            print(f"    H3 cells únicos: {month_combined['h3_index'].nunique():,}")
-
-            # Liberar memoria
-            del month_combined
-            del month_dfs
+    if build_aggregates and converted:
+        print(f"\nRecalculando agregados en {aggregate_root(output_folder)} ...")
+        refresh_aggregates(output_folder, months=converted)
 
     print(f"\n{'='*60}")
     print("¡Proceso completado con éxito!")
@@ -159,4 +360,16 @@ def process_csv_to_partitioned_parquet():
 
 # Run the script
 if __name__ == "__main__":
-    process_csv_to_partitioned_parquet()
+    parser = argparse.ArgumentParser(description="CSV horarios -> Parquet particionado year=/month=")
+    parser.add_argument("--input", default=input_folder, help=f"Carpeta con los CSV por año (defecto={input_folder})")
+    parser.add_argument("--output", default=output_folder, help=f"Raíz del árbol Parquet (defecto={output_folder})")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"Meses en paralelo (defecto={WORKERS})")
+    parser.add_argument("--in-memory", action="store_true", help="Modo anterior: todo el mes en pandas")
+    parser.add_argument("--force", action="store_true", help="Reconvierte todos los meses aunque el manifiesto no vea cambios")
+    parser.add_argument("--hash", action="store_true", default=USE_HASH, help="Compara también el SHA-1 de cada CSV")
+    parser.add_argument("--no-aggregates", action="store_true", help="No recalcula los agregados de <output>_agg")
+    args = parser.parse_args()
+    input_folder, output_folder = args.input, args.output
+    process_csv_to_partitioned_parquet(workers=args.workers, streaming=not args.in_memory,
+                                       force=args.force, use_hash=args.hash,
+                                       build_aggregates=BUILD_AGGREGATES and not args.no_aggregates)
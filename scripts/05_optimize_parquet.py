@@ -0,0 +1,99 @@
+"""
+Reescribe un árbol Parquet particionado (year=YYYY/month=MM) con la etapa de escritura común
+(functions_parquet.ParquetWriteOptions): un fichero por partición, ordenado por (h3_index, datetime)
+o (datetime, h3_index), con row groups del tamaño indicado, diccionario/ZSTD y bloom filter
+opcional sobre h3_index.
+
+Con los ficheros ordenados, las estadísticas min/max de cada row group permiten a DuckDB saltarse
+casi todo el fichero en consultas de una celda (06_query_parquet_example.py, 11_benchmarking_parquet.py).
+
+Uso:
+    # Árbol nuevo, ordenado por celda y con bloom filter
+    python scripts/05_optimize_parquet.py --input /Volumes/MV/carto/madno2Parquet \
+        --output /Volumes/MV/carto/madno2ParquetSorted --parquet-sort cell --parquet-bloom-filter
+
+    # En el sitio (cada partición se reemplaza por data.parquet de forma atómica), pasando h3_index a uint64
+    python scripts/05_optimize_parquet.py --input /Volumes/MV/carto/madno2Parquet --in-place --h3-uint64
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from functions_h3index import h3_to_uint64
+from functions_parquet import add_parquet_arguments, iter_partitions, parquet_options_from_args
+
+
+def read_partition(files, h3_uint64=False):
+    """Lee y concatena los ficheros de una partición (sin inferir columnas hive).
+
+    Con h3_uint64 cada fichero se convierte antes de concatenar, así que también unifica
+    particiones que mezclan h3_index texto y uint64.
+    """
+    tables = [pq.read_table(f, partitioning=None) for f in files]
+    if h3_uint64:
+        for i, table in enumerate(tables):
+            if pa.types.is_string(table.schema.field("h3_index").type):
+                idx = table.schema.get_field_index("h3_index")
+                tables[i] = table.set_column(idx, "h3_index",
+                                             pa.array(h3_to_uint64(table["h3_index"].to_pylist()), type=pa.uint64()))
+    return pa.concat_tables(tables, promote_options="default") if len(tables) > 1 else tables[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reescribe un árbol Parquet year=/month= ordenado y con row groups ajustados")
+    parser.add_argument("--input", required=True, help="Raíz del árbol Parquet de entrada")
+    parser.add_argument("--output", default="", help="Raíz del árbol de salida (obligatoria salvo con --in-place)")
+    parser.add_argument("--in-place", action="store_true", help="Reemplaza cada partición por un único data.parquet")
+    parser.add_argument("--h3-uint64", action="store_true", help="Convierte h3_index de texto hex a uint64")
+    add_parquet_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.in_place and not args.output:
+        parser.error("Indica --output o --in-place")
+    if not os.path.isdir(args.input):
+        print(f"Error: La carpeta de entrada '{args.input}' no existe.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        options = parquet_options_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    out_root = args.input if args.in_place else args.output
+    print(f"Reescribiendo {args.input} -> {out_root} (orden={options.sort}, row_group_size={options.row_group_size}, "
+          f"compresión={options.compression}, bloom={options.bloom_filter})")
+
+    total_in, total_out, total_rows = 0, 0, 0
+    for year, month, month_dir in iter_partitions(args.input):
+        files = sorted(glob.glob(os.path.join(month_dir, "*.parquet")))
+        if not files:
+            continue
+        t0 = time.time()
+        size_in = sum(os.path.getsize(f) for f in files)
+        table = read_partition(files, args.h3_uint64)
+
+        out_file = os.path.join(out_root, f"year={year}", f"month={month}", "data.parquet")
+        rows = options.write(table, out_file)
+        if args.in_place:
+            # El nuevo data.parquet ya está en su sitio: borrar el resto de ficheros de la partición
+            for f in files:
+                if os.path.abspath(f) != os.path.abspath(out_file):
+                    os.remove(f)
+
+        size_out = os.path.getsize(out_file)
+        n_groups = pq.ParquetFile(out_file).metadata.num_row_groups
+        print(f"  year={year}/month={month}: {len(files)} fichero(s), {rows:,} filas, {n_groups} row groups, "
+              f"{size_in / 1024**2:.1f} MB -> {size_out / 1024**2:.1f} MB ({time.time() - t0:.1f} s)")
+        total_in += size_in
+        total_out += size_out
+        total_rows += rows
+
+    print(f"\nTotal: {total_rows:,} filas, {total_in / 1024**2:.1f} MB -> {total_out / 1024**2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
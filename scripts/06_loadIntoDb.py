@@ -1,8 +1,44 @@
 #!/usr/bin/env python3
+"""
+Carga los puntos H3 (h3_index, datetime, value) en PostgreSQL: CSV horarios o árbol Parquet
+year=/month=, directamente o a través de un túnel SSH.
+
+Por defecto cada mes de CSV (o cada partición Parquet) es un lote: un COPY a una tabla de
+staging UNLOGGED y un merge con ON CONFLICT, repartidos entre --workers conexiones de un pool.
+--per-file conserva el modo antiguo (una transacción por CSV). Ver functions_pgload.py.
+
+Con --format parquet las particiones se leen con pyarrow y se envían en COPY binario, sin pasar
+por CSV: basta con el árbol de 05_from_csv_to_geoparquet.py para cargar la base de datos.
+
+Cada lote confirmado queda registrado en {schema}.load_checkpoint junto con sus filas: si la
+carga se interrumpe, al relanzar el mismo comando se saltan los lotes ya cargados (y se
+recargan los que tengan ficheros modificados). Al final se imprime el ritmo en filas/s y MB/s.
+
+Tras la carga se refrescan los rollups de los meses cargados ({table}_cell_daily,
+{table}_cell_monthly y {table}_city_hourly, ver functions_rollups.py); --no-rollups lo omite y
+--rebuild-rollups los recalcula para todos los meses de la tabla.
+
+06_loadIntoDb_tunnel.py y 06_loadIntoDb_tunnel_one_year.py se mantienen como alias de este script.
+
+Uso:
+    # Directo (db.geoso2.es escucha en 443)
+    python3 scripts/06_loadIntoDb.py --input /Volumes/MV/carto/madno/2024 --host db.geoso2.es
+
+    # Por túnel SSH, varios años, 4 conexiones
+    python3 scripts/06_loadIntoDb.py \\
+        --use-ssh-tunnel --ssh-host 138.100.127.190 --ssh-port 22 --ssh-user upm --ssh-password '...' \\
+        --remote-pg-host 127.0.0.1 --remote-pg-port 5432 \\
+        --dbname gis --user gis --password '...' \\
+        --input /Volumes/MV/carto/madno --years 2001,2002,2003 --workers 4
+
+    # Árbol Parquet, carga inicial en tabla nueva particionada por año con índice BRIN
+    python3 scripts/06_loadIntoDb.py ... --input /Volumes/MV/carto/madno2Parquet --format parquet \\
+        --initial-load --partition-by year --dt-index brin
+"""
+import argparse
 import os
 import sys
-import glob
-import argparse
+import time
 from contextlib import contextmanager
 
 try:
@@ -10,146 +46,249 @@ try:
 except Exception:
     tqdm = lambda x, **k: x  # fallback si no está instalado
 
-import psycopg2
+from functions_h3index import H3_STORAGE_MODES
+from functions_pgload import (DT_INDEX_METHODS, PARTITION_LAYOUTS, build_indexes, bulk_load, checkpoint_modes,
+                              committed_batches, csv_batches, drop_indexes, ensure_checkpoint_table,
+                              ensure_partitions, ensure_schema_and_table, file_batches, has_primary_key,
+                              iter_csv_paths, make_pool,
+                              open_system_ssh_tunnel, parquet_batches, pending_batches, pooled_conn,
+                              reset_checkpoints, throughput_report)
+from functions_rollups import affected_months, ensure_rollup_tables, refresh_rollups, table_months
 
 
-DDL_SCHEMA_AND_TABLE = """
-CREATE SCHEMA IF NOT EXISTS {schema};
-
-CREATE TABLE IF NOT EXISTS {schema}.{table} (
-  h3_index TEXT NOT NULL,
-  dt       TIMESTAMP WITHOUT TIME ZONE NOT NULL,
-  value    DOUBLE PRECISION NOT NULL,
-  PRIMARY KEY (h3_index, dt)
-);
+def parse_years(value):
+    """'2001,2002,2005' -> [2001, 2002, 2005]."""
+    try:
+        years = [int(y.strip()) for y in value.split(',') if y.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError("--years debe contener enteros separados por coma, p.ej.: 2001,2002,2005")
+    if not years:
+        raise argparse.ArgumentTypeError("No se proporcionó ningún año válido en --years")
+    return years
 
-CREATE INDEX IF NOT EXISTS {table}_dt_idx ON {schema}.{table} (dt);
-"""
 
-# Nota: los CSV deben tener cabecera con columnas: h3_index, datetime, value
-#       Si tus CSV usan otro nombre (p.ej. 'timestamp'), ajusta el COPY y el INSERT.
+def collect_batches(args):
+    """Lotes a cargar: particiones Parquet, meses de CSV o (con --per-file) un CSV por lote."""
+    if args.format == "parquet":
+        return parquet_batches(args.input, args.years)
+    if args.years:
+        files = []
+        for year in args.years:
+            year_dir = os.path.join(args.input, str(year))
+            if os.path.isdir(year_dir):
+                files.extend(iter_csv_paths(year_dir, args.glob_pattern))
+            else:
+                print(f"[WARN] No se encontraron CSV para el año {year} en {year_dir}", file=sys.stderr)
+    else:
+        files = list(iter_csv_paths(args.input, args.glob_pattern))
+    return file_batches(files) if args.per_file else csv_batches(files)
 
 
 @contextmanager
-def get_conn(host, dbname, user, password, port=None):
-    # if port is None:
-    #     conn = psycopg2.connect(host=host, dbname=dbname, user=user, password=password)
-    # else:
-    #     conn = psycopg2.connect(host=host, dbname=dbname, user=user, password=password, port=port)
-    conn = psycopg2.connect(host=host, dbname=dbname, user=user, password=password, port=443)
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-
-def ensure_schema_and_table(cur, schema: str, table: str):
-    cur.execute(DDL_SCHEMA_AND_TABLE.format(schema=schema, table=table))
-
-
-def copy_into_temp(cur, csv_path: str):
-    """
-    Crea una tabla temporal 'tmp_h3_points' y hace COPY del CSV.
-    Columnas esperadas en CSV: h3_index, datetime, value
-    """
-    cur.execute("""
-        DROP TABLE IF EXISTS tmp_h3_points;
-        CREATE TEMP TABLE tmp_h3_points(
-          h3_index TEXT,
-          datetime TIMESTAMP,
-          value DOUBLE PRECISION
-        ) ON COMMIT DROP;
-    """)
-    with open(csv_path, "r", encoding="utf-8") as f:
-        cur.copy_expert(
-            "COPY tmp_h3_points (h3_index, datetime, value) FROM STDIN CSV HEADER",
-            f
-        )
-
-
-def upsert_from_temp(cur, schema: str, table: str):
-    cur.execute(f"""
-        INSERT INTO {schema}.{table} AS t (h3_index, dt, value)
-        SELECT h3_index, datetime, value
-        FROM tmp_h3_points
-        ON CONFLICT (h3_index, dt) DO UPDATE
-        SET value = EXCLUDED.value;
-    """)
-
-
-def iter_csv_paths(input_path: str, glob_pattern: str | None):
-    if glob_pattern:
-        for p in sorted(glob.glob(glob_pattern)):
-            if os.path.isfile(p):
-                yield p
+def database_endpoint(args):
+    """(host, port) de PostgreSQL: el remoto o el extremo local del túnel SSH."""
+    if not args.use_ssh_tunnel:
+        yield args.host, args.port
         return
-    if os.path.isdir(input_path):
-        for p in sorted(glob.glob(os.path.join(input_path, "*.csv"))):
-            if os.path.isfile(p):
-                yield p
-    elif os.path.isfile(input_path):
-        yield input_path
-    else:
-        raise FileNotFoundError(f"No existe la ruta: {input_path}")
+    print(f"Estableciendo túnel SSH a {args.ssh_user}@{args.ssh_host}:{args.ssh_port} -> "
+          f"{args.remote_pg_host}:{args.remote_pg_port} ...")
+    with open_system_ssh_tunnel(args.ssh_host, args.ssh_port, args.ssh_user, args.ssh_password,
+                                args.remote_pg_host, args.remote_pg_port) as endpoint:
+        yield endpoint
+
+
+def prepare_target(pool, args, batches, mode):
+    """Crea tabla/particiones/checkpoints y devuelve los lotes pendientes (sin los ya confirmados)."""
+    target = f"{args.schema}.{args.table}"
+    with pooled_conn(pool) as conn:
+        with conn.cursor() as cur:
+            ensure_schema_and_table(cur, args.schema, args.table, args.h3_mode, args.partition_by, args.dt_index)
+            if args.partition_by != "none":
+                ensure_partitions(cur, args.schema, args.table, args.partition_by, batches)
+            ensure_checkpoint_table(cur, args.schema)
+
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {target})")
+            has_rows = cur.fetchone()[0]
+            if args.reset_checkpoints or not has_rows:
+                # Tabla vacía: ningún checkpoint anterior sigue siendo válido
+                reset_checkpoints(cur, args.schema, target)
+            committed = committed_batches(cur, args.schema, target)
+            pending = pending_batches(batches, committed)
+
+            if mode == "initial":
+                # Solo se continúa una carga inicial a medias: checkpoints todos de modo initial y sin PK
+                unfinished = (committed and checkpoint_modes(cur, args.schema, target) == {"initial"}
+                              and not has_primary_key(cur, args.schema, args.table))
+                if has_rows and not unfinished:
+                    print(f"--initial-load requiere {target} vacía (o una carga inicial a medias); "
+                          f"usa el modo upsert para cargas incrementales.", file=sys.stderr)
+                    sys.exit(1)
+                # Sin ON CONFLICT un lote ya cargado y luego modificado se duplicaría: se omite y queda
+                # pendiente (su checkpoint no coincide) para la siguiente carga en modo upsert
+                changed = sorted(b.label for b in pending if b.key in committed)
+                if changed:
+                    print(f"[WARN] --initial-load omite {len(changed)} lotes ya cargados que han cambiado desde "
+                          f"su checkpoint ({', '.join(changed)}); recárgalos en modo upsert al terminar.",
+                          file=sys.stderr)
+                    pending = [b for b in pending if b.key not in committed]
+                if pending:
+                    # Sin PK ni índice durante la carga: se construyen una vez al final
+                    drop_indexes(cur, args.schema, args.table)
+        conn.commit()
+    return pending
 
 
-def main():
+def run_load(pool, args):
+    try:
+        batches = collect_batches(args)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not batches:
+        print("No se encontraron ficheros para cargar.", file=sys.stderr)
+        sys.exit(1)
+    mode = "initial" if args.initial_load else "upsert"
+
+    pending = prepare_target(pool, args, batches, mode)
+    skipped = len(batches) - len(pending)
+    unit = "ficheros" if args.per_file else "lotes"
+    total_mb = sum(b.nbytes for b in pending) / 1024**2
+    print(f"Carga ({mode}) en {args.schema}.{args.table}: {len(pending)} {unit} pendientes "
+          f"({args.format}, {total_mb:.1f} MB), {skipped} ya cargados, {args.workers} conexiones")
+
+    t0 = time.time()
+    results = []
+    if pending:
+        progress = tqdm(range(len(pending)), total=len(pending), desc="Importando")
+
+        def on_done(result):
+            if result["error"]:
+                print(f"[FAIL] {result['label']}: {result['error']}", file=sys.stderr)
+            if hasattr(progress, "update"):
+                progress.update(1)
+
+        results = bulk_load(pool, pending, args.schema, args.table, args.h3_mode, args.workers, on_done, mode)
+        if hasattr(progress, "close"):
+            progress.close()
+    print(throughput_report(results, time.time() - t0, skipped))
+
+    if mode == "initial":
+        # Los lotes fallidos no dejan filas (cada uno es una transacción): se pueden recargar
+        # después en modo upsert una vez creada la PK. Sin lotes pendientes los índices solo se
+        # crean si faltan (una carga inicial anterior que se cortó antes de crearlos)
+        with pooled_conn(pool) as conn:
+            with conn.cursor() as cur:
+                if not has_primary_key(cur, args.schema, args.table):
+                    print(f"Creando PRIMARY KEY (h3_index, dt) e índice {args.dt_index} por dt ...")
+                    t1 = time.time()
+                    build_indexes(cur, args.schema, args.table, args.dt_index, args.maintenance_work_mem)
+                    print(f"Índices creados en {time.time() - t1:.1f} s. Total {time.time() - t0:.1f} s")
+            conn.commit()
+
+    if not args.no_rollups:
+        loaded = {r["label"] for r in results if not r["error"]}
+        update_rollups(pool, args, [b for b in pending if b.label in loaded])
+
+    if any(r["error"] for r in results):
+        sys.exit(1)
+
+
+def update_rollups(pool, args, loaded):
+    """Refresca los rollups de los meses de los lotes cargados (o de toda la tabla con --rebuild-rollups)."""
+    with pooled_conn(pool) as conn:
+        with conn.cursor() as cur:
+            ensure_rollup_tables(cur, args.schema, args.table, args.h3_mode)
+            months = table_months(cur, args.schema, args.table) if args.rebuild_rollups else affected_months(loaded)
+        conn.commit()
+        if not months:
+            return
+        print(f"Refrescando rollups de {args.schema}.{args.table} ({len(months)} meses) ...")
+        progress = tqdm(range(len(months)), total=len(months), desc="Rollups")
+
+        def on_month(year, month, seconds):
+            if hasattr(progress, "update"):
+                progress.update(1)
+
+        elapsed = refresh_rollups(conn, args.schema, args.table, months, on_month=on_month)
+        if hasattr(progress, "close"):
+            progress.close()
+    print(f"Rollups refrescados en {elapsed:.1f} s")
+
+
+def build_parser():
     parser = argparse.ArgumentParser(
-        description="Carga CSV (h3_index,datetime,value) a Postgres mediante COPY + UPSERT."
+        description="Carga CSV/Parquet (h3_index,datetime,value) a Postgres mediante COPY por lotes + UPSERT."
     )
     # Conexión
     parser.add_argument("--host", default="db.geoso2.es")
+    parser.add_argument("--port", type=int, default=443, help="Puerto de Postgres si no se usa túnel (defecto=443)")
     parser.add_argument("--dbname", default="gis")
     parser.add_argument("--user", default="gis")
     parser.add_argument("--password", default="hjJ7_hj76HHjdftGg")
 
+    # Túnel SSH (opcional)
+    parser.add_argument("--use-ssh-tunnel", action="store_true", help="Habilita el túnel SSH")
+    parser.add_argument("--ssh-host", default="92.168.1.200")
+    parser.add_argument("--ssh-port", type=int, default=443)
+    parser.add_argument("--ssh-user", default="upm")
+    parser.add_argument("--ssh-password", default=None)
+    parser.add_argument("--remote-pg-host", default="127.0.0.1")
+    parser.add_argument("--remote-pg-port", type=int, default=5432)
+
     # Destino
     parser.add_argument("--schema", default="madno")
     parser.add_argument("--table", default="h3_points")
+    parser.add_argument("--h3-mode", choices=H3_STORAGE_MODES, default="text",
+                        help="Tipo de h3_index en la tabla: text (TEXT) o uint64 (BIGINT). Defecto=text")
+    parser.add_argument("--partition-by", choices=PARTITION_LAYOUTS, default="none",
+                        help="Tabla particionada por rango de dt (una partición por año o mes). Defecto=none")
+    parser.add_argument("--dt-index", choices=DT_INDEX_METHODS, default="btree",
+                        help="Tipo del índice por dt: btree o brin (datos cargados en orden temporal). Defecto=btree")
 
     # Entrada
-    parser.add_argument("--input",default="/Volumes/MV/carto/madno/2024",
-                        help="Carpeta con CSV, un CSV concreto, o base path. Si usas --glob, este argumento puede ser la carpeta base.")
+    parser.add_argument("--input", default="/Volumes/MV/carto/madno/2024",
+                        help="Carpeta con CSV, un CSV concreto, base de las carpetas de --years o raíz Parquet")
     parser.add_argument("--glob", dest="glob_pattern", default=None,
                         help="Patrón glob (ej: '/ruta/points_2024*.csv'). Si se usa, tiene prioridad.")
+    parser.add_argument("--years", type=parse_years, default=None,
+                        help="Años separados por coma; CSV en subcarpetas de --input con el nombre del año, "
+                             "o particiones year= del árbol Parquet (e.g., 2001,2002,2005)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="CSV horarios o árbol Parquet year=/month= en --input (defecto=csv)")
 
-    args = parser.parse_args()
-
-    with get_conn(args.host, args.dbname, args.user, args.password, getattr(args, "port", None)) as conn:
-        conn.autocommit = False
-        with conn.cursor() as cur:
-            # Crear esquema/tabla si no existen
-            ensure_schema_and_table(cur, args.schema, args.table)
-            conn.commit()
-
-        # Procesar ficheros
-        files = list(iter_csv_paths(args.input, args.glob_pattern))
-        if not files:
-            print("No se encontraron CSV para cargar.", file=sys.stderr)
-            sys.exit(1)
+    # Carga
+    parser.add_argument("--workers", type=int, default=4, help="Conexiones en paralelo (defecto=4)")
+    parser.add_argument("--per-file", action="store_true",
+                        help="Un lote (transacción) por CSV en lugar de uno por mes")
+    parser.add_argument("--initial-load", action="store_true",
+                        help="Carga inicial: tabla vacía, COPY sin ON CONFLICT y PK/índices creados al final")
+    parser.add_argument("--maintenance-work-mem", default="1GB",
+                        help="maintenance_work_mem de la sesión que crea los índices en --initial-load (defecto=1GB)")
+    parser.add_argument("--reset-checkpoints", action="store_true",
+                        help="Olvida los lotes confirmados de esta tabla y vuelve a cargarlo todo")
+    parser.add_argument("--no-rollups", action="store_true",
+                        help="No refresca las tablas de rollup (diario/mensual por celda, horario de la ciudad)")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="Recalcula los rollups de todos los meses de la tabla, no solo de los cargados")
+    # Compatibilidad con 06_loadIntoDb_tunnel.py --bulk (la carga por lotes es ahora el modo por defecto)
+    parser.add_argument("--bulk", action="store_true", help=argparse.SUPPRESS)
+    return parser
 
-        print(f"Cargando {len(files)} ficheros en {args.schema}.{args.table} ...")
-        ok, fail = 0, 0
 
-        for csv_path in tqdm(files, desc="Importando"):
-            try:
-                with conn.cursor() as cur:
-                    copy_into_temp(cur, csv_path)
-                    upsert_from_temp(cur, args.schema, args.table)
-                conn.commit()  # una transacción por fichero
-                ok += 1
-            except Exception as e:
-                conn.rollback()
-                fail += 1
-                print(f"[FAIL] {csv_path}: {e}", file=sys.stderr)
+def main(argv=None, **defaults):
+    parser = build_parser()
+    parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+    if args.per_file and args.format == "parquet":
+        parser.error("--per-file solo aplica a CSV")
 
-        print(f"Terminado. OK={ok}, FAIL={fail}")
+    with database_endpoint(args) as (host, port):
+        pool = make_pool(host, port, args.dbname, args.user, args.password, size=args.workers + 1)
+        try:
+            run_load(pool, args)
+        finally:
+            pool.closeall()
 
 
 if __name__ == "__main__":
     main()
-
-
-    '''
-    python3 scripts/06_loadIntoDb.py --input /Volumes/MV/carto/madno/2024 --host db.geoso2.es
-    '''
\ No newline at end of file
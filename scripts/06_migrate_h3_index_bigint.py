@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Migra madno.h3_points de h3_index TEXT a BIGINT (y vuelta con --to-text).
+
+La conversión se hace en una sola sentencia ALTER TABLE ... USING, que reescribe la tabla y
+reconstruye la PRIMARY KEY (h3_index, dt) y el índice por dt dentro de la misma transacción.
+Bloquea la tabla (ACCESS EXCLUSIVE) mientras dura y necesita espacio libre para una copia
+completa: lanzarlo en una ventana sin cargas ni benchmarks.
+
+Antes de migrar comprueba que todos los h3_index son hex válidos (15-16 caracteres). Con
+--hex-view crea además la vista {table}_hex (h3_index en texto) para consultas antiguas.
+
+Uso:
+    python3 scripts/06_migrate_h3_index_bigint.py --host db.geoso2.es --port 443 --dry-run
+    python3 scripts/06_migrate_h3_index_bigint.py --host db.geoso2.es --port 443 --hex-view
+
+Después, cargar con --h3-mode uint64 en 06_loadIntoDb*.py.
+"""
+import argparse
+import sys
+import time
+
+import psycopg2
+
+from functions_h3index import pg_h3_to_bigint, pg_h3_to_text
+
+
+def column_type(cur, schema: str, table: str) -> str | None:
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s AND column_name = 'h3_index'
+    """, (schema, table))
+    row = cur.fetchone()
+    return row[0].lower() if row else None
+
+
+def migration_sql(schema: str, table: str, to_text: bool = False) -> str:
+    if to_text:
+        return (f"ALTER TABLE {schema}.{table} "
+                f"ALTER COLUMN h3_index TYPE TEXT USING {pg_h3_to_text('h3_index')};")
+    return (f"ALTER TABLE {schema}.{table} "
+            f"ALTER COLUMN h3_index TYPE BIGINT USING {pg_h3_to_bigint('h3_index')};")
+
+
+def hex_view_sql(schema: str, table: str) -> str:
+    return (f"CREATE OR REPLACE VIEW {schema}.{table}_hex AS "
+            f"SELECT {pg_h3_to_text('h3_index')} AS h3_index, dt, value FROM {schema}.{table};")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra h3_index de TEXT a BIGINT en la tabla de puntos H3.")
+    parser.add_argument("--host", default="db.geoso2.es")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--dbname", default="gis")
+    parser.add_argument("--user", default="gis")
+    parser.add_argument("--password", default="hjJ7_hj76HHjdftGg")
+    parser.add_argument("--schema", default="madno")
+    parser.add_argument("--table", default="h3_points")
+    parser.add_argument("--to-text", action="store_true", help="Deshace la migración (BIGINT -> TEXT)")
+    parser.add_argument("--hex-view", action="store_true", help="Crea la vista {table}_hex con h3_index en texto")
+    parser.add_argument("--dry-run", action="store_true", help="Solo muestra el SQL que se ejecutaría")
+    args = parser.parse_args()
+
+    target = "text" if args.to_text else "bigint"
+    statements = [migration_sql(args.schema, args.table, args.to_text), f"ANALYZE {args.schema}.{args.table};"]
+    if args.to_text:
+        # La vista depende del tipo de la columna: hay que quitarla antes del ALTER
+        statements.insert(0, f"DROP VIEW IF EXISTS {args.schema}.{args.table}_hex;")
+    if args.hex_view and not args.to_text:
+        statements.append(hex_view_sql(args.schema, args.table))
+
+    if args.dry_run:
+        print("\n".join(statements))
+        return
+
+    conn = psycopg2.connect(host=args.host, dbname=args.dbname, user=args.user, password=args.password, port=args.port)
+    try:
+        conn.autocommit = False
+        with conn.cursor() as cur:
+            current = column_type(cur, args.schema, args.table)
+            if current is None:
+                print(f"No existe {args.schema}.{args.table}.h3_index", file=sys.stderr)
+                sys.exit(1)
+            if current == target:
+                print(f"{args.schema}.{args.table}.h3_index ya es {current.upper()}: nada que migrar.")
+                return
+
+            if not args.to_text:
+                cur.execute(f"""
+                    SELECT count(*) FROM {args.schema}.{args.table}
+                    WHERE h3_index !~ '^[0-9a-fA-F]{{15,16}}$'
+                """)
+                invalid = cur.fetchone()[0]
+                if invalid:
+                    print(f"ERROR: {invalid} filas con h3_index no hexadecimal; no se migra.", file=sys.stderr)
+                    sys.exit(1)
+
+            cur.execute("SELECT pg_total_relation_size(%s)", (f"{args.schema}.{args.table}",))
+            size_before = cur.fetchone()[0]
+
+            print(f"Migrando {args.schema}.{args.table}.h3_index {current.upper()} -> {target.upper()} ...")
+            t0 = time.time()
+            for sql in statements:
+                print(f"  {sql}")
+                cur.execute(sql)
+            conn.commit()
+
+            cur.execute("SELECT pg_total_relation_size(%s)", (f"{args.schema}.{args.table}",))
+            size_after = cur.fetchone()[0]
+        print(f"Terminado en {time.time() - t0:.1f} s. Tamaño tabla+índices: "
+              f"{size_before / 1024**2:.1f} MB -> {size_after / 1024**2:.1f} MB")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
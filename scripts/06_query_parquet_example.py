@@ -4,38 +4,57 @@ Script de ejemplo para consultar los archivos Parquet particionados.
 Este script demuestra cómo realizar queries eficientes sobre los datos
 particionados usando DuckDB, que es extremadamente rápido para este tipo de operaciones.
 
+Todas las consultas pasan por ParquetQueryService (functions_parquet_query.py): una sola
+conexión DuckDB para todos los ejemplos, el listado de ficheros de cada partición cacheado y los
+rangos de tiempo traducidos a la lista explícita de particiones year=/month= que los cubren (en
+lugar de read_parquet('**/*.parquet') + WHERE year/month). Las mismas funciones sirven para la API.
+
 Instalación requerida:
     pip install duckdb pandas
 
 Ventajas de este enfoque:
 - Queries SQL sobre archivos Parquet sin cargar todo en memoria
-- Filtrado automático por particiones (año/mes)
+- Solo se abren los ficheros de los meses del rango pedido
 - 10-100x más rápido que PostgreSQL para queries analíticas
 - No requiere servidor de base de datos
-"""
 
-import duckdb
-import pandas as pd
-from datetime import datetime
+Uso:
+    python3 scripts/06_query_parquet_example.py --parquet /Volumes/MV/carto/madno2Parquet
+"""
+import argparse
 import time
+from datetime import datetime
+
+from functions_parquet_query import ParquetQueryService
 
 # Ruta a los datos particionados
 PARQUET_PATH = '/Users/luisizquierdo/repos/upm/madno2/madno2-viewer/public/data/parquet'
 
-def execute_timed_query(conn, query, description):
+# h3_index guardado como uint64 (04 --format parquet, 05 con H3_UINT64) en lugar de texto hex;
+# None: se detecta en el esquema del primer fichero
+H3_UINT64 = None
+
+# Celda de ejemplo (texto hex; el servicio la convierte si el árbol guarda uint64)
+EXAMPLE_CELL = '89390ca0083ffff'
+
+# Diciembre de 2010
+DEC_2010 = (datetime(2010, 12, 1), datetime(2011, 1, 1))
+
+
+def execute_timed_query(query, description):
     """
-    Ejecuta una query y mide el tiempo de ejecución
+    Ejecuta una query (función sin argumentos que devuelve un DataFrame) y mide el tiempo de ejecución
     """
     print(f"\n⏱️  Ejecutando: {description}")
     start_time = time.time()
-    result = conn.execute(query).df()
+    result = query()
     end_time = time.time()
     elapsed_ms = (end_time - start_time) * 1000
 
     print(f"✓ Completado en: {elapsed_ms:.2f} ms ({elapsed_ms/1000:.3f} segundos)")
     return result, elapsed_ms
 
-def example_1_query_specific_cell_and_time():
+def example_1_query_specific_cell_and_time(service):
     """
     Ejemplo 1: Consultar datos de una celda H3 específica en un rango de tiempo
     Similar a tu query SQL original
@@ -44,32 +63,17 @@ def example_1_query_specific_cell_and_time():
     print("Ejemplo 1: Query específica por H3 y hora")
     print("="*60)
 
-    conn = duckdb.connect()
-
-    query = f"""
-    SELECT
-        h3_index,
-        datetime,
-        value,
-        year,
-        month
-    FROM read_parquet('{PARQUET_PATH}/**/*.parquet', hive_partitioning=true)
-    WHERE h3_index = '89390ca0083ffff'
-      AND EXTRACT(HOUR FROM datetime) = 15
-      AND year = 2010
-      AND month = 12
-    ORDER BY datetime
-    LIMIT 10
-    """
-
-    result, elapsed = execute_timed_query(conn, query, "Query específica por H3 y hora")
+    # La hora del día (15 h) no se puede empujar a las particiones: se filtra dentro de dic-2010
+    result, elapsed = execute_timed_query(
+        lambda: service.cell_series(EXAMPLE_CELL, *DEC_2010, hour=15).head(10),
+        "Query específica por H3 y hora")
     print(f"\nResultados encontrados: {len(result)}")
     print(result)
 
     return result, elapsed
 
 
-def example_2_aggregate_by_cell():
+def example_2_aggregate_by_cell(service):
     """
     Ejemplo 2: Calcular estadísticas agregadas por celda H3
     """
@@ -77,32 +81,15 @@ def example_2_aggregate_by_cell():
     print("Ejemplo 2: Estadísticas por celda H3")
     print("="*60)
 
-    conn = duckdb.connect()
-
-    query = f"""
-    SELECT
-        h3_index,
-        COUNT(*) as num_mediciones,
-        AVG(value) as no2_promedio,
-        MAX(value) as no2_maximo,
-        MIN(value) as no2_minimo,
-        STDDEV(value) as desviacion_std
-    FROM read_parquet('{PARQUET_PATH}/**/*.parquet', hive_partitioning=true)
-    WHERE year = 2010
-      AND month = 12
-    GROUP BY h3_index
-    ORDER BY no2_promedio DESC
-    LIMIT 10
-    """
-
-    result, elapsed = execute_timed_query(conn, query, "Estadísticas agregadas por celda")
+    result, elapsed = execute_timed_query(lambda: service.top_cells(*DEC_2010, n=10),
+                                          "Estadísticas agregadas por celda")
     print(f"\nTop 10 celdas con mayor NO2 promedio en dic-2010:")
     print(result)
 
     return result, elapsed
 
 
-def example_3_time_series_analysis():
+def example_3_time_series_analysis(service):
     """
     Ejemplo 3: Serie temporal para una celda específica
     """
@@ -110,35 +97,24 @@ def example_3_time_series_analysis():
     print("Ejemplo 3: Serie temporal de una celda")
     print("="*60)
 
-    conn = duckdb.connect()
-
-    query = f"""
-    SELECT
-        datetime,
-        value as no2_level,
-        EXTRACT(DOW FROM datetime) as dia_semana,
-        EXTRACT(HOUR FROM datetime) as hora
-    FROM read_parquet('{PARQUET_PATH}/**/*.parquet', hive_partitioning=true)
-    WHERE h3_index = '89390ca0083ffff'
-      AND year = 2010
-      AND month = 12
-    ORDER BY datetime
-    """
-
-    result, elapsed = execute_timed_query(conn, query, "Serie temporal de una celda")
+    result, elapsed = execute_timed_query(lambda: service.cell_series(EXAMPLE_CELL, *DEC_2010),
+                                          "Serie temporal de una celda")
+    result['dia_semana'] = result['datetime'].dt.dayofweek
+    result['hora'] = result['datetime'].dt.hour
     print(f"\nRegistros totales: {len(result)}")
     print(result.head(20))
 
     # Análisis básico
-    print(f"\nEstadísticas:")
-    print(f"  Promedio NO2: {result['no2_level'].mean():.2f}")
-    print(f"  Máximo NO2: {result['no2_level'].max():.2f}")
-    print(f"  Mínimo NO2: {result['no2_level'].min():.2f}")
+    if len(result):
+        print(f"\nEstadísticas:")
+        print(f"  Promedio NO2: {result['value'].mean():.2f}")
+        print(f"  Máximo NO2: {result['value'].max():.2f}")
+        print(f"  Mínimo NO2: {result['value'].min():.2f}")
 
     return result, elapsed
 
 
-def example_4_hourly_patterns():
+def example_4_hourly_patterns(service):
     """
     Ejemplo 4: Patrones por hora del día (promedio de todas las celdas)
     """
@@ -146,58 +122,44 @@ def example_4_hourly_patterns():
     print("Ejemplo 4: Patrón de NO2 por hora del día")
     print("="*60)
 
-    conn = duckdb.connect()
-
-    query = f"""
-    SELECT
-        EXTRACT(HOUR FROM datetime) as hora,
-        COUNT(*) as num_mediciones,
-        AVG(value) as no2_promedio,
-        MAX(value) as no2_maximo
-    FROM read_parquet('{PARQUET_PATH}/**/*.parquet', hive_partitioning=true)
-    WHERE year = 2010
-      AND month = 12
-    GROUP BY hora
-    ORDER BY hora
-    """
-
-    result, elapsed = execute_timed_query(conn, query, "Patrón horario de NO2")
+    result, elapsed = execute_timed_query(lambda: service.hourly_profile(*DEC_2010), "Patrón horario de NO2")
     print(f"\nPatrón horario de NO2 en diciembre 2010:")
     print(result)
 
     return result, elapsed
 
 
-def example_5_yearly_comparison():
+def example_5_yearly_comparison(service):
     """
     Ejemplo 5: Comparación año por año (todos los datos)
+    SQL libre con service.query: {src} son los ficheros del rango
     """
     print("\n" + "="*60)
     print("Ejemplo 5: Evolución anual del NO2")
     print("="*60)
 
-    conn = duckdb.connect()
-
-    query = f"""
+    query = """
     SELECT
-        year,
+        year(datetime) as year,
         COUNT(*) as total_mediciones,
         AVG(value) as no2_promedio,
         MAX(value) as no2_maximo,
         COUNT(DISTINCT h3_index) as num_celdas
-    FROM read_parquet('{PARQUET_PATH}/**/*.parquet', hive_partitioning=true)
+    FROM {src}
+    WHERE datetime >= ? AND datetime < ?
     GROUP BY year
     ORDER BY year
     """
 
-    result, elapsed = execute_timed_query(conn, query, "Evolución anual (todos los datos)")
+    result, elapsed = execute_timed_query(lambda: service.query(query, *service.time_span()),
+                                          "Evolución anual (todos los datos)")
     print(f"\nEvolución anual:")
     print(result)
 
     return result, elapsed
 
 
-def example_6_filter_by_partition():
+def example_6_filter_by_partition(service):
     """
     Ejemplo 6: Query eficiente usando filtrado por particiones
     Solo lee los archivos necesarios gracias al particionado
@@ -206,22 +168,22 @@ def example_6_filter_by_partition():
     print("Ejemplo 6: Query eficiente con particiones")
     print("="*60)
 
-    conn = duckdb.connect()
-
-    # Esta query solo lee 3 archivos (3 meses) en lugar de 120 (10 años x 12 meses)
-    query = f"""
+    # El rango oct-dic 2010 se traduce en los ficheros de esas tres particiones en lugar de listar
+    # y filtrar las 120 (10 años x 12 meses)
+    query = """
     SELECT
         h3_index,
         datetime,
         value
-    FROM read_parquet('{PARQUET_PATH}/**/*.parquet', hive_partitioning=true)
-    WHERE year = 2010
-      AND month IN (10, 11, 12)
+    FROM {src}
+    WHERE datetime >= ? AND datetime < ?
     ORDER BY datetime DESC
     LIMIT 100
     """
 
-    result, elapsed = execute_timed_query(conn, query, "Query con filtrado por particiones")
+    result, elapsed = execute_timed_query(
+        lambda: service.query(query, datetime(2010, 10, 1), datetime(2011, 1, 1)),
+        "Query con filtrado por particiones")
     print(f"\nÚltimos 100 registros de oct-dic 2010:")
     print(result.head(10))
     print(f"\nTotal de registros: {len(result)}")
@@ -230,33 +192,40 @@ def example_6_filter_by_partition():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ejemplos de consultas sobre el árbol Parquet particionado")
+    parser.add_argument("--parquet", default=PARQUET_PATH, help=f"Raíz del árbol year=/month= (defecto={PARQUET_PATH})")
+    args = parser.parse_args()
+
     print("\n" + "="*60)
     print("EJEMPLOS DE QUERIES SOBRE PARQUET PARTICIONADO")
     print("="*60)
-    print(f"\nRuta de datos: {PARQUET_PATH}")
+    print(f"\nRuta de datos: {args.parquet}")
     print("Usando DuckDB para queries eficientes sin servidor\n")
 
+    # Una sola conexión y un solo listado por partición para todos los ejemplos
+    service = ParquetQueryService(args.parquet, h3_uint64=H3_UINT64).open()
+
     # Recolectar tiempos de ejecución
     times = []
 
     # Ejecutar ejemplos
     try:
-        _, t1 = example_1_query_specific_cell_and_time()
+        _, t1 = example_1_query_specific_cell_and_time(service)
         times.append(("Query específica por H3 y hora", t1))
 
-        _, t2 = example_2_aggregate_by_cell()
+        _, t2 = example_2_aggregate_by_cell(service)
         times.append(("Estadísticas agregadas por celda", t2))
 
-        _, t3 = example_3_time_series_analysis()
+        _, t3 = example_3_time_series_analysis(service)
         times.append(("Serie temporal de una celda", t3))
 
-        _, t4 = example_4_hourly_patterns()
+        _, t4 = example_4_hourly_patterns(service)
         times.append(("Patrón horario de NO2", t4))
 
-        _, t5 = example_5_yearly_comparison()
+        _, t5 = example_5_yearly_comparison(service)
         times.append(("Evolución anual (todos los datos)", t5))
 
-        _, t6 = example_6_filter_by_partition()
+        _, t6 = example_6_filter_by_partition(service)
         times.append(("Query con filtrado por particiones", t6))
 
         # Resumen de rendimiento
@@ -283,3 +252,5 @@ if __name__ == "__main__":
         print(f"\nError: {e}")
         print("\nAsegúrate de tener DuckDB instalado:")
         print("  pip install duckdb")
+    finally:
+        service.close()
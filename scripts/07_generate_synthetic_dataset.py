@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Genera un árbol Parquet year=YYYY/month=MM sintético con la forma de los datos reales
+(h3_index uint64, datetime, value float32; ver functions_synthetic.py) y, opcionalmente, lo carga
+en PostgreSQL con 06_loadIntoDb.py. Sirve para ejecutar 12_comparative_benchmarking.py en local
+a distintos tamaños, sin el árbol de /Volumes/MV/carto ni el servidor.
+
+Tamaño aproximado (filas = celdas × horas; res 9 = 1.903 celdas ≈ 17 M filas/año):
+
+    res   celdas   1 mes      1 año      25 años
+    8        289   0,21 M     2,5 M      63 M
+    9      1.903   1,4 M      17 M       417 M
+    10    13.037   9,5 M      114 M      2.857 M
+
+Los meses se generan en paralelo (--workers) y cada uno con su propia semilla, así que relanzar
+con un rango mayor produce los mismos datos para los meses ya existentes (que se saltan salvo
+--force). En <output>/_synthetic.json quedan los parámetros de la generación.
+
+Uso:
+    # 1 año a res 9
+    python3 scripts/07_generate_synthetic_dataset.py --output /tmp/madno2Synthetic --start 2005-01 --years 1
+
+    # 25 años (2001-2025) y carga en un PostgreSQL local en Docker
+    docker run -d --name madno-pg -e POSTGRES_PASSWORD=bench -p 55432:5432 postgres:17
+    python3 scripts/07_generate_synthetic_dataset.py --output /tmp/madno2Synthetic --start 2001-01 --years 25 \\
+        --workers 8 --load-postgres --host localhost --port 55432 --dbname postgres --user postgres --password bench
+
+    # Benchmark sobre esos datos
+    python3 scripts/12_comparative_benchmarking.py --parquet /tmp/madno2Synthetic \\
+        --host localhost --port 55432 --dbname postgres --user postgres --password bench \\
+        --backends postgres postgres_rollup duckdb_parquet duckdb_native --scenario 2005 --scenario 2001-2010
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+try:
+    from tqdm import tqdm
+except Exception:
+    tqdm = lambda x, **k: x  # fallback si no está instalado
+
+from functions_h3index import H3_STORAGE_MODES
+from functions_parquet import add_parquet_arguments, parquet_options_from_args, partition_dir
+from functions_pgload import PARTITION_LAYOUTS
+from functions_synthetic import SyntheticNO2, write_month
+
+METADATA_NAME = '_synthetic.json'
+TAG = 'synthetic'
+
+
+def parse_month(value):
+    """'2005-01' -> (2005, 1)."""
+    try:
+        ts = datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Mes no válido: {value!r} (formato YYYY-MM)")
+    return ts.year, ts.month
+
+
+def month_list(start, count):
+    year, month = start
+    months = []
+    for _ in range(count):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def generate_month(root, h3_res, seed, year, month, options):
+    """Worker: genera y escribe una partición. Devuelve (year, month, filas, segundos)."""
+    t0 = time.time()
+    rows = write_month(root, SyntheticNO2(h3_res, seed), year, month, options, tag=TAG)
+    return year, month, rows, time.time() - t0
+
+
+def generate(root, months, h3_res, seed, options, workers=1, force=False):
+    """Genera las particiones que falten (todas con force). Devuelve las filas escritas."""
+    pending = [(y, m) for y, m in months
+               if force or not os.path.exists(os.path.join(partition_dir(root, y, m), f"part-{TAG}.parquet"))]
+    skipped = len(months) - len(pending)
+    if skipped:
+        print(f"{skipped} meses ya generados (usa --force para regenerarlos)")
+    total = 0
+    progress = tqdm(range(len(pending)), total=len(pending), desc="Meses", unit="mes")
+    if workers <= 1:
+        for year, month in pending:
+            total += generate_month(root, h3_res, seed, year, month, options)[2]
+            if hasattr(progress, "update"):
+                progress.update(1)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futures = [ex.submit(generate_month, root, h3_res, seed, y, m, options) for y, m in pending]
+            for future in as_completed(futures):
+                total += future.result()[2]
+                if hasattr(progress, "update"):
+                    progress.update(1)
+    if hasattr(progress, "close"):
+        progress.close()
+    return total
+
+
+def write_metadata(root, h3_res, seed, months, n_cells, rows, elapsed):
+    """Guarda (o amplía con los meses nuevos) <root>/_synthetic.json."""
+    path = os.path.join(root, METADATA_NAME)
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+    if previous and (previous.get('h3_res'), previous.get('seed')) != (h3_res, seed):
+        print(f"Aviso: {root} ya tenía datos con res={previous.get('h3_res')} seed={previous.get('seed')}")
+    all_months = sorted(set(map(tuple, previous.get('months', []))) | set(months))
+    metadata = {
+        'generator': 'functions_synthetic.SyntheticNO2',
+        'h3_res': h3_res, 'seed': seed, 'cells': n_cells,
+        'months': [list(m) for m in all_months],
+        'first_month': f"{all_months[0][0]}-{all_months[0][1]:02d}",
+        'last_month': f"{all_months[-1][0]}-{all_months[-1][1]:02d}",
+        'rows_written': rows, 'seconds': round(elapsed, 1),
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def load_postgres(root, years, host, port, dbname, user, password, schema="madno", table="h3_points",
+                  h3_mode="text", partition_by="year", workers=4, initial_load=False):
+    """Carga las particiones de `years` con 06_loadIntoDb.py (formato parquet, una por lote)."""
+    argv = ["--format", "parquet", "--input", root, "--years", ",".join(map(str, sorted(years))),
+            "--host", host, "--port", str(port), "--dbname", dbname, "--user", user, "--password", password,
+            "--schema", schema, "--table", table, "--h3-mode", h3_mode, "--partition-by", partition_by,
+            "--workers", str(workers)]
+    if initial_load:
+        argv.append("--initial-load")
+    print(f"\nCargando en PostgreSQL {host}:{port}/{dbname} -> {schema}.{table}")
+    importlib.import_module("06_loadIntoDb").main(argv)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Árbol Parquet year=/month= sintético de NO2 por celda H3")
+    parser.add_argument("--output", required=True, help="Raíz del árbol Parquet a generar")
+    parser.add_argument("--res", type=int, default=9, help="Resolución H3 (defecto=9)")
+    parser.add_argument("--start", type=parse_month, default=(2005, 1), help="Primer mes, YYYY-MM (defecto=2005-01)")
+    span = parser.add_mutually_exclusive_group()
+    span.add_argument("--months", type=int, default=None, help="Número de meses a generar (defecto=1)")
+    span.add_argument("--years", type=int, default=None, help="Número de años a generar (12 meses cada uno)")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla (defecto=42)")
+    parser.add_argument("--workers", type=int, default=4, help="Meses generados en paralelo (defecto=4)")
+    parser.add_argument("--force", action="store_true", help="Regenera también los meses que ya existen")
+    add_parquet_arguments(parser)
+
+    pg = parser.add_argument_group("PostgreSQL (--load-postgres)")
+    pg.add_argument("--load-postgres", action="store_true", help="Carga el árbol generado con 06_loadIntoDb.py")
+    pg.add_argument("--host", default="localhost")
+    pg.add_argument("--port", type=int, default=5432)
+    pg.add_argument("--dbname", default="postgres")
+    pg.add_argument("--user", default="postgres")
+    pg.add_argument("--password", default="bench")
+    pg.add_argument("--schema", default="madno")
+    pg.add_argument("--table", default="h3_points")
+    pg.add_argument("--h3-mode", choices=H3_STORAGE_MODES, default="text", help="Tipo de h3_index (defecto=text)")
+    pg.add_argument("--partition-by", choices=PARTITION_LAYOUTS, default="year", help="Particionado de la tabla (defecto=year)")
+    pg.add_argument("--load-workers", type=int, default=4, help="Conexiones de la carga (defecto=4)")
+    pg.add_argument("--initial-load", action="store_true",
+                    help="Carga inicial en tabla vacía (COPY sin ON CONFLICT, índices al final)")
+    args = parser.parse_args()
+
+    count = args.years * 12 if args.years else (args.months or 1)
+    if count < 1:
+        parser.error("--months/--years debe ser >= 1")
+    months = month_list(args.start, count)
+    options = parquet_options_from_args(args)
+    n_cells = SyntheticNO2(args.res, args.seed).n_cells
+
+    print(f"Generando {len(months)} meses ({months[0][0]}-{months[0][1]:02d} a {months[-1][0]}-{months[-1][1]:02d}), "
+          f"res {args.res} ({n_cells} celdas, ~{n_cells * 730 * len(months) / 1e6:.1f} M filas) en {args.output}")
+    os.makedirs(args.output, exist_ok=True)
+    t0 = time.time()
+    rows = generate(args.output, months, args.res, args.seed, options, args.workers, args.force)
+    elapsed = time.time() - t0
+    metadata_path = write_metadata(args.output, args.res, args.seed, months, n_cells, rows, elapsed)
+    rate = f", {rows / elapsed / 1e6:.2f} M filas/s" if rows and elapsed else ""
+    print(f"{rows} filas escritas en {elapsed:.1f} s{rate}. Metadatos: {metadata_path}")
+
+    if args.load_postgres:
+        load_postgres(args.output, {y for y, _ in months}, args.host, args.port, args.dbname, args.user, args.password,
+                      args.schema, args.table, args.h3_mode, args.partition_by, args.load_workers, args.initial_load)
+
+
+if __name__ == "__main__":
+    main()
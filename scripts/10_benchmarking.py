@@ -110,6 +110,55 @@ def execute_query_benchmark(cur, query: str, query_name: str) -> Tuple[float, An
     return elapsed_time, result
 
 
+def run_benchmarks(cur, queries, use_rollups: bool = False) -> list:
+    """
+    Ejecuta cada query (y su variante "rollup_sql" si use_rollups) y devuelve sus tiempos.
+    Cada resultado: name, time, success, rollup (bool), error.
+    """
+    results = []
+    for query in queries:
+        variants = [(query["name"], query["sql"], False)]
+        if use_rollups and query.get("rollup_sql"):
+            variants.append((f"{query['name']} [rollup]", query["rollup_sql"], True))
+        for name, sql, rollup in variants:
+            try:
+                elapsed_time, result = execute_query_benchmark(cur, sql.strip(), name)
+                results.append({"name": name, "time": elapsed_time, "success": True, "rollup": rollup})
+            except Exception as e:
+                print(f"ERROR: {e}")
+                cur.connection.rollback()
+                results.append({"name": name, "time": None, "success": False, "rollup": rollup, "error": str(e)})
+    return results
+
+
+def print_summary(results: list):
+    """Resumen final; las variantes [rollup] muestran la aceleración frente a la consulta sobre la tabla horaria."""
+    print("\n" + "="*60)
+    print("RESUMEN DE BENCHMARKS")
+    print("="*60)
+    previous = None
+    for r in results:
+        if not r["success"]:
+            print(f"{r['name']}: FAILED - {r.get('error', 'Unknown error')}")
+        elif r["rollup"] and previous and previous["success"] and not previous["rollup"]:
+            speedup = previous["time"] / max(r["time"], 1e-9)
+            print(f"{r['name']}: {r['time']:.4f}s (x{speedup:,.2f} frente a la tabla horaria)")
+        else:
+            print(f"{r['name']}: {r['time']:.4f}s")
+        previous = r
+
+    print("="*60)
+
+    # Calcular tiempo total (tabla horaria y rollups por separado)
+    raw_time = sum([r["time"] for r in results if r["success"] and not r["rollup"]])
+    print(f"Tiempo total de ejecución: {raw_time:.4f}s")
+    if any(r["rollup"] for r in results):
+        rollup_time = sum([r["time"] for r in results if r["success"] and r["rollup"]])
+        print(f"Tiempo total sobre rollups: {rollup_time:.4f}s")
+    print(f"Consultas exitosas: {sum([1 for r in results if r['success']])}/{len(results)}")
+    print("="*60)
+
+
 def main():
     # ============================================================
     # CONFIGURACIÓN DE PARÁMETROS
@@ -141,6 +190,10 @@ def main():
     SCHEMA = "madno"
     TABLE = "h3_points"
 
+    # Ejecutar también la variante de cada consulta sobre los rollups que mantiene 06_loadIntoDb.py
+    # ({TABLE}_cell_daily, {TABLE}_cell_monthly, {TABLE}_city_hourly; ver functions_rollups.py)
+    USE_ROLLUPS = True
+
     # Validar rango de años
     if YEAR_FROM > YEAR_TO:
         print(f"ERROR: YEAR_FROM ({YEAR_FROM}) debe ser menor o igual a YEAR_TO ({YEAR_TO})")
@@ -153,6 +206,10 @@ def main():
     else:
         year_desc = f"años {YEAR_FROM} a {YEAR_TO}"
         year_filter = f"dt >= '{YEAR_FROM}-01-01' AND dt < '{YEAR_TO + 1}-01-01'"
+    month_filter = f"month >= '{YEAR_FROM}-01-01' AND month < '{YEAR_TO + 1}-01-01'"
+    daily = f"{SCHEMA}.{TABLE}_cell_daily"
+    monthly = f"{SCHEMA}.{TABLE}_cell_monthly"
+    hourly = f"{SCHEMA}.{TABLE}_city_hourly"
 
     # Definir las queries a benchmarking
     queries = [
@@ -162,6 +219,11 @@ def main():
                 SELECT COUNT(*)
                 FROM {SCHEMA}.{TABLE}
                 WHERE {year_filter}
+            """,
+            "rollup_sql": f"""
+                SELECT SUM(n)
+                FROM {monthly}
+                WHERE {month_filter}
             """
         },
         {
@@ -177,6 +239,18 @@ def main():
                 WHERE {year_filter}
                 GROUP BY DATE_TRUNC('month', dt)
                 ORDER BY month
+            """,
+            "rollup_sql": f"""
+                SELECT
+                    month,
+                    SUM(n) as num_registros,
+                    SUM(sum) / SUM(n) as avg_value,
+                    MIN(min) as min_value,
+                    MAX(max) as max_value
+                FROM {monthly}
+                WHERE {month_filter}
+                GROUP BY month
+                ORDER BY month
             """
         },
         {
@@ -192,6 +266,18 @@ def main():
                 GROUP BY h3_index
                 ORDER BY avg_value DESC
                 LIMIT 10
+            """,
+            "rollup_sql": f"""
+                SELECT
+                    h3_index,
+                    SUM(n) as num_mediciones,
+                    SUM(sum) / SUM(n) as avg_value,
+                    MAX(max) as max_value
+                FROM {monthly}
+                WHERE {month_filter}
+                GROUP BY h3_index
+                ORDER BY avg_value DESC
+                LIMIT 10
             """
         },
         {
@@ -200,6 +286,11 @@ def main():
                 SELECT COUNT(*), AVG(value)
                 FROM {SCHEMA}.{TABLE}
                 WHERE dt >= '{YEAR_FROM}-07-15' AND dt < '{YEAR_FROM}-07-16'
+            """,
+            "rollup_sql": f"""
+                SELECT COALESCE(SUM(n), 0), SUM(sum) / SUM(n)
+                FROM {daily}
+                WHERE day = '{YEAR_FROM}-07-15'
             """
         },
         {
@@ -211,6 +302,14 @@ def main():
                     COUNT(DISTINCT DATE_TRUNC('year', dt)) as num_years
                 FROM {SCHEMA}.{TABLE}
                 WHERE {year_filter}
+            """,
+            "rollup_sql": f"""
+                SELECT
+                    MIN(dt) as fecha_min,
+                    MAX(dt) as fecha_max,
+                    COUNT(DISTINCT DATE_TRUNC('year', dt)) as num_years
+                FROM {hourly}
+                WHERE {year_filter}
             """
         },
         {
@@ -225,6 +324,17 @@ def main():
                 WHERE {year_filter}
                 GROUP BY DATE_TRUNC('year', dt)
                 ORDER BY year
+            """,
+            "rollup_sql": f"""
+                SELECT
+                    DATE_TRUNC('year', month::timestamp) as year,
+                    SUM(n) as num_registros,
+                    SUM(sum) / SUM(n) as avg_value,
+                    SQRT(GREATEST(SUM(sum_sq) - SUM(sum) ^ 2 / SUM(n), 0) / NULLIF(SUM(n) - 1, 0)) as stddev_value
+                FROM {monthly}
+                WHERE {month_filter}
+                GROUP BY DATE_TRUNC('year', month::timestamp)
+                ORDER BY year
             """
         },
         {
@@ -240,6 +350,18 @@ def main():
                 WHERE {year_filter}
                 GROUP BY EXTRACT(HOUR FROM dt)
                 ORDER BY hora
+            """,
+            "rollup_sql": f"""
+                SELECT
+                    EXTRACT(HOUR FROM dt) as hora,
+                    SUM(n) as num_mediciones,
+                    SUM(sum) / SUM(n) as no2_promedio,
+                    MAX(max) as no2_maximo,
+                    MIN(min) as no2_minimo
+                FROM {hourly}
+                WHERE {year_filter}
+                GROUP BY EXTRACT(HOUR FROM dt)
+                ORDER BY hora
             """
         },
         {
@@ -256,6 +378,19 @@ def main():
                 GROUP BY EXTRACT(MONTH FROM dt), EXTRACT(DAY FROM dt)
                 ORDER BY no2_promedio DESC
                 LIMIT 10
+            """,
+            "rollup_sql": f"""
+                SELECT
+                    EXTRACT(MONTH FROM dt) as mes,
+                    EXTRACT(DAY FROM dt) as dia,
+                    SUM(n) as mediciones,
+                    SUM(sum) / SUM(n) as no2_promedio,
+                    MAX(max) as no2_maximo
+                FROM {hourly}
+                WHERE {year_filter}
+                GROUP BY EXTRACT(MONTH FROM dt), EXTRACT(DAY FROM dt)
+                ORDER BY no2_promedio DESC
+                LIMIT 10
             """
         },
         {
@@ -288,6 +423,8 @@ def main():
         print(f"PostgreSQL (local): {LOCAL_PG_HOST}:{LOCAL_PG_PORT}")
     print(f"Database: {DBNAME}")
     print(f"Schema.Table: {SCHEMA}.{TABLE}")
+    if USE_ROLLUPS:
+        print(f"Rollups: {daily}, {monthly}, {hourly}")
     print("="*60)
 
     # Conectar y ejecutar queries
@@ -300,91 +437,13 @@ def main():
 
             with get_conn(local_host, DBNAME, USER, PASSWORD, local_port) as conn:
                 with conn.cursor() as cur:
-                    results = []
-
-                    for query in queries:
-                        try:
-                            elapsed_time, result = execute_query_benchmark(
-                                cur,
-                                query["sql"].strip(),
-                                query["name"]
-                            )
-                            results.append({
-                                "name": query["name"],
-                                "time": elapsed_time,
-                                "success": True
-                            })
-                        except Exception as e:
-                            print(f"ERROR: {e}")
-                            results.append({
-                                "name": query["name"],
-                                "time": None,
-                                "success": False,
-                                "error": str(e)
-                            })
-
-                    # Resumen final
-                    print("\n" + "="*60)
-                    print("RESUMEN DE BENCHMARKS")
-                    print("="*60)
-                    for r in results:
-                        if r["success"]:
-                            print(f"{r['name']}: {r['time']:.4f}s")
-                        else:
-                            print(f"{r['name']}: FAILED - {r.get('error', 'Unknown error')}")
-
-                    print("="*60)
-
-                    # Calcular tiempo total
-                    total_time = sum([r["time"] for r in results if r["success"]])
-                    print(f"Tiempo total de ejecución: {total_time:.4f}s")
-                    print(f"Consultas exitosas: {sum([1 for r in results if r['success']])}/{len(results)}")
-                    print("="*60)
+                    print_summary(run_benchmarks(cur, queries, USE_ROLLUPS))
     else:
         # Conexión local directa
         print(f"\nConectando a PostgreSQL local en {LOCAL_PG_HOST}:{LOCAL_PG_PORT}...\n")
         with get_conn(LOCAL_PG_HOST, DBNAME, USER, PASSWORD, LOCAL_PG_PORT) as conn:
             with conn.cursor() as cur:
-                results = []
-
-                for query in queries:
-                    try:
-                        elapsed_time, result = execute_query_benchmark(
-                            cur,
-                            query["sql"].strip(),
-                            query["name"]
-                        )
-                        results.append({
-                            "name": query["name"],
-                            "time": elapsed_time,
-                            "success": True
-                        })
-                    except Exception as e:
-                        print(f"ERROR: {e}")
-                        results.append({
-                            "name": query["name"],
-                            "time": None,
-                            "success": False,
-                            "error": str(e)
-                        })
-
-                # Resumen final
-                print("\n" + "="*60)
-                print("RESUMEN DE BENCHMARKS")
-                print("="*60)
-                for r in results:
-                    if r["success"]:
-                        print(f"{r['name']}: {r['time']:.4f}s")
-                    else:
-                        print(f"{r['name']}: FAILED - {r.get('error', 'Unknown error')}")
-
-                print("="*60)
-
-                # Calcular tiempo total
-                total_time = sum([r["time"] for r in results if r["success"]])
-                print(f"Tiempo total de ejecución: {total_time:.4f}s")
-                print(f"Consultas exitosas: {sum([1 for r in results if r['success']])}/{len(results)}")
-                print("="*60)
+                print_summary(run_benchmarks(cur, queries, USE_ROLLUPS))
 
 
 if __name__ == "__main__":
@@ -1,306 +1,224 @@
 #!/usr/bin/env python3
 """
-Script de benchmarking comparativo entre PostgreSQL y Parquet.
-Ejecuta múltiples escenarios de benchmarking y genera un CSV con los resultados.
+Script de benchmarking comparativo entre PostgreSQL y Parquet (DuckDB).
+Ejecuta las consultas de functions_benchmark_queries.py en varios escenarios y backends
+(functions_benchmark.py) y guarda los resultados en JSON y CSV.
 
-Escenarios:
+Escenarios por defecto:
 1. Año único: 2005
 2. Rango corto: 2005-2009 (5 años)
 3. Rango largo: 2001-2010 (10 años)
 
+Cada consulta se ejecuta --warmup veces sin medir y --repetitions veces midiendo; se informa la
+mediana, el p95 y la desviación típica. Los resultados van a
+<output>/benchmark_results_<fecha>.json (metadatos + todas las mediciones) y .csv (una fila por
+backend, escenario y consulta), más <...>_comparison.csv con la mediana de cada backend y el
+speedup frente a PostgreSQL (lo que antes se copiaba a mano en 13_results.csv).
+
+--cold mide además una ejecución en frío por consulta (conexión nueva y caché de páginas del SO
+vaciada si se ejecuta como root o con sudo sin contraseña); --profile guarda en el JSON el plan
+ejecutado (EXPLAIN ANALYZE de DuckDB, EXPLAIN (ANALYZE, BUFFERS) de PostgreSQL). En todas las
+mediciones se registran CPU, bytes leídos y pico de RSS del proceso que ejecuta la consulta, para
+distinguir si un backend gana por I/O o por CPU (ver functions_benchmark.py).
+
 Instalación requerida:
-    pip install psycopg2 duckdb pandas
+    pip install psycopg2 duckdb
 
 Uso:
-    python3 scripts/12_comparative_benchmarking.py
+    python3 scripts/12_comparative_benchmarking.py --parquet /Volumes/MV/carto/madno2Parquet
+    python3 scripts/12_comparative_benchmarking.py --backends duckdb_parquet duckdb_native \\
+        --scenario 2005 --scenario 2001-2010 --queries Q1 Q4 Q8 --repetitions 10
+    sudo python3 scripts/12_comparative_benchmarking.py --cold --profile --scenario 2005-2009
+    python3 scripts/12_comparative_benchmarking.py --backends postgres postgres_rollup \\
+        --use-ssh-tunnel --ssh-host 138.100.127.190 --ssh-port 22 --ssh-password '...'
+
+    # En local, sobre datos sintéticos de 07_generate_synthetic_dataset.py y PostgreSQL en Docker
+    python3 scripts/12_comparative_benchmarking.py --parquet /tmp/madno2Synthetic \\
+        --host localhost --port 55432 --dbname postgres --user postgres --password bench
 """
-
-import subprocess
+import argparse
 import csv
-import json
-import time
+import os
+import sys
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
 from pathlib import Path
 
-
-def run_benchmark_script(script_path: str, year_from: int, year_to: int) -> dict:
-    """
-    Ejecuta un script de benchmarking modificando los parámetros YEAR_FROM y YEAR_TO.
-    Retorna un diccionario con los resultados parseados.
-    """
-    print(f"\n{'='*80}")
-    print(f"Ejecutando {script_path} para años {year_from}-{year_to}")
-    print(f"{'='*80}")
-
-    # Leer el script original
-    with open(script_path, 'r') as f:
-        script_content = f.read()
-
-    # Modificar YEAR_FROM y YEAR_TO
-    modified_content = script_content
-
-    # Reemplazar YEAR_FROM
-    import re
-    modified_content = re.sub(
-        r'YEAR_FROM\s*=\s*\d+',
-        f'YEAR_FROM = {year_from}',
-        modified_content
-    )
-
-    # Reemplazar YEAR_TO
-    modified_content = re.sub(
-        r'YEAR_TO\s*=\s*\d+',
-        f'YEAR_TO = {year_to}',
-        modified_content
-    )
-
-    # Crear archivo temporal
-    temp_script = script_path.replace('.py', '_temp.py')
-    with open(temp_script, 'w') as f:
-        f.write(modified_content)
-
-    try:
-        # Ejecutar el script y capturar la salida
-        start_time = time.time()
-        result = subprocess.run(
-            ['python3', temp_script],
-            capture_output=True,
-            text=True,
-            timeout=600  # 10 minutos timeout
-        )
-        total_execution_time = time.time() - start_time
-
-        print(result.stdout)
-
-        if result.returncode != 0:
-            print(f"ERROR: {result.stderr}")
-            return {
-                'success': False,
-                'error': result.stderr,
-                'total_time': total_execution_time
-            }
-
-        # Parsear la salida para extraer los resultados
-        output = result.stdout
-        results = {
-            'success': True,
-            'queries': [],
-            'total_time': total_execution_time,
-            'year_from': year_from,
-            'year_to': year_to
-        }
-
-        # Buscar el resumen de benchmarks en la salida
-        lines = output.split('\n')
-        in_summary = False
-
-        for line in lines:
-            if 'RESUMEN DE BENCHMARKS' in line:
-                in_summary = True
-                continue
-
-            if in_summary and line.strip().startswith('Q'):
-                # Formato: "Q1: Nombre: X.XXXXs" o "Q1: Nombre: FAILED"
-                parts = line.split(':')
-                if len(parts) >= 3:
-                    query_name = ':'.join(parts[:-1]).strip()
-                    time_str = parts[-1].strip()
-
-                    if 'FAILED' in time_str:
-                        results['queries'].append({
-                            'query': query_name,
-                            'time': None,
-                            'success': False
-                        })
-                    else:
-                        # Extraer tiempo (puede estar en formato "X.XXXXs" o "X.XXXXs (XXX.XXms)")
-                        time_match = re.search(r'([\d.]+)s', time_str)
-                        if time_match:
-                            results['queries'].append({
-                                'query': query_name,
-                                'time': float(time_match.group(1)),
-                                'success': True
-                            })
-
-            # Detectar fin del resumen
-            if in_summary and '=' * 20 in line and len(results['queries']) > 0:
-                break
-
-        return results
-
-    except subprocess.TimeoutExpired:
-        print(f"TIMEOUT: El script tardó más de 10 minutos")
-        return {
-            'success': False,
-            'error': 'Timeout después de 10 minutos',
-            'total_time': 600
-        }
-    except Exception as e:
-        print(f"ERROR: {e}")
-        return {
-            'success': False,
-            'error': str(e),
-            'total_time': 0
-        }
-    finally:
-        # Limpiar archivo temporal
-        try:
-            Path(temp_script).unlink()
-        except Exception:
-            pass
+from functions_benchmark import (BACKENDS, DuckDBNativeBackend, DuckDBParquetBackend, PostgresBackend,
+                                 PostgresRollupBackend, comparison_rows, run_suite, write_results)
+from functions_benchmark_queries import DEFAULT_SCENARIOS, Scenario, select_queries
 
 
-def main():
-    print("="*80)
-    print("BENCHMARKING COMPARATIVO: PostgreSQL vs Parquet")
-    print("="*80)
-    print(f"Fecha de ejecución: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-
-    # Definir escenarios
-    scenarios = [
-        {'name': 'Año único (2005)', 'year_from': 2005, 'year_to': 2005},
-        {'name': 'Rango corto (2005-2009)', 'year_from': 2005, 'year_to': 2009},
-        {'name': 'Rango largo (2001-2010)', 'year_from': 2001, 'year_to': 2010},
-    ]
-
-    # Rutas a los scripts
-    scripts_dir = Path(__file__).parent
-    pg_script = scripts_dir / '10_benchmarking.py'
-    parquet_script = scripts_dir / '11_benchmarking_parquet.py'
-
-    # Verificar que los scripts existen
-    if not pg_script.exists():
-        print(f"ERROR: No se encontró {pg_script}")
+@contextmanager
+def postgres_endpoint(args):
+    """(host, port) de PostgreSQL: directo o a través de un túnel SSH."""
+    if not args.use_ssh_tunnel:
+        yield args.host, args.port
         return
-
-    if not parquet_script.exists():
-        print(f"ERROR: No se encontró {parquet_script}")
+    from functions_pgload import open_system_ssh_tunnel
+    print(f"Estableciendo túnel SSH a {args.ssh_user}@{args.ssh_host}:{args.ssh_port} ...")
+    with open_system_ssh_tunnel(args.ssh_host, args.ssh_port, args.ssh_user, args.ssh_password,
+                                args.remote_pg_host, args.remote_pg_port) as endpoint:
+        yield endpoint
+
+
+def add_postgres_arguments(parser):
+    """Conexión a PostgreSQL (directa o por túnel SSH), común a los scripts de benchmark."""
+    group = parser.add_argument_group("PostgreSQL")
+    group.add_argument("--host", default="localhost")
+    group.add_argument("--port", type=int, default=5432)
+    group.add_argument("--dbname", default="gis")
+    group.add_argument("--user", default="gis")
+    group.add_argument("--password", default="hjJ7_hj76HHjdftGg")
+    group.add_argument("--schema", default="madno")
+    group.add_argument("--table", default="h3_points")
+    group.add_argument("--use-ssh-tunnel", action="store_true", help="Conecta a PostgreSQL por túnel SSH")
+    group.add_argument("--ssh-host", default="138.100.127.190")
+    group.add_argument("--ssh-port", type=int, default=22)
+    group.add_argument("--ssh-user", default="upm")
+    group.add_argument("--ssh-password", default=None)
+    group.add_argument("--remote-pg-host", default="127.0.0.1")
+    group.add_argument("--remote-pg-port", type=int, default=5432)
+    return group
+
+
+def build_backends(args, stack):
+    """Abre los backends pedidos (se cierran al salir de `stack`)."""
+    backends = []
+    needs_postgres = any(b.startswith('postgres') for b in args.backends)
+    host, port = stack.enter_context(postgres_endpoint(args)) if needs_postgres else (None, None)
+    for name in args.backends:
+        if name == 'postgres':
+            backend = PostgresBackend(host, port, args.dbname, args.user, args.password, args.schema, args.table)
+        elif name == 'postgres_rollup':
+            backend = PostgresRollupBackend(host, port, args.dbname, args.user, args.password, args.schema, args.table)
+        elif name == 'duckdb_parquet':
+            backend = DuckDBParquetBackend(args.parquet, args.threads, args.memory_limit)
+        else:
+            path = args.duckdb_file or os.path.normpath(args.parquet) + '.duckdb'
+            backend = DuckDBNativeBackend(path, 'h3_points', args.parquet, args.threads, args.memory_limit)
+        backends.append(stack.enter_context(backend))
+    return backends
+
+
+def _mb(value):
+    return None if value is None else value / 1024**2
+
+
+def _fmt(value, fmt, unit=""):
+    return "n/d" if value is None else f"{value:{fmt}}{unit}"
+
+
+def print_result(result):
+    if result['error']:
+        print(f"  [{result['backend']}] {result['name']}: FAILED - {result['error']}")
         return
-
-    # Almacenar todos los resultados
-    all_results = []
-
-    # Ejecutar cada escenario
-    for scenario in scenarios:
-        print(f"\n{'#'*80}")
-        print(f"ESCENARIO: {scenario['name']}")
-        print(f"{'#'*80}")
-
-        year_from = scenario['year_from']
-        year_to = scenario['year_to']
-
-        # Ejecutar PostgreSQL
-        print("\n--- PostgreSQL ---")
-        pg_results = run_benchmark_script(str(pg_script), year_from, year_to)
-
-        # Ejecutar Parquet
-        print("\n--- Parquet + DuckDB ---")
-        parquet_results = run_benchmark_script(str(parquet_script), year_from, year_to)
-
-        # Combinar resultados
-        if pg_results['success'] and parquet_results['success']:
-            # Emparejar queries por nombre
-            for pg_query in pg_results['queries']:
-                query_name = pg_query['query']
-
-                # Buscar la query correspondiente en parquet
-                parquet_query = next(
-                    (q for q in parquet_results['queries'] if q['query'] == query_name),
-                    None
-                )
-
-                if parquet_query:
-                    all_results.append({
-                        'scenario': scenario['name'],
-                        'year_from': year_from,
-                        'year_to': year_to,
-                        'query': query_name,
-                        'postgresql_time_s': pg_query['time'] if pg_query['success'] else None,
-                        'parquet_time_s': parquet_query['time'] if parquet_query['success'] else None,
-                        'speedup': (
-                            pg_query['time'] / parquet_query['time']
-                            if pg_query['success'] and parquet_query['success'] and parquet_query['time'] > 0
-                            else None
-                        ),
-                        'postgresql_success': pg_query['success'],
-                        'parquet_success': parquet_query['success']
-                    })
-
-        # Agregar tiempos totales
-        all_results.append({
-            'scenario': scenario['name'],
-            'year_from': year_from,
-            'year_to': year_to,
-            'query': 'TOTAL',
-            'postgresql_time_s': pg_results.get('total_time'),
-            'parquet_time_s': parquet_results.get('total_time'),
-            'speedup': (
-                pg_results.get('total_time', 0) / parquet_results.get('total_time', 1)
-                if pg_results.get('total_time') and parquet_results.get('total_time')
-                else None
-            ),
-            'postgresql_success': pg_results['success'],
-            'parquet_success': parquet_results['success']
-        })
-
-    # Generar CSV con resultados
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    csv_filename = scripts_dir / f'benchmark_results_{timestamp}.csv'
-
-    print(f"\n{'='*80}")
-    print(f"Guardando resultados en: {csv_filename}")
-    print(f"{'='*80}\n")
-
-    with open(csv_filename, 'w', newline='') as csvfile:
-        fieldnames = [
-            'scenario',
-            'year_from',
-            'year_to',
-            'query',
-            'postgresql_time_s',
-            'parquet_time_s',
-            'speedup',
-            'postgresql_success',
-            'parquet_success'
-        ]
-
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for result in all_results:
-            writer.writerow(result)
-
-    # Mostrar resumen
+    print(f"  [{result['backend']}] {result['name']}: mediana {result['median_s']:.4f}s, "
+          f"p95 {result['p95_s']:.4f}s, sd {result['stddev_s']:.4f}s ({result['rows']} filas)")
+    if result.get('cold_s') is not None:
+        dropped = "caché del SO vaciada" if result['cache_dropped'] else "caché del SO NO vaciada"
+        print(f"      frío {result['cold_s']:.4f}s ({dropped}), CPU {_fmt(result['cold_cpu_s'], '.3f', 's')}, "
+              f"leídos {_fmt(_mb(result['cold_read_bytes']), '.1f', ' MB')}")
+    peak = _fmt(result.get('peak_rss_mb'), '.0f', ' MB')
+    if result.get('peak_rss_reset') is False:
+        peak += " (no se pudo reiniciar el pico)"
+    print(f"      caliente: CPU {_fmt(result.get('cpu_s'), '.3f', 's')}, leídos {_fmt(_mb(result.get('read_bytes')), '.1f', ' MB')} "
+          f"(rchar {_fmt(_mb(result.get('rchar')), '.1f', ' MB')}), pico RSS {peak}")
+    if result.get('pg_shared_read_bytes') is not None:
+        print(f"      buffers: {_mb(result['pg_shared_hit_bytes']):.1f} MB en shared_buffers, "
+              f"{_mb(result['pg_shared_read_bytes']):.1f} MB leídos fuera de ellos, {_mb(result['pg_temp_read_bytes']):.1f} MB temporales")
+
+
+def print_summary(rows, backends, scenarios):
     print("\nRESUMEN DE RESULTADOS:")
-    print("="*80)
-
+    print("=" * 80)
     for scenario in scenarios:
-        scenario_results = [r for r in all_results if r['scenario'] == scenario['name'] and r['query'] != 'TOTAL']
-        total_result = next((r for r in all_results if r['scenario'] == scenario['name'] and r['query'] == 'TOTAL'), None)
+        scenario_rows = [r for r in rows if r['scenario'] == scenario.name]
+        print(f"\n{scenario.name}:")
+        for backend in backends:
+            medians = [r[f"{backend}_median_s"] for r in scenario_rows if r.get(f"{backend}_median_s") is not None]
+            line = f"  {backend}: {len(medians)} consultas, suma de medianas {sum(medians):.3f}s"
+            speedups = [r[f"{backend}_speedup"] for r in scenario_rows if r.get(f"{backend}_speedup")]
+            if speedups:
+                line += f", speedup medio frente a postgres {sum(speedups) / len(speedups):.2f}x"
+            print(line)
 
-        print(f"\n{scenario['name']}:")
-        print(f"  Queries exitosas (PostgreSQL): {sum(1 for r in scenario_results if r['postgresql_success'])}/{len(scenario_results)}")
-        print(f"  Queries exitosas (Parquet): {sum(1 for r in scenario_results if r['parquet_success'])}/{len(scenario_results)}")
 
-        if total_result:
-            print(f"  Tiempo total PostgreSQL: {total_result['postgresql_time_s']:.2f}s")
-            print(f"  Tiempo total Parquet: {total_result['parquet_time_s']:.2f}s")
-            if total_result['speedup']:
-                print(f"  Speedup general: {total_result['speedup']:.2f}x")
-
-        # Calcular speedup promedio de queries exitosas
-        successful_speedups = [
-            r['speedup'] for r in scenario_results
-            if r['speedup'] is not None and r['postgresql_success'] and r['parquet_success']
-        ]
-
-        if successful_speedups:
-            avg_speedup = sum(successful_speedups) / len(successful_speedups)
-            print(f"  Speedup promedio por query: {avg_speedup:.2f}x")
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark comparativo PostgreSQL / DuckDB sobre Parquet / DuckDB nativo")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=["postgres", "duckdb_parquet"],
+                        help="Backends a comparar (defecto: postgres duckdb_parquet)")
+    parser.add_argument("--scenario", dest="scenarios", action="append", type=Scenario.parse,
+                        help="Año o rango de años, repetible (e.g., 2005, 2005-2009). Defecto: 2005, 2005-2009, 2001-2010")
+    parser.add_argument("--queries", nargs="+", default=None, help="Consultas a ejecutar (e.g., Q1 Q4). Defecto: todas")
+    parser.add_argument("--warmup", type=int, default=1, help="Ejecuciones sin medir antes de cada consulta (defecto=1)")
+    parser.add_argument("--repetitions", type=int, default=5, help="Ejecuciones medidas por consulta (defecto=5)")
+    parser.add_argument("--cold", action="store_true",
+                        help="Mide también una ejecución en frío (conexión nueva y caché del SO vaciada si hay permisos)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Guarda el plan ejecutado (EXPLAIN ANALYZE / EXPLAIN (ANALYZE, BUFFERS)) en el JSON")
+    parser.add_argument("--output", default=str(Path(__file__).parent), help="Carpeta de resultados (defecto: scripts/)")
+
+    add_postgres_arguments(parser)
+
+    # DuckDB
+    parser.add_argument("--parquet", default="/Volumes/MV/carto/madno2Parquet", help="Raíz del árbol Parquet year=/month=")
+    parser.add_argument("--duckdb-file", default="",
+                        help="Base DuckDB de duckdb_native (defecto: <parquet>.duckdb, se crea si no existe o si el árbol ha cambiado)")
+    parser.add_argument("--threads", type=int, default=None, help="Hilos de DuckDB (defecto: los de DuckDB)")
+    parser.add_argument("--memory-limit", default=None, help="memory_limit de DuckDB (e.g., 8GB)")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios or DEFAULT_SCENARIOS
+    try:
+        queries = select_queries(args.queries)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.repetitions < 1:
+        parser.error("--repetitions debe ser >= 1")
+
+    print("=" * 80)
+    print("BENCHMARKING COMPARATIVO: " + " vs ".join(args.backends))
+    print("=" * 80)
+    print(f"Fecha de ejecución: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Escenarios: {', '.join(s.name for s in scenarios)}")
+    print(f"Consultas: {', '.join(q.id for q in queries)} (warm-up {args.warmup}, {args.repetitions} repeticiones)\n")
+
+    with ExitStack() as stack:
+        backends = build_backends(args, stack)
+        metadata = {'backends': [b.describe() for b in backends],
+                    'scenarios': [s.name for s in scenarios], 'queries': [q.id for q in queries],
+                    'warmup': args.warmup, 'repetitions': args.repetitions,
+                    'cold': args.cold, 'profile': args.profile}
+        current = {}
+
+        def on_result(result):
+            if current.get('scenario') != result['scenario']:
+                current['scenario'] = result['scenario']
+                print(f"\n{'#' * 80}\nESCENARIO: {result['scenario']}\n{'#' * 80}")
+            print_result(result)
+
+        results = run_suite(backends, scenarios, queries, args.warmup, args.repetitions, on_result,
+                            cold=args.cold, profile=args.profile)
+
+    os.makedirs(args.output, exist_ok=True)
+    path_base = os.path.join(args.output, f"benchmark_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    json_path, csv_path = write_results(results, path_base, metadata)
+
+    rows = comparison_rows(results)
+    comparison_path = f"{path_base}_comparison.csv"
+    fields = list(dict.fromkeys(k for r in rows for k in r))
+    with open(comparison_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
 
-    print(f"\n{'='*80}")
-    print(f"Resultados guardados en: {csv_filename}")
-    print(f"{'='*80}")
+    print_summary(rows, args.backends, scenarios)
+    print(f"\n{'=' * 80}")
+    print(f"Resultados guardados en: {json_path}, {csv_path}, {comparison_path}")
+    print(f"{'=' * 80}")
+    if any(r['error'] for r in results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -308,7 +226,3 @@ if __name__ == "__main__":
         main()
     except KeyboardInterrupt:
         print("\n\nInterrumpido por el usuario")
-    except Exception as e:
-        print(f"\n❌ Error crítico: {e}")
-        import traceback
-        traceback.print_exc()
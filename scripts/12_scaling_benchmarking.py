@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Barrido de escalado: resolución H3 × ventana temporal × clientes concurrentes, para PostgreSQL y
+DuckDB (Parquet o base nativa). Complementa a 12_comparative_benchmarking.py, que solo varía el
+rango de años con un único cliente.
+
+Cada punto del barrido (backend, resolución, escenario, clientes) es una prueba de carga en bucle
+cerrado (functions_benchmark.run_concurrent): N clientes lanzan sin pausa las consultas de --queries
+(por defecto las del panel de análisis del visor) durante --duration segundos. Se mide:
+    throughput_qps           consultas completadas por segundo entre todos los clientes
+    p50_s, p95_s, p99_s      latencia de cada consulta vista por el cliente (con la cola de espera)
+
+Cada resolución es un dataset distinto: --parquet y --table son plantillas con {res}
+(por defecto /Volumes/MV/carto/madno2Synthetic_r{res} y h3_points_r{res}). Con --generate se
+crean con 07_generate_synthetic_dataset.py los meses que falten para cubrir todos los escenarios
+y, si hay backends de PostgreSQL, se cargan en la tabla de cada resolución.
+
+Salida en <output>/scaling_results_<fecha>:
+    .json          metadatos y todos los puntos con las latencias de cada consulta
+    .csv           una fila por punto (curvas throughput/latencia frente a clientes)
+    _queries.csv   una fila por punto y consulta
+    _throughput.png, _latency.png   curvas por escenario (si matplotlib está instalado)
+
+Uso:
+    # res 8, 9 y 10, 1 y 5 años, 1/4/16 clientes, sobre datos sintéticos y PostgreSQL en Docker
+    python3 scripts/12_scaling_benchmarking.py --generate --res 8 9 10 --scenario 2005 --scenario 2005-2009 \\
+        --parquet /tmp/madno2Synthetic_r{res} --host localhost --port 55432 --dbname postgres \\
+        --user postgres --password bench --schema madno
+
+    # Solo DuckDB sobre el árbol real (res 9), 60 s por punto
+    python3 scripts/12_scaling_benchmarking.py --backends duckdb_parquet duckdb_native --res 9 \\
+        --parquet /Volumes/MV/carto/madno2Parquet --duration 60
+"""
+import argparse
+import csv
+import glob
+import importlib
+import json
+import os
+import sys
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+
+import pyarrow.parquet as pq
+
+from functions_benchmark import (BACKENDS, DuckDBNativeBackend, DuckDBParquetBackend, PostgresBackend,
+                                 PostgresRollupBackend, run_concurrent)
+from functions_benchmark_queries import Scenario, select_queries
+from functions_parquet import ParquetWriteOptions, iter_partitions
+
+comparative = importlib.import_module("12_comparative_benchmarking")
+
+# Consultas del panel de análisis: serie mensual, ranking de celdas, un día y patrón horario
+PANEL_QUERIES = ['Q2', 'Q4', 'Q5', 'Q8']
+DEFAULT_SCENARIOS = ['2005', '2005-2009']
+DEFAULT_CLIENTS = [1, 4, 16]
+
+POINT_FIELDS = ['backend', 'h3_res', 'scenario', 'year_from', 'year_to', 'rows', 'clients', 'duration_s',
+                'wall_s', 'completed', 'errors', 'throughput_qps', 'p50_s', 'p95_s', 'p99_s', 'mean_s', 'max_s',
+                'error']
+QUERY_FIELDS = ['backend', 'h3_res', 'scenario', 'clients', 'query', 'n', 'p50_s', 'p95_s', 'p99_s',
+                'mean_s', 'max_s']
+
+
+def dataset_rows(root, scenario):
+    """Filas del árbol Parquet en la ventana del escenario (de los metadatos, sin leer datos)."""
+    if not root or not os.path.isdir(root):
+        return None
+    return sum(pq.ParquetFile(f).metadata.num_rows
+               for year, _, month_dir in iter_partitions(root) if scenario.year_from <= int(year) <= scenario.year_to
+               for f in glob.glob(os.path.join(month_dir, '*.parquet')))
+
+
+def ensure_dataset(args, res, root, table, scenarios):
+    """Genera los meses sintéticos que falten y, si hace falta, los carga en PostgreSQL."""
+    synthetic = importlib.import_module("07_generate_synthetic_dataset")
+    years = sorted({y for s in scenarios for y in range(s.year_from, s.year_to + 1)})
+    months = [(y, m) for y in years for m in range(1, 13)]
+    n_cells = synthetic.SyntheticNO2(res, args.seed).n_cells
+    print(f"Dataset res {res} ({n_cells} celdas) en {root}: años {years[0]}-{years[-1]}")
+    os.makedirs(root, exist_ok=True)
+    t0 = time.time()
+    rows = synthetic.generate(root, months, res, args.seed, ParquetWriteOptions(), args.workers)
+    synthetic.write_metadata(root, res, args.seed, months, n_cells, rows, time.time() - t0)
+    if any(b.startswith('postgres') for b in args.backends):
+        if args.use_ssh_tunnel:
+            print("[WARN] --generate no carga a través de túnel SSH; carga la tabla con 07_generate_synthetic_dataset.py",
+                  file=sys.stderr)
+            return
+        # Modo upsert con checkpoints: relanzar solo carga los meses nuevos
+        synthetic.load_postgres(root, {y for y, _ in months}, args.host, args.port, args.dbname, args.user,
+                                args.password, args.schema, table)
+
+
+def open_backends(args, stack, host, port, root, table):
+    backends = []
+    for name in args.backends:
+        if name == 'postgres':
+            backend = PostgresBackend(host, port, args.dbname, args.user, args.password, args.schema, table)
+        elif name == 'postgres_rollup':
+            backend = PostgresRollupBackend(host, port, args.dbname, args.user, args.password, args.schema, table)
+        elif name == 'duckdb_parquet':
+            backend = DuckDBParquetBackend(root, args.threads, args.memory_limit)
+        else:
+            path = os.path.normpath(root) + '.duckdb'
+            backend = DuckDBNativeBackend(path, 'h3_points', root, args.threads, args.memory_limit)
+        backends.append(stack.enter_context(backend))
+    return backends
+
+
+def print_point(point):
+    prefix = f"  [{point['backend']}] res {point['h3_res']}, {point['scenario']}, {point['clients']:>2} clientes"
+    if not point['completed']:
+        print(f"{prefix}: FAILED - {point['error'] or 'ninguna consulta completada'}")
+        return
+    print(f"{prefix}: {point['throughput_qps']:.2f} consultas/s ({point['completed']} en {point['wall_s']:.1f}s), "
+          f"p50 {point['p50_s']:.3f}s, p95 {point['p95_s']:.3f}s, p99 {point['p99_s']:.3f}s")
+    if point['error']:
+        print(f"      {point['errors']} clientes con error: {point['error']}")
+
+
+def write_outputs(points, path_base, metadata):
+    json_path = f"{path_base}.json"
+    metadata = {**metadata, 'created': datetime.now().isoformat(timespec='seconds')}
+    with open(json_path, 'w') as f:
+        json.dump({'metadata': metadata, 'points': points}, f, indent=2, default=str)
+    csv_path = f"{path_base}.csv"
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=POINT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(points)
+    queries_path = f"{path_base}_queries.csv"
+    with open(queries_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=QUERY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for point in points:
+            for query_id, stats in point['per_query'].items():
+                writer.writerow({**point, **stats, 'query': query_id})
+    return [json_path, csv_path, queries_path]
+
+
+def plot_curves(points, path_base):
+    """Throughput y latencia p95 frente a clientes: un panel por escenario, una línea por backend y resolución."""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib no está instalado: no se generan las gráficas (los CSV tienen los mismos datos)")
+        return []
+    scenarios = list(dict.fromkeys(p['scenario'] for p in points))
+    series = list(dict.fromkeys((p['backend'], p['h3_res']) for p in points))
+    paths = []
+    for metric, label, suffix, log in (('throughput_qps', 'consultas/s', 'throughput', False),
+                                       ('p95_s', 'latencia p95 (s)', 'latency', True)):
+        fig, axes = plt.subplots(1, len(scenarios), figsize=(5 * len(scenarios), 4), squeeze=False)
+        for ax, scenario in zip(axes[0], scenarios):
+            for backend, res in series:
+                curve = sorted((p['clients'], p[metric]) for p in points
+                               if (p['backend'], p['h3_res'], p['scenario']) == (backend, res, scenario)
+                               and p[metric] is not None)
+                if curve:
+                    ax.plot(*zip(*curve), marker='o', label=f"{backend} r{res}")
+            ax.set_title(scenario)
+            ax.set_xlabel('clientes')
+            ax.set_ylabel(label)
+            ax.set_xscale('log', base=2)
+            if log:
+                ax.set_yscale('log')
+            ax.grid(True, alpha=0.3)
+        axes[0][-1].legend(fontsize='small')
+        fig.tight_layout()
+        path = f"{path_base}_{suffix}.png"
+        fig.savefig(path, dpi=120)
+        plt.close(fig)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Barrido de escalado: resolución H3 × años × clientes concurrentes")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=["postgres", "duckdb_parquet"],
+                        help="Backends a comparar (defecto: postgres duckdb_parquet)")
+    parser.add_argument("--res", nargs="+", type=int, default=[9], help="Resoluciones H3 (defecto: 9)")
+    parser.add_argument("--scenario", dest="scenarios", action="append", type=Scenario.parse,
+                        help=f"Año o rango de años, repetible (defecto: {', '.join(DEFAULT_SCENARIOS)})")
+    parser.add_argument("--clients", nargs="+", type=int, default=DEFAULT_CLIENTS,
+                        help=f"Clientes concurrentes (defecto: {' '.join(map(str, DEFAULT_CLIENTS))})")
+    parser.add_argument("--queries", nargs="+", default=PANEL_QUERIES,
+                        help=f"Mezcla de consultas (defecto: {' '.join(PANEL_QUERIES)})")
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos de carga por punto (defecto=30)")
+    parser.add_argument("--warmup", type=int, default=1, help="Ejecuciones sin medir de cada consulta por punto (defecto=1)")
+    parser.add_argument("--output", default=str(Path(__file__).parent), help="Carpeta de resultados (defecto: scripts/)")
+    parser.add_argument("--parquet", default="/Volumes/MV/carto/madno2Synthetic_r{res}",
+                        help="Raíz Parquet de cada resolución; {res} se sustituye (defecto: /Volumes/MV/carto/madno2Synthetic_r{res})")
+    parser.add_argument("--threads", type=int, default=None, help="Hilos de DuckDB (compartidos por todos los clientes)")
+    parser.add_argument("--memory-limit", default=None, help="memory_limit de DuckDB (e.g., 8GB)")
+    parser.add_argument("--generate", action="store_true",
+                        help="Genera (y carga en PostgreSQL) los datos sintéticos que falten para cada resolución")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla de --generate (defecto=42)")
+    parser.add_argument("--workers", type=int, default=4, help="Meses generados en paralelo con --generate (defecto=4)")
+    comparative.add_postgres_arguments(parser)
+    parser.set_defaults(table="h3_points_r{res}")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios or [Scenario.parse(s) for s in DEFAULT_SCENARIOS]
+    try:
+        queries = select_queries(args.queries)
+    except ValueError as e:
+        parser.error(str(e))
+    if min(args.clients) < 1 or args.duration <= 0:
+        parser.error("--clients debe ser >= 1 y --duration > 0")
+
+    print("=" * 80)
+    print("BARRIDO DE ESCALADO: " + " vs ".join(args.backends))
+    print("=" * 80)
+    print(f"Resoluciones: {args.res}; escenarios: {', '.join(s.name for s in scenarios)}; clientes: {args.clients}")
+    print(f"Consultas: {', '.join(q.id for q in queries)}; {args.duration:.0f}s por punto\n")
+
+    points = []
+    with ExitStack() as tunnel:
+        needs_postgres = any(b.startswith('postgres') for b in args.backends)
+        host, port = tunnel.enter_context(comparative.postgres_endpoint(args)) if needs_postgres else (None, None)
+        for res in args.res:
+            root, table = args.parquet.format(res=res), args.table.format(res=res)
+            if args.generate:
+                ensure_dataset(args, res, root, table, scenarios)
+            print(f"\n{'#' * 80}\nRESOLUCIÓN {res}: {root} / {args.schema}.{table}\n{'#' * 80}")
+            with ExitStack() as stack:
+                backends = open_backends(args, stack, host, port, root, table)
+                for scenario in scenarios:
+                    rows = dataset_rows(root, scenario)
+                    for backend in backends:
+                        statements = [(q.id, backend.query_sql(q, scenario)) for q in queries]
+                        statements = [(q, sql) for q, sql in statements if sql is not None]
+                        if not statements:
+                            continue
+                        for clients in args.clients:
+                            point = {'backend': backend.name, 'h3_res': res, 'scenario': scenario.name,
+                                     'year_from': scenario.year_from, 'year_to': scenario.year_to, 'rows': rows,
+                                     'duration_s': args.duration, 'queries': [q for q, _ in statements]}
+                            try:
+                                point.update(run_concurrent(backend, statements, clients, args.duration, args.warmup))
+                            except Exception as e:
+                                point.update({'clients': clients, 'completed': 0, 'errors': 1,
+                                              'error': str(e).strip(), 'per_query': {}})
+                            points.append(point)
+                            print_point(point)
+
+    os.makedirs(args.output, exist_ok=True)
+    path_base = os.path.join(args.output, f"scaling_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    metadata = {'backends': args.backends, 'h3_res': args.res, 'scenarios': [s.name for s in scenarios],
+                'clients': args.clients, 'queries': [q.id for q in queries], 'duration_s': args.duration,
+                'warmup': args.warmup, 'parquet': args.parquet, 'table': f"{args.schema}.{args.table}",
+                'threads': args.threads, 'cpu_count': os.cpu_count()}
+    paths = write_outputs(points, path_base, metadata) + plot_curves(points, path_base)
+    print(f"\n{'=' * 80}")
+    print("Resultados guardados en: " + ", ".join(paths))
+    print(f"{'=' * 80}")
+    if any(p['error'] for p in points):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nInterrumpido por el usuario")
@@ -0,0 +1,166 @@
+"""
+Interpolación por kriging ordinario sobre celdas H3 dentro del convex hull de las estaciones.
+
+Funciones reutilizables extraídas de 03_export_h3_points_convexhull_krigging.py para que
+puedan llamarse en bucle desde el batch (04_batch_export_year.py) sin lanzar un intérprete
+nuevo por cada hora.
+
+El sistema de kriging se factoriza una vez por conjunto de estaciones (functions_interpolation) y
+las horas de un día con las mismas estaciones se resuelven juntas (interpolate_day). El método de
+interpolación (kriging, rbf, idw, nearest) se elige por nombre del registro de functions_interpolation.
+"""
+from functions_03_convexhull import *
+import os
+import geopandas as gpd
+
+from functions_h3cover import cell_polygons, get_cover_cache
+from functions_interpolation import get_solver_cache
+
+# --- Paths (relativos a la raíz del proyecto) ---
+ESTACIONES_XLS = 'informacion_estaciones_red_calidad_aire.xls'
+AIR_DATA_H5 = 'madno2-viewer/public/data/air_quality.h5'
+
+# Tratamiento de puntos en el borde del BBOX
+INCLUDE_EDGE_POINTS = True  # True: incluye estaciones justo en el borde del BBOX
+
+# BBOX en WGS84 (lon, lat). Orden: SW, NW, NE, SE y cierre (mismo que en 02)
+BBOX_WGS84_COORDS = [
+    (-3.784316, 40.337678),  # SW
+    (-3.786519, 40.526999),  # NW
+    (-3.568662, 40.528276),  # NE
+    (-3.567069, 40.338947),  # SE
+    (-3.784316, 40.337678),  # cierre
+]
+
+
+def _stations_in_bbox(df):
+    """Estaciones de df dentro del BBOX, ordenadas por código, con sus coordenadas EPSG:3857."""
+    bbox_poly_wgs84 = Polygon(BBOX_WGS84_COORDS)
+    gdf = gpd.GeoDataFrame(df.copy(), geometry=gpd.points_from_xy(df.lon, df.lat), crs="EPSG:4326")
+    if INCLUDE_EDGE_POINTS:
+        mask_pts = gdf.geometry.within(bbox_poly_wgs84) | gdf.geometry.touches(bbox_poly_wgs84)
+    else:
+        mask_pts = gdf.geometry.within(bbox_poly_wgs84)
+    gdf = gdf[mask_pts].sort_values('sta')
+    if len(gdf) < 3:
+        raise ValueError("Hay menos de 3 estaciones dentro del BBOX: la interpolación RBF sería inestable.")
+
+    wgs84_to_3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+    xs, ys = wgs84_to_3857.transform(gdf['lon'].values, gdf['lat'].values)
+    return gdf, np.asarray(xs), np.asarray(ys)
+
+
+def interpolate_day(frames, year, month, day, h3_res, method='kriging', options=None,
+                    cover_cache=None, solver_cache=None):
+    """Interpola varias horas de un día agrupándolas por conjunto de estaciones.
+
+    frames: {hora: DataFrame con columnas sta, z, lon, lat}. method es un nombre de
+    functions_interpolation.INTERPOLATORS ('kriging', 'rbf', 'idw', 'nearest') y options sus
+    parámetros. Las horas con las mismas estaciones comparten celdas H3, matriz estación -> celda
+    y factorización, y se resuelven con un solo producto matriz-matriz.
+    Devuelve {hora: (DataFrame h3_index, datetime, value; CellCover)} o {hora: excepción} si esa hora falla.
+    """
+    options = options or {}
+    cover_cache = cover_cache or get_cover_cache()
+    solver_cache = solver_cache or get_solver_cache()
+
+    results, groups = {}, {}
+    for hour, df in frames.items():
+        try:
+            gdf, xs, ys = _stations_in_bbox(df)
+        except Exception as e:
+            results[hour] = e
+            continue
+        codes = tuple(int(c) for c in gdf['sta'])
+        groups.setdefault(codes, []).append((hour, gdf, xs, ys))
+
+    for codes, items in groups.items():
+        hours = [it[0] for it in items]
+        try:
+            # --- H3 cells within convex hull of stations (cacheadas por conjunto de estaciones) ---
+            _, gdf, xs, ys = items[0]
+            cover = cover_cache.get(gdf, h3_res)
+            logging.info(f"Using {len(cover)} H3 cells at res {h3_res} inside stations convex hull "
+                         f"({len(hours)} hour(s) with the same {len(codes)} stations).")
+
+            # --- Interpolator (in EPSG:3857) con la factorización cacheada ---
+            solver = solver_cache.get(method, codes, xs, ys, cover, h3_res, **options)
+            Z = np.column_stack([it[1]['z'].to_numpy(dtype=np.float64) for it in items])
+            preds = solver.predict_many(Z)
+        except Exception as e:
+            for hour in hours:
+                results[hour] = e
+            continue
+
+        for hour, pred in zip(hours, preds):
+            # Clip valores negativos (no deberían existir)
+            pred = np.clip(pred, 0, None)
+
+            # --- Build output DataFrame ---
+            dt_str = f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:00:00"
+            out_df = pd.DataFrame({
+                'h3_index': cover.cells,
+                'datetime': dt_str,
+                'value': np.round(pred, 3)
+            })
+            results[hour] = (out_df, cover)
+    return results
+
+
+def interpolate_hour(df, year, month, day, hour, h3_res, method='kriging', options=None,
+                     cover_cache=None, solver_cache=None):
+    """Interpola los valores de estación de una hora sobre las celdas H3 del convex hull.
+
+    df: DataFrame con columnas sta, z, lon, lat (salida de get_points_df / MonthReader.points).
+    cover_cache / solver_cache: cachés de celdas H3 y de solvers (por defecto las del proceso).
+    Devuelve (DataFrame con columnas h3_index, datetime, value; CellCover de la hora).
+    """
+    result = interpolate_day({hour: df}, year, month, day, h3_res, method, options,
+                             cover_cache, solver_cache)[hour]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def interpolate_hour_krigging(df, year, month, day, hour, h3_res, cover_cache=None, solver_cache=None):
+    """interpolate_hour con kriging ordinario (variograma lineal), el método del script 03 krigging."""
+    return interpolate_hour(df, year, month, day, hour, h3_res, 'kriging', {'variogram_model': 'linear'},
+                            cover_cache, solver_cache)
+
+
+def save_h3_outputs(out_df, output, output_geojson='', cover=None):
+    """Guarda el resultado de una hora como CSV y GeoJSON con los polígonos de los hexágonos.
+
+    Si output_geojson está vacío se deriva de la ruta del CSV. Con la CellCover de la hora se
+    reutilizan sus polígonos cacheados. Un fallo al escribir el GeoJSON solo se registra como
+    warning (igual que en el script 03).
+    """
+    # --- Save CSV ---
+    os.makedirs(os.path.dirname(output), exist_ok=True) if os.path.dirname(output) else None
+    out_df.to_csv(output, index=False)
+    logging.info(f"CSV saved to {os.path.abspath(output)} (rows: {len(out_df)})")
+
+    # --- Save GeoJSON with hexagon polygons ---
+    try:
+        # Derive GeoJSON path if not provided
+        if output_geojson:
+            geojson_path = output_geojson
+        else:
+            base, _ = os.path.splitext(output)
+            geojson_path = base + '.geojson'
+
+        # Polygon geometries for each H3 cell
+        cells_list = out_df['h3_index'].tolist()
+        if cover is not None and cover.cells == cells_list:
+            polys = cover.polygons()
+        else:
+            polys = cell_polygons(cells_list)
+
+        gdf_out = gpd.GeoDataFrame(out_df.copy(), geometry=polys, crs='EPSG:4326')
+        # Ensure parent folder exists
+        if os.path.dirname(geojson_path):
+            os.makedirs(os.path.dirname(geojson_path), exist_ok=True)
+        gdf_out.to_file(geojson_path, driver='GeoJSON')
+        logging.info(f"GeoJSON saved to {os.path.abspath(geojson_path)} (features: {len(gdf_out)})")
+    except Exception as e:
+        logging.warning(f"WARNING: Failed to write GeoJSON: {e}")
@@ -0,0 +1,150 @@
+"""
+Niveles de agregados derivados del árbol Parquet horario (year=YYYY/month=MM).
+
+Las consultas analíticas (perfil horario, día de la semana, estacional, medias por celda) no
+necesitan las filas horarias: basta con agregados por celda que ocupan kilobytes. Este módulo los
+calcula mes a mes con DuckDB y los escribe junto al árbol horario, en un árbol hermano
+<raíz>_agg (fuera de la raíz para que los globs '<raíz>/**/*.parquet' no los mezclen):
+
+    <raíz>_agg/daily/year=YYYY/month=MM/data.parquet        h3_index, date, n, mean, min, max, p98
+    <raíz>_agg/monthly/year=YYYY/month=MM/data.parquet      h3_index, n, sum, sum_sq, mean, std, min, max, p98
+    <raíz>_agg/hour_of_day/year=YYYY/month=MM/data.parquet  h3_index, hour, n, sum, mean, max
+    <raíz>_agg/day_of_week/year=YYYY/month=MM/data.parquet  h3_index, dow, n, sum, mean, max
+
+Los agregados son del mes natural, que es el contenido de su partición (cada fila está en la
+partición del mes de su datetime, también la H24 del último día del mes anterior, que es las
+00:00 del día 1). dow sigue EXTRACT(DOW) (0 = domingo).
+
+n y sum permiten combinar meses de forma exacta: el perfil horario de un año es
+SUM(sum) / SUM(n) agrupando por (h3_index, hour) sobre sus doce particiones; la desviación
+típica mensual combinada sale de n, sum y sum_sq. p98, min y max son del propio mes o día.
+
+refresh_aggregates() lleva un manifiesto (<raíz>_agg/_manifest.json, functions_parquet.PartitionManifest)
+con las huellas de los ficheros de origen de cada mes y solo recalcula los meses cuyo origen cambió.
+
+Uso:
+    from functions_aggregates import refresh_aggregates
+    refresh_aggregates('/Volumes/MV/carto/madno2Parquet')
+"""
+import glob
+import os
+from datetime import datetime
+
+import duckdb
+
+from functions_parquet import PartitionManifest, iter_partitions, partition_dir, write_table_atomic
+
+AGGREGATE_SUFFIX = '_agg'
+
+# nivel -> (SELECT sobre la vista src, orden de escritura)
+AGGREGATE_TIERS = {
+    'daily': ("""
+        SELECT h3_index, CAST(datetime AS DATE) AS date,
+               CAST(count(*) AS INTEGER) AS n,
+               avg(value) AS mean, min(value) AS min, max(value) AS max,
+               quantile_cont(value, 0.98) AS p98
+        FROM src GROUP BY ALL
+    """, ['h3_index', 'date']),
+    'monthly': ("""
+        SELECT h3_index,
+               CAST(count(*) AS INTEGER) AS n,
+               sum(value) AS sum, sum(value * value) AS sum_sq,
+               avg(value) AS mean, stddev_samp(value) AS std,
+               min(value) AS min, max(value) AS max,
+               quantile_cont(value, 0.98) AS p98
+        FROM src GROUP BY ALL
+    """, ['h3_index']),
+    'hour_of_day': ("""
+        SELECT h3_index, CAST(hour(datetime) AS TINYINT) AS hour,
+               CAST(count(*) AS INTEGER) AS n,
+               sum(value) AS sum, avg(value) AS mean, max(value) AS max
+        FROM src GROUP BY ALL
+    """, ['h3_index', 'hour']),
+    'day_of_week': ("""
+        SELECT h3_index, CAST(dayofweek(datetime) AS TINYINT) AS dow,
+               CAST(count(*) AS INTEGER) AS n,
+               sum(value) AS sum, avg(value) AS mean, max(value) AS max
+        FROM src GROUP BY ALL
+    """, ['h3_index', 'dow']),
+}
+
+
+def aggregate_root(parquet_root):
+    """Raíz del árbol de agregados de un árbol horario: <raíz>_agg."""
+    return os.path.normpath(parquet_root) + AGGREGATE_SUFFIX
+
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_sources(parquet_root, year, month):
+    """Ficheros Parquet con filas del mes natural (los de su partición)."""
+    return sorted(glob.glob(os.path.join(partition_dir(parquet_root, year, month), '*.parquet')))
+
+
+def build_month_aggregates(conn, parquet_root, agg_root, year, month, tiers=None):
+    """Calcula y escribe los niveles de un mes. Devuelve {nivel: filas} ({} si el mes no tiene datos)."""
+    files = month_sources(parquet_root, year, month)
+    if not files:
+        return {}
+    start = datetime(year, month, 1)
+    end = datetime(*_next_month(year, month), 1)
+    file_list = ', '.join(f"'{f}'" for f in files)
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP VIEW src AS
+        SELECT h3_index, datetime, CAST(value AS DOUBLE) AS value
+        FROM read_parquet([{file_list}], hive_partitioning = false, union_by_name = true)
+        WHERE datetime >= TIMESTAMP '{start}' AND datetime < TIMESTAMP '{end}'
+    """)
+    rows = {}
+    for tier in tiers or AGGREGATE_TIERS:
+        sql, order = AGGREGATE_TIERS[tier]
+        table = conn.execute(sql).fetch_arrow_table()
+        if not table.num_rows:
+            continue
+        table = table.sort_by([(col, 'ascending') for col in order])
+        path = os.path.join(partition_dir(os.path.join(agg_root, tier), year, month), 'data.parquet')
+        write_table_atomic(table, path, compression='zstd')
+        rows[tier] = table.num_rows
+    return rows
+
+
+def refresh_aggregates(parquet_root, agg_root=None, months=None, force=False, tiers=None, verbose=True):
+    """Recalcula los agregados de los meses cuyo origen cambió desde la última vez.
+
+    months: lista opcional de (year, month) a considerar (por defecto, todas las particiones).
+    Devuelve la lista de (year, month) recalculados.
+    """
+    agg_root = agg_root or aggregate_root(parquet_root)
+    manifest = PartitionManifest(agg_root)
+    tiers = list(tiers or AGGREGATE_TIERS)
+    settings = {'tiers': tiers}
+
+    if months is None:
+        months = [(int(y), int(m)) for y, m, _ in iter_partitions(parquet_root)]
+    refreshed = []
+    conn = duckdb.connect()
+    try:
+        for year, month in sorted(set(months)):
+            key = manifest.key(year, month)
+            files = month_sources(parquet_root, year, month)
+            inputs = manifest.fingerprint_inputs(key, files, base=parquet_root)
+            if not files:
+                manifest.forget(key)
+                continue
+            if not force and manifest.is_current(key, inputs, settings):
+                continue
+            rows = build_month_aggregates(conn, parquet_root, agg_root, year, month, tiers)
+            if not rows:
+                manifest.forget(key)
+                continue
+            output = os.path.join(partition_dir(os.path.join(agg_root, next(iter(rows))), year, month), 'data.parquet')
+            manifest.record(key, inputs, settings, output, rows=rows)
+            manifest.save()
+            refreshed.append((year, month))
+            if verbose:
+                print(f"  Agregados {year}-{month:02d}: " + ", ".join(f"{t}={n:,}" for t, n in rows.items()))
+    finally:
+        conn.close()
+    return refreshed
@@ -0,0 +1,279 @@
+"""
+Lectura de los datos horarios de calidad del aire (air_quality.h5).
+
+El HDF5 guarda una tabla por mes (/yYYYY/mmm_moYY) en formato ancho de Madrid: una fila por
+estación, día y magnitud con columnas H01..H24 / V01..V24. MonthReader carga cada mes una sola
+vez, lo filtra por MAGNITUD, lo indexa por timestamp y mantiene los últimos N meses en memoria
+(LRU), de modo que consultar una hora es una búsqueda en un índice ordenado en lugar de abrir
+el HDF5 de nuevo.
+
+build_cube / AirQualityCube precalculan además un cubo denso float32 (horas x estaciones) por
+magnitud en ficheros .npy mapeables en memoria, para leer rangos de horas sin pandas.
+"""
+import json
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Helper dictionary from read_atmospheric_var.py
+month_num = {1:'ene', 2:'feb', 3:'mar', 4:'abr', 5:'may', 6:'jun', 7:'jul', 8:'ago', 9:'sep', 10:'oct', 11:'nov', 12:'dic'}
+
+HOUR_COLS = [f'H{h:02d}' for h in range(1, 25)]
+VALID_COLS = [f'V{h:02d}' for h in range(1, 25)]
+
+
+def month_key(year, month):
+    """Clave HDF5 de la tabla de un mes, p.ej. /y2024/ago_mo24."""
+    return f'/y{year}/{month_num[month]}_mo{str(year)[-2:]}'
+
+
+def read_month_df(airquality_hdf, year, month):
+    """Reads the whole /yYYYY/mmm_moYY table of the HDF5 store (one month, all stations and variables)."""
+    df_label = month_key(year, month)
+
+    logging.info(f"Reading atmospheric data from {airquality_hdf} for key: {df_label}...")
+    with pd.HDFStore(airquality_hdf, mode='r') as store:
+        if df_label not in store.keys():
+            raise KeyError(f"Data key '{df_label}' not found in HDF5 file.")
+        return store.get(df_label)
+
+
+def shift_hour_zero(year, month, day, hour):
+    """La hora 0 de un día es la H24 del día anterior en el formato de Madrid."""
+    if hour == 0:
+        # Madrid database format is broken
+        new_dt = datetime(year, month, day, hour) - timedelta(days=1)
+        return new_dt.year, new_dt.month, new_dt.day, 24
+    return year, month, day, hour
+
+
+class MonthReader:
+    """Lector de meses del HDF5 con caché LRU en memoria.
+
+    Cada entrada de la caché es la tabla de un (año, mes, magnitud) ya filtrada por MAGNITUD
+    y ordenada/indexada por timestamp, con solo las columnas ESTACION y H01..H24.
+    """
+
+    def __init__(self, airquality_hdf, max_months=3):
+        self.airquality_hdf = airquality_hdf
+        self.max_months = max(1, int(max_months))
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def month_table(self, year, month, var):
+        """Tabla del mes filtrada por magnitud e indexada por timestamp (KeyError si no existe)."""
+        key = (year, month, var)
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            table = self._cache[key]
+        else:
+            self.misses += 1
+            try:
+                df = read_month_df(self.airquality_hdf, year, month)
+                table = (df.loc[df['MAGNITUD'] == var, ['timestamp', 'ESTACION'] + HOUR_COLS]
+                           .set_index('timestamp')
+                           .sort_index())
+            except KeyError:
+                # Se cachea también la ausencia para no reabrir el HDF5 en cada hora
+                table = None
+            self._cache[key] = table
+            while len(self._cache) > self.max_months:
+                self._cache.popitem(last=False)
+
+        if table is None:
+            raise KeyError(f"Data key '{month_key(year, month)}' not found in HDF5 file.")
+        return table
+
+    def day_rows(self, year, month, day, var):
+        """Filas (una por estación) de un día concreto."""
+        table = self.month_table(year, month, var)
+        timestamp = datetime(year=year, month=month, day=day).isoformat()
+        start = table.index.searchsorted(timestamp, side='left')
+        stop = table.index.searchsorted(timestamp, side='right')
+        return table.iloc[start:stop]
+
+    def points(self, year, month, day, hour, var, stations):
+        """Valores de estación de una hora (0-24) como DataFrame sta, z, lon, lat.
+
+        stations es la StationTable de functions_stations.load_station_table.
+        """
+        year, month, day, hour = shift_hour_zero(year, month, day, hour)
+        hour_col = f'H{hour:02d}'
+        rows = self.day_rows(year, month, day, var)[['ESTACION', hour_col]].dropna()
+
+        points_df = pd.DataFrame()
+        points_df['sta'] = rows['ESTACION'].values
+        points_df['z'] = rows[hour_col].values
+        points_df['lon'], points_df['lat'] = stations.lonlat(points_df['sta'].values)
+
+        return points_df.dropna(subset=['lon', 'lat', 'z'])
+
+    def clear(self):
+        self._cache.clear()
+
+
+# Lectores compartidos por ruta de HDF5 (para get_points_df y llamadas sueltas)
+_READERS = {}
+
+
+def get_month_reader(airquality_hdf, max_months=3):
+    """Devuelve el MonthReader compartido del proceso para un HDF5."""
+    reader = _READERS.get(airquality_hdf)
+    if reader is None:
+        reader = _READERS[airquality_hdf] = MonthReader(airquality_hdf, max_months=max_months)
+    return reader
+
+
+# -----------------------------------------------------------
+# Cubo denso estación x hora (memmap .npy)
+#
+# Estructura de cube_dir:
+#   meta.json                   epoch, n_hours, códigos de estación, magnitudes, firma del HDF5
+#   mag{MM}_values.npy          float32 (n_hours, n_stations), NaN si no hay dato
+#   mag{MM}_valid.npy           bool    (n_hours, n_stations), True si V{hh} == 'V'
+#
+# La fila t corresponde a epoch + t horas. La columna Hk del día d es la hora d + k
+# (H24 = 00:00 del día siguiente, igual que en los CSV exportados).
+
+CUBE_EPOCH = datetime(2001, 1, 1)
+CUBE_META = 'meta.json'
+
+
+def list_month_keys(airquality_hdf):
+    """[(year, month, key)] de todas las tablas de mes del HDF5, ordenadas."""
+    num_month = {v: k for k, v in month_num.items()}
+    out = []
+    with pd.HDFStore(airquality_hdf, mode='r') as store:
+        for key in store.keys():
+            parts = key.strip('/').split('/')
+            if len(parts) != 2 or not parts[0].startswith('y'):
+                continue
+            mon = parts[1].split('_')[0]
+            if mon in num_month and parts[0][1:].isdigit():
+                out.append((int(parts[0][1:]), num_month[mon], key))
+    return sorted(out)
+
+
+def cube_paths(cube_dir, var):
+    return (os.path.join(cube_dir, f'mag{var:02d}_values.npy'),
+            os.path.join(cube_dir, f'mag{var:02d}_valid.npy'))
+
+
+def build_cube(airquality_hdf, cube_dir, magnitudes, epoch=CUBE_EPOCH):
+    """Convierte el HDF5 en un cubo float32 (horas desde epoch, estaciones) por magnitud.
+
+    Se recorre el HDF5 mes a mes escribiendo directamente sobre memmaps, así que la memoria
+    usada es la de un mes. Devuelve el diccionario de metadatos guardado en meta.json.
+    """
+    months = list_month_keys(airquality_hdf)
+    if not months:
+        raise KeyError(f"No month tables found in {airquality_hdf}")
+
+    # Eje de estaciones: todos los códigos presentes en el HDF5 (también estaciones ya dadas de baja)
+    codes = set()
+    with pd.HDFStore(airquality_hdf, mode='r') as store:
+        for _, _, key in months:
+            codes.update(store.select(key, columns=['ESTACION'])['ESTACION'].unique().tolist())
+    codes = np.array(sorted(int(c) for c in codes), dtype=np.int32)
+
+    last_year, last_month, _ = months[-1]
+    end = datetime(last_year + (last_month == 12), last_month % 12 + 1, 1)
+    n_hours = int((end - epoch).total_seconds() // 3600) + 1  # +1: H24 del último día
+
+    os.makedirs(cube_dir, exist_ok=True)
+    values, valids = {}, {}
+    for var in magnitudes:
+        values_path, valid_path = cube_paths(cube_dir, var)
+        values[var] = np.lib.format.open_memmap(values_path, mode='w+', dtype=np.float32, shape=(n_hours, len(codes)))
+        values[var][:] = np.nan
+        valids[var] = np.lib.format.open_memmap(valid_path, mode='w+', dtype=np.bool_, shape=(n_hours, len(codes)))
+
+    hour_offsets = np.arange(1, 25, dtype=np.int64)
+    for year, month, key in months:
+        df = read_month_df(airquality_hdf, year, month)
+        df = df[df['MAGNITUD'].isin(magnitudes)]
+        if df.empty:
+            continue
+        day_hours = ((pd.to_datetime(df['timestamp']) - epoch) // pd.Timedelta(hours=1)).to_numpy(dtype=np.int64)
+        t_idx = day_hours[:, None] + hour_offsets[None, :]            # (rows, 24)
+        sta_idx = np.searchsorted(codes, df['ESTACION'].to_numpy(dtype=np.int64))
+        h = df[HOUR_COLS].to_numpy(dtype=np.float32)
+        v = df[VALID_COLS].to_numpy() == 'V'
+        in_range = (t_idx >= 0) & (t_idx < n_hours)
+        mags = df['MAGNITUD'].to_numpy()
+        for var in magnitudes:
+            rows = mags == var
+            mask = in_range[rows]
+            tt = t_idx[rows][mask]
+            ss = np.broadcast_to(sta_idx[rows][:, None], mask.shape)[mask]
+            values[var][tt, ss] = h[rows][mask]
+            valids[var][tt, ss] = v[rows][mask] & ~np.isnan(h[rows][mask])
+        logging.info(f"Cube: {key} ({len(df)} rows)")
+
+    for var in magnitudes:
+        values[var].flush()
+        valids[var].flush()
+    del values, valids
+
+    st = os.stat(airquality_hdf)
+    meta = {
+        'epoch': epoch.isoformat(),
+        'n_hours': n_hours,
+        'stations': codes.tolist(),
+        'magnitudes': sorted(int(m) for m in magnitudes),
+        'source': os.path.abspath(airquality_hdf),
+        'source_mtime_ns': st.st_mtime_ns,
+        'source_size': st.st_size,
+    }
+    with open(os.path.join(cube_dir, CUBE_META), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class AirQualityCube:
+    """Cubo estación x hora de una magnitud, abierto como memmap de solo lectura."""
+
+    def __init__(self, cube_dir, var):
+        with open(os.path.join(cube_dir, CUBE_META), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if int(var) not in self.meta['magnitudes']:
+            raise KeyError(f"Magnitude {var} not in cube {cube_dir} (available: {self.meta['magnitudes']})")
+        self.var = int(var)
+        self.epoch = datetime.fromisoformat(self.meta['epoch'])
+        self.station_codes = np.asarray(self.meta['stations'], dtype=np.int32)
+        values_path, valid_path = cube_paths(cube_dir, self.var)
+        self.values = np.load(values_path, mmap_mode='r')
+        self.valid = np.load(valid_path, mmap_mode='r')
+
+    @property
+    def n_hours(self):
+        return self.values.shape[0]
+
+    def hour_index(self, year, month, day, hour):
+        """Fila del cubo para un día y hora (0-24; la hora 24 es la 00 del día siguiente)."""
+        return int((datetime(year, month, day) - self.epoch).total_seconds() // 3600) + hour
+
+    def slice(self, start, stop):
+        """(values, valid) de las filas [start, stop) sin copiar (vistas del memmap)."""
+        return self.values[start:stop], self.valid[start:stop]
+
+    def points(self, year, month, day, hour, stations, valid_only=True):
+        """Valores de estación de una hora como DataFrame sta, z, lon, lat (mismo formato que MonthReader.points)."""
+        t = self.hour_index(year, month, day, hour)
+        if t < 0 or t >= self.n_hours:
+            raise KeyError(f"Hour {year}-{month:02d}-{day:02d} {hour:02d} outside cube range")
+        z = np.asarray(self.values[t], dtype=np.float64)
+        keep = self.valid[t] if valid_only else ~np.isnan(z)
+
+        points_df = pd.DataFrame()
+        points_df['sta'] = self.station_codes[keep]
+        points_df['z'] = z[keep]
+        points_df['lon'], points_df['lat'] = stations.lonlat(points_df['sta'].values)
+
+        return points_df.dropna(subset=['lon', 'lat', 'z'])
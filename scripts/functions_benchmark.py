@@ -0,0 +1,667 @@
+"""
+Suite de benchmarking: backends intercambiables, escenarios parametrizados y resultados en JSON/CSV.
+
+Sustituye el antiguo esquema de 12_comparative_benchmarking.py (reescribir YEAR_FROM/YEAR_TO con
+re.sub en una copia _temp.py de 10/11, lanzarla y leer los tiempos de stdout): las consultas están
+en functions_benchmark_queries.py y cada backend solo sabe construir la relación {src} de una
+ventana temporal y ejecutar SQL.
+
+Backends (BACKENDS):
+    postgres         tabla horaria {schema}.{table} filtrada por dt
+    postgres_rollup  rollups de functions_rollups.py (solo las consultas con rollup_sql)
+    duckdb_parquet   read_parquet() sobre la lista explícita de ficheros de las particiones
+                     year=/month= de la ventana (functions_parquet.partition_months)
+    duckdb_native    tabla de una base DuckDB en fichero (se crea desde el árbol Parquet si no existe
+                     o si el árbol ha cambiado desde que se creó)
+
+Cada consulta se ejecuta `warmup` veces sin medir y `repetitions` veces midiendo con
+time.perf_counter(); el resultado guarda todos los tiempos y su mediana, p95 y desviación típica.
+
+Frío y caliente: con cold=True, antes del warm-up se reabre la conexión del backend, se vacía la
+caché de páginas del SO si está permitido (root o `sudo -n`, ver drop_os_caches) y se mide una
+ejecución en frío (cold_s, cache_dropped indica si la caché se vació de verdad). La caché propia de
+PostgreSQL (shared_buffers) solo se vacía reiniciando el servidor.
+
+Recursos por ejecución (process_counters): CPU (utime + stime), bytes leídos de disco (read_bytes de
+/proc/<pid>/io; rchar incluye lo servido desde la caché de páginas) y pico de RSS (VmHWM, que se
+reinicia antes de cada ejecución cuando el kernel lo permite; si no se pudo reiniciar, p. ej. sin
+permiso sobre clear_refs o en macOS, donde ru_maxrss es el máximo de toda la vida del proceso, el
+pico no se reporta y peak_rss_reset queda a False). Para DuckDB se mide el propio
+proceso; para PostgreSQL el proceso backend de la conexión si el servidor es local y su /proc es
+accesible (los parallel workers no se cuentan). cpu_s / median_s > 1 indica paralelismo; un
+median_s muy por encima de cpu_s / hilos indica espera de I/O.
+
+Con profile=True se guarda además el plan ejecutado: EXPLAIN ANALYZE en DuckDB y
+EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) en PostgreSQL, de donde salen los bloques leídos de
+shared_buffers y de fuera (pg_shared_hit_bytes, pg_shared_read_bytes, pg_temp_read_bytes).
+
+Concurrencia (run_concurrent, 12_scaling_benchmarking.py): N clientes en hilos, cada uno con su
+sesión (Backend.client(): otra conexión a PostgreSQL, otro cursor de la misma base DuckDB), lanzan
+consultas en bucle cerrado durante un tiempo fijo; se informa el throughput (consultas/s) y los
+percentiles de latencia, globales y por consulta.
+
+Uso:
+    from functions_benchmark import DuckDBParquetBackend, run_suite, write_results
+    from functions_benchmark_queries import DEFAULT_SCENARIOS, BENCHMARK_QUERIES
+    with DuckDBParquetBackend('/Volumes/MV/carto/madno2Parquet') as backend:
+        results = run_suite([backend], DEFAULT_SCENARIOS, BENCHMARK_QUERIES, warmup=1, repetitions=5)
+    write_results(results, 'benchmark_results')
+"""
+import copy
+import csv
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from functions_parquet import file_fingerprint, iter_partitions, partition_dir, partition_months
+
+# Columnas del CSV de resultados (una fila por backend, escenario y consulta)
+RESULT_FIELDS = ['backend', 'scenario', 'year_from', 'year_to', 'query', 'name', 'warmup', 'repetitions',
+                 'rows', 'median_s', 'p95_s', 'stddev_s', 'mean_s', 'min_s', 'max_s',
+                 'cold_s', 'cache_dropped', 'cold_cpu_s', 'cold_read_bytes', 'cold_rchar', 'cold_peak_rss_mb',
+                 'cpu_s', 'read_bytes', 'rchar', 'peak_rss_mb', 'peak_rss_reset',
+                 'pg_shared_hit_bytes', 'pg_shared_read_bytes', 'pg_temp_read_bytes', 'times_s', 'error']
+
+# Contadores por ejecución (deltas salvo el pico de RSS)
+_COUNTERS = ('cpu_s', 'read_bytes', 'rchar')
+
+
+def drop_os_caches():
+    """Vacía la caché de páginas del SO si está permitido (root o sudo sin contraseña). True si se vació."""
+    try:
+        if sys.platform.startswith('linux'):
+            os.sync()
+            if os.geteuid() == 0:
+                with open('/proc/sys/vm/drop_caches', 'w') as f:
+                    f.write('3\n')
+                return True
+            cmd = ['sudo', '-n', 'sh', '-c', 'sync; echo 3 > /proc/sys/vm/drop_caches']
+        elif sys.platform == 'darwin':
+            cmd = ['sudo', '-n', 'purge']
+        else:
+            return False
+        return subprocess.run(cmd, capture_output=True, timeout=120).returncode == 0
+    except Exception:
+        return False
+
+
+def reset_peak_rss(pid):
+    """Reinicia VmHWM de un proceso (Linux, escribiendo 5 en clear_refs). True si se pudo."""
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def process_counters(pid):
+    """CPU (s), read_bytes y rchar acumulados y pico de RSS (MB) de un proceso; None lo no accesible."""
+    counters = {'cpu_s': None, 'read_bytes': None, 'rchar': None, 'peak_rss_mb': None}
+    if pid == os.getpid():
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        counters['cpu_s'] = usage.ru_utime + usage.ru_stime
+        # ru_maxrss: KB en Linux, bytes en macOS; ru_inblock: bloques de 512 bytes leídos de disco
+        counters['peak_rss_mb'] = usage.ru_maxrss / (1024**2 if sys.platform == 'darwin' else 1024)
+        counters['read_bytes'] = usage.ru_inblock * 512
+    else:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            counters['cpu_s'] = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, IndexError, ValueError):
+            pass
+    try:
+        with open(f'/proc/{pid}/io') as f:
+            io_stats = dict(line.split(':') for line in f if ':' in line)
+        counters['read_bytes'] = int(io_stats['read_bytes'])
+        counters['rchar'] = int(io_stats['rchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    counters['peak_rss_mb'] = int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return counters
+
+
+def _sql_timestamp(value):
+    return f"{value:%Y-%m-%d %H:%M:%S}"
+
+
+class Backend:
+    """Interfaz común de los backends: open/close, relation(start, end) y execute(sql) -> filas."""
+    name = ''
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def relation(self, start, end):
+        """Subconsulta con h3_index, dt y value de la ventana [start, end)."""
+        raise NotImplementedError
+
+    def query_sql(self, query, scenario):
+        """SQL de la consulta para este backend, o None si el backend no la soporta."""
+        start, end = query.window(scenario)
+        return query.sql.format(src=self.relation(start, end))
+
+    def execute(self, sql):
+        raise NotImplementedError
+
+    def reset(self):
+        """Reabre la conexión (descarta las cachés del motor ligadas a ella) para medir en frío."""
+        self.close()
+        self.open()
+
+    def client(self):
+        """Otra sesión abierta del mismo backend (un cliente más en run_concurrent)."""
+        other = copy.copy(self)
+        other.conn = None
+        other.open()
+        return other
+
+    def process_id(self):
+        """PID del proceso que ejecuta las consultas (para process_counters), o None si no es accesible."""
+        return None
+
+    def explain(self, sql):
+        """(perfil del plan ejecutado, métricas extra) de una ejecución de la consulta."""
+        return None, {}
+
+    def describe(self):
+        """Metadatos del backend para el JSON de resultados."""
+        return {'name': self.name}
+
+
+class PostgresBackend(Backend):
+    name = 'postgres'
+
+    def __init__(self, host, port, dbname, user, password, schema='madno', table='h3_points'):
+        self.dsn = dict(host=host, port=port, dbname=dbname, user=user, password=password)
+        self.schema, self.table = schema, table
+        self.conn = None
+
+    def open(self):
+        import psycopg2
+        self.conn = psycopg2.connect(**self.dsn)
+        self.conn.autocommit = True
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def relation(self, start, end):
+        return (f"(SELECT h3_index, dt, value FROM {self.schema}.{self.table} "
+                f"WHERE dt >= '{_sql_timestamp(start)}' AND dt < '{_sql_timestamp(end)}') AS src")
+
+    def execute(self, sql):
+        with self.conn.cursor() as cur:
+            cur.execute(sql)
+            return cur.fetchall()
+
+    def process_id(self):
+        # Solo si el servidor corre en esta máquina y el PID es de verdad un proceso postgres
+        # (en Docker el PID del contenedor no corresponde a un proceso del anfitrión)
+        pid = self.conn.get_backend_pid()
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                return pid if b'postgres' in f.read() else None
+        except OSError:
+            return None
+
+    def explain(self, sql):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT current_setting('block_size')::int")
+            block_size = cur.fetchone()[0]
+            cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+            plan = cur.fetchone()[0]
+        # El nodo raíz acumula los bloques de todos sus hijos
+        root = plan[0]['Plan']
+        metrics = {
+            'pg_shared_hit_bytes': root.get('Shared Hit Blocks', 0) * block_size,
+            'pg_shared_read_bytes': root.get('Shared Read Blocks', 0) * block_size,
+            'pg_temp_read_bytes': root.get('Temp Read Blocks', 0) * block_size,
+        }
+        return plan, metrics
+
+    def describe(self):
+        with self.conn.cursor() as cur:
+            cur.execute("SHOW server_version")
+            version = cur.fetchone()[0]
+        return {'name': self.name, 'server_version': version, 'table': f"{self.schema}.{self.table}",
+                'host': self.dsn['host'], 'port': self.dsn['port']}
+
+
+class PostgresRollupBackend(PostgresBackend):
+    """Mismas consultas sobre {table}_cell_daily, {table}_cell_monthly y {table}_city_hourly."""
+    name = 'postgres_rollup'
+
+    def query_sql(self, query, scenario):
+        if not query.rollup_sql:
+            return None
+        from functions_rollups import rollup_table
+        start, end = query.window(scenario)
+        return query.rollup_sql.format(
+            daily=f"{self.schema}.{rollup_table(self.table, 'cell_daily')}",
+            monthly=f"{self.schema}.{rollup_table(self.table, 'cell_monthly')}",
+            hourly=f"{self.schema}.{rollup_table(self.table, 'city_hourly')}",
+            start=_sql_timestamp(start), end=_sql_timestamp(end))
+
+
+class DuckDBParquetBackend(Backend):
+    name = 'duckdb_parquet'
+
+    def __init__(self, root, threads=None, memory_limit=None):
+        self.root = root
+        self.threads, self.memory_limit = threads, memory_limit
+        self.conn = None
+        self._files = {}
+
+    def open(self):
+        import duckdb
+        self.conn = duckdb.connect()
+        if self.threads:
+            self.conn.execute(f"SET threads = {int(self.threads)}")
+        if self.memory_limit:
+            self.conn.execute(f"SET memory_limit = '{self.memory_limit}'")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def partition_files(self, year, month):
+        """Ficheros de una partición (cacheados: el listado no cuenta en el tiempo de las consultas)."""
+        if (year, month) not in self._files:
+            self._files[(year, month)] = sorted(glob.glob(os.path.join(partition_dir(self.root, year, month), '*.parquet')))
+        return self._files[(year, month)]
+
+    def relation(self, start, end):
+        files = [f for ym in partition_months(start, end) for f in self.partition_files(*ym)]
+        if not files:
+            return "(SELECT NULL::UBIGINT AS h3_index, NULL::TIMESTAMP AS dt, NULL::DOUBLE AS value WHERE false) AS src"
+        file_list = ', '.join(f"'{f}'" for f in files)
+        return (f"(SELECT h3_index, datetime AS dt, value "
+                f"FROM read_parquet([{file_list}], hive_partitioning = false, union_by_name = true) "
+                f"WHERE datetime >= TIMESTAMP '{_sql_timestamp(start)}' "
+                f"AND datetime < TIMESTAMP '{_sql_timestamp(end)}') AS src")
+
+    def execute(self, sql):
+        return self.conn.execute(sql).fetchall()
+
+    def process_id(self):
+        return os.getpid()
+
+    def client(self):
+        # cursor() es otra conexión a la misma base: los clientes comparten hilos y caché, como en un servidor
+        other = copy.copy(self)
+        other.conn = self.conn.cursor()
+        return other
+
+    def explain(self, sql):
+        return '\n'.join(row[-1] for row in self.conn.execute(f"EXPLAIN ANALYZE {sql}").fetchall()), {}
+
+    def describe(self):
+        import duckdb
+        return {'name': self.name, 'duckdb_version': duckdb.__version__, 'root': self.root,
+                'threads': self.conn.execute("SELECT current_setting('threads')").fetchone()[0]}
+
+
+class DuckDBNativeBackend(Backend):
+    """Base DuckDB en fichero con una tabla (h3_index, dt, value) ordenada por dt.
+
+    Con parquet_root, la base guarda en {table}_source la huella (tamaño y mtime) de los ficheros
+    del árbol con que se creó y open() la vuelve a crear si el árbol ha cambiado desde entonces
+    (meses añadidos con --generate, particiones regeneradas o borradas).
+    """
+    name = 'duckdb_native'
+
+    def __init__(self, path, table='h3_points', parquet_root=None, threads=None, memory_limit=None):
+        self.path, self.table, self.parquet_root = path, table, parquet_root
+        self.threads, self.memory_limit = threads, memory_limit
+        self.conn = None
+
+    def source_manifest(self):
+        """Huella JSON de los ficheros .parquet del árbol (ruta relativa -> tamaño y mtime)."""
+        files = sorted(f for _, _, month_dir in iter_partitions(self.parquet_root)
+                       for f in glob.glob(os.path.join(month_dir, '*.parquet')))
+        return json.dumps({os.path.relpath(f, self.parquet_root): file_fingerprint(f) for f in files}, sort_keys=True)
+
+    def stored_manifest(self):
+        """Huella guardada en la base al crearla (None si no existe la base o no la tiene)."""
+        import duckdb
+        if not os.path.exists(self.path):
+            return None
+        with duckdb.connect(self.path, read_only=True) as conn:
+            try:
+                row = conn.execute(f"SELECT manifest FROM {self.table}_source").fetchone()
+            except duckdb.CatalogException:
+                return None
+        return row[0] if row else None
+
+    def build(self, manifest):
+        """Crea la tabla a partir del árbol Parquet (ordenada por dt para aprovechar los zonemaps).
+
+        Se escribe en un fichero temporal que sustituye a la base al terminar, así que una
+        creación interrumpida no deja una base a medias.
+        """
+        import duckdb
+        files = sorted(os.path.join(self.parquet_root, name) for name in json.loads(manifest))
+        if not files:
+            raise FileNotFoundError(f"No hay ficheros .parquet en {self.parquet_root} para crear {self.path}")
+        print(f"Creando {self.path} desde {self.parquet_root} ({len(files)} ficheros) ...")
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        file_list = ', '.join("'" + f.replace("'", "''") + "'" for f in files)
+        try:
+            with duckdb.connect(tmp) as conn:
+                conn.execute(f"""
+                    CREATE TABLE {self.table} AS
+                    SELECT h3_index, datetime AS dt, value
+                    FROM read_parquet([{file_list}], hive_partitioning = false, union_by_name = true)
+                    ORDER BY dt, h3_index
+                """)
+                conn.execute(f"CREATE TABLE {self.table}_source AS SELECT ? AS manifest", [manifest])
+            os.replace(tmp, self.path)
+        finally:
+            for leftover in (tmp, tmp + '.wal'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+    def open(self):
+        import duckdb
+        if self.parquet_root:
+            manifest = self.source_manifest()
+            stored = self.stored_manifest()
+            if stored != manifest:
+                if stored is not None:
+                    print(f"{self.path} no corresponde al árbol {self.parquet_root} actual; se vuelve a crear")
+                self.build(manifest)
+        elif not os.path.exists(self.path):
+            raise FileNotFoundError(f"No existe {self.path} y no se indicó el árbol Parquet para crearla")
+        self.conn = duckdb.connect(self.path, read_only=True)
+        if self.threads:
+            self.conn.execute(f"SET threads = {int(self.threads)}")
+        if self.memory_limit:
+            self.conn.execute(f"SET memory_limit = '{self.memory_limit}'")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def relation(self, start, end):
+        return (f"(SELECT h3_index, dt, value FROM {self.table} "
+                f"WHERE dt >= TIMESTAMP '{_sql_timestamp(start)}' AND dt < TIMESTAMP '{_sql_timestamp(end)}') AS src")
+
+    def execute(self, sql):
+        return self.conn.execute(sql).fetchall()
+
+    def process_id(self):
+        return os.getpid()
+
+    def client(self):
+        # cursor() es otra conexión a la misma base: los clientes comparten hilos y caché, como en un servidor
+        other = copy.copy(self)
+        other.conn = self.conn.cursor()
+        return other
+
+    def explain(self, sql):
+        return '\n'.join(row[-1] for row in self.conn.execute(f"EXPLAIN ANALYZE {sql}").fetchall()), {}
+
+    def describe(self):
+        import duckdb
+        return {'name': self.name, 'duckdb_version': duckdb.__version__, 'path': self.path,
+                'threads': self.conn.execute("SELECT current_setting('threads')").fetchone()[0]}
+
+
+BACKENDS = {
+    'postgres': PostgresBackend,
+    'postgres_rollup': PostgresRollupBackend,
+    'duckdb_parquet': DuckDBParquetBackend,
+    'duckdb_native': DuckDBNativeBackend,
+}
+
+
+def _percentile(ordered, q):
+    """Percentil q (0-1) de una lista ordenada, por interpolación lineal (igual que numpy.percentile)."""
+    pos = q * (len(ordered) - 1)
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def summarize_times(times):
+    """Mediana, p95, desviación típica, media, mínimo y máximo (segundos) de una lista de tiempos."""
+    if not times:
+        return {k: None for k in ('median_s', 'p95_s', 'stddev_s', 'mean_s', 'min_s', 'max_s')}
+    ordered = sorted(times)
+    return {
+        'median_s': statistics.median(ordered),
+        'p95_s': _percentile(ordered, 0.95),
+        'stddev_s': statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        'mean_s': statistics.fmean(ordered),
+        'min_s': ordered[0],
+        'max_s': ordered[-1],
+    }
+
+
+def _measured_run(backend, sql, pid):
+    """Una ejecución medida: (filas, {time_s, cpu_s, read_bytes, rchar, peak_rss_mb, peak_rss_reset}).
+
+    peak_rss_mb solo se da si se pudo reiniciar el pico antes de ejecutar; si no, sería el máximo
+    acumulado por el proceso hasta entonces y no el de esta consulta.
+    """
+    if pid:
+        reset_ok = reset_peak_rss(pid)
+        before = process_counters(pid)
+    t0 = time.perf_counter()
+    rows = backend.execute(sql)
+    sample = {'time_s': time.perf_counter() - t0}
+    if pid:
+        after = process_counters(pid)
+        for key in _COUNTERS:
+            sample[key] = after[key] - before[key] if None not in (after[key], before[key]) else None
+        sample['peak_rss_reset'] = reset_ok
+        sample['peak_rss_mb'] = after['peak_rss_mb'] if reset_ok else None
+    return rows, sample
+
+
+def _median_of(samples, key):
+    values = [s[key] for s in samples if s.get(key) is not None]
+    return statistics.median(values) if values else None
+
+
+def measure_query(backend, sql, warmup=1, repetitions=5, cold=False, profile=False):
+    """Mide una consulta: ejecución en frío opcional, `warmup` sin medir y `repetitions` medidas.
+
+    Devuelve (filas de la última ejecución, dict con times_s, cold_*, contadores medianos en
+    caliente y, con profile, el plan ejecutado en 'profile' y sus métricas).
+    """
+    measured = {}
+    if cold:
+        backend.reset()
+        measured['cache_dropped'] = drop_os_caches()
+        _, sample = _measured_run(backend, sql, backend.process_id())
+        measured['cold_s'] = sample['time_s']
+        for key in _COUNTERS + ('peak_rss_mb',):
+            measured[f'cold_{key}'] = sample.get(key)
+
+    for _ in range(warmup):
+        backend.execute(sql)
+    pid = backend.process_id()
+    samples, rows = [], None
+    for _ in range(repetitions):
+        rows, sample = _measured_run(backend, sql, pid)
+        samples.append(sample)
+    measured['times_s'] = [s['time_s'] for s in samples]
+    for key in _COUNTERS:
+        measured[key] = _median_of(samples, key)
+    peaks = [s['peak_rss_mb'] for s in samples if s.get('peak_rss_mb') is not None]
+    measured['peak_rss_mb'] = max(peaks) if peaks else None
+    resets = [s['peak_rss_reset'] for s in samples if 'peak_rss_reset' in s]
+    measured['peak_rss_reset'] = all(resets) if resets else None
+
+    if profile:
+        measured['profile'], metrics = backend.explain(sql)
+        measured.update(metrics)
+    return rows, measured
+
+
+def run_suite(backends, scenarios, queries, warmup=1, repetitions=5, on_result=None, cold=False, profile=False):
+    """Ejecuta cada consulta de cada escenario en cada backend (ya abierto).
+
+    cold: mide también una ejecución en frío por consulta; profile: guarda el plan ejecutado.
+    on_result(result) se llama tras cada medición. Devuelve la lista de resultados (dicts con
+    RESULT_FIELDS; times_s es la lista de tiempos y profile, si se pidió, el plan).
+    """
+    results = []
+    for scenario in scenarios:
+        for query in queries:
+            for backend in backends:
+                sql = backend.query_sql(query, scenario)
+                if sql is None:
+                    continue
+                result = {'backend': backend.name, 'scenario': scenario.name, 'year_from': scenario.year_from,
+                          'year_to': scenario.year_to, 'query': query.id, 'name': query.name(scenario),
+                          'warmup': warmup, 'repetitions': repetitions, 'rows': None, 'times_s': [], 'error': None}
+                try:
+                    rows, measured = measure_query(backend, sql, warmup, repetitions, cold, profile)
+                    result.update(measured)
+                    result['rows'] = len(rows)
+                except Exception as e:
+                    result['error'] = str(e).strip()
+                result.update(summarize_times(result['times_s']))
+                results.append(result)
+                if on_result:
+                    on_result(result)
+    return results
+
+
+def latency_summary(times):
+    """Latencias de una prueba de carga: n, p50, p95, p99, media y máximo (segundos)."""
+    if not times:
+        return {'n': 0, 'p50_s': None, 'p95_s': None, 'p99_s': None, 'mean_s': None, 'max_s': None}
+    ordered = sorted(times)
+    return {'n': len(ordered), 'p50_s': _percentile(ordered, 0.50), 'p95_s': _percentile(ordered, 0.95),
+            'p99_s': _percentile(ordered, 0.99), 'mean_s': statistics.fmean(ordered), 'max_s': ordered[-1]}
+
+
+def run_concurrent(backend, statements, clients, duration=30.0, warmup=1):
+    """Prueba de carga en bucle cerrado: `clients` sesiones lanzan consultas sin pausa durante `duration` s.
+
+    statements: lista de (id de consulta, sql). Cada cliente recorre la lista empezando en una
+    posición distinta (el cliente k por la consulta k), así que con varios clientes se mezclan
+    consultas distintas como en el panel de análisis del visor. Las consultas que siguen en curso
+    al acabar el tiempo se esperan y cuentan. Antes se ejecuta cada consulta `warmup` veces en
+    `backend` sin medir. Un cliente que recibe un error deja de lanzar consultas.
+
+    Devuelve {clients, wall_s, completed, errors, error, throughput_qps, p50_s, ..., per_query}
+    donde per_query[id] = latency_summary + 'times_s'.
+    """
+    for _ in range(warmup):
+        for _, sql in statements:
+            backend.execute(sql)
+
+    sessions = [backend.client() for _ in range(clients)]
+    samples = [[] for _ in range(clients)]
+    failures = []
+    barrier = threading.Barrier(clients + 1)
+    deadline = [None]
+
+    def worker(k):
+        session, i = sessions[k], k
+        barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            query_id, sql = statements[i % len(statements)]
+            t0 = time.perf_counter()
+            try:
+                session.execute(sql)
+            except Exception as e:
+                failures.append(f"{query_id}: {str(e).strip()}")
+                return
+            samples[k].append((query_id, time.perf_counter() - t0))
+            i += 1
+
+    threads = [threading.Thread(target=worker, args=(k,), daemon=True) for k in range(clients)]
+    try:
+        for thread in threads:
+            thread.start()
+        start = time.perf_counter()
+        deadline[0] = start + duration
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+    finally:
+        for session in sessions:
+            session.close()
+
+    flat = [s for client_samples in samples for s in client_samples]
+    per_query = {}
+    for query_id, _ in statements:
+        times = [t for q, t in flat if q == query_id]
+        per_query[query_id] = {**latency_summary(times), 'times_s': times}
+    point = {'clients': clients, 'wall_s': wall, 'completed': len(flat), 'errors': len(failures),
+             'error': failures[0] if failures else None,
+             'throughput_qps': len(flat) / wall if wall > 0 else None}
+    point.update(latency_summary([t for _, t in flat]))
+    point['per_query'] = per_query
+    return point
+
+
+def comparison_rows(results, baseline='postgres'):
+    """Tabla comparativa: una fila por (escenario, consulta) con la mediana de cada backend y el
+    speedup de cada uno frente a `baseline` (mediana baseline / mediana backend)."""
+    backends = list(dict.fromkeys(r['backend'] for r in results))
+    table = {}
+    for r in results:
+        row = table.setdefault((r['scenario'], r['query']), {'scenario': r['scenario'], 'query': r['query'],
+                                                              'name': r['name']})
+        row[f"{r['backend']}_median_s"] = r['median_s']
+    for row in table.values():
+        base = row.get(f"{baseline}_median_s")
+        for b in backends:
+            if b != baseline and base and row.get(f"{b}_median_s"):
+                row[f"{b}_speedup"] = base / row[f"{b}_median_s"]
+    return list(table.values())
+
+
+def write_results(results, path_base, metadata=None):
+    """Escribe <path_base>.json (metadatos, resultados y planes) y <path_base>.csv (sin planes).
+    Devuelve las dos rutas."""
+    metadata = dict(metadata or {})
+    metadata.setdefault('created', datetime.now().isoformat(timespec='seconds'))
+    metadata.setdefault('platform', platform.platform())
+    metadata.setdefault('python', platform.python_version())
+
+    json_path, csv_path = f"{path_base}.json", f"{path_base}.csv"
+    with open(json_path, 'w') as f:
+        json.dump({'metadata': metadata, 'results': results}, f, indent=2, default=str)
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for r in results:
+            writer.writerow({**r, 'times_s': ';'.join(f"{t:.6f}" for t in r['times_s'])})
+    return json_path, csv_path
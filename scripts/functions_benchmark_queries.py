@@ -0,0 +1,224 @@
+"""
+Consultas del benchmark comparativo, definidas una sola vez para todos los backends.
+
+Cada consulta es SQL estándar (válido en PostgreSQL y DuckDB) sobre una relación {src} con las
+columnas h3_index, dt y value, ya acotada a la ventana temporal de la consulta. Cada backend
+(functions_benchmark.py) construye {src} a su manera: la tabla madno.h3_points con un filtro por
+dt, read_parquet() sobre la lista explícita de particiones year=/month= de la ventana, o la tabla
+de una base DuckDB nativa.
+
+La ventana por defecto es la del escenario (años year_from..year_to); Q5 usa un único día.
+rollup_sql es la variante sobre los rollups de PostgreSQL (functions_rollups.py): usa {daily},
+{monthly} y {hourly} y los límites {start}/{end} de la ventana. Q10 (percentiles) no tiene
+variante porque los percentiles no se pueden recomponer a partir de agregados.
+
+Uso:
+    from functions_benchmark_queries import BENCHMARK_QUERIES, Scenario
+    scenario = Scenario.parse('2005-2009')
+    for query in BENCHMARK_QUERIES:
+        start, end = query.window(scenario)
+        sql = query.sql.format(src=...)
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """Rango de años a evaluar (ambos inclusive)."""
+    year_from: int
+    year_to: int
+    name: str = ''
+
+    def __post_init__(self):
+        if self.year_from > self.year_to:
+            raise ValueError(f"year_from ({self.year_from}) debe ser menor o igual a year_to ({self.year_to})")
+        if not self.name:
+            object.__setattr__(self, 'name', str(self.year_from) if self.year_from == self.year_to
+                               else f"{self.year_from}-{self.year_to}")
+
+    @classmethod
+    def parse(cls, value):
+        """'2005' -> 2005..2005; '2005-2009' -> 2005..2009."""
+        first, _, last = value.partition('-')
+        return cls(int(first), int(last or first))
+
+    @property
+    def description(self):
+        if self.year_from == self.year_to:
+            return f"año {self.year_from}"
+        return f"años {self.year_from} a {self.year_to}"
+
+    @property
+    def window(self):
+        """[inicio, fin) de la ventana del escenario."""
+        return datetime(self.year_from, 1, 1), datetime(self.year_to + 1, 1, 1)
+
+
+# Los escenarios históricos de 12_comparative_benchmarking.py / 13_results.csv
+DEFAULT_SCENARIOS = [
+    Scenario(2005, 2005, 'Año único (2005)'),
+    Scenario(2005, 2009, 'Rango corto (2005-2009)'),
+    Scenario(2001, 2010, 'Rango largo (2001-2010)'),
+]
+
+
+@dataclass(frozen=True)
+class BenchmarkQuery:
+    id: str
+    title: str                                 # con {desc} (descripción del escenario) y {year}
+    sql: str                                   # sobre {src}: h3_index, dt, value
+    rollup_sql: str | None = None              # sobre {daily}, {monthly}, {hourly} con {start}/{end}
+    day: tuple | None = None                   # (mes, día) si la ventana es un único día del primer año
+
+    def name(self, scenario):
+        return f"{self.id}: " + self.title.format(desc=scenario.description, year=scenario.year_from)
+
+    def window(self, scenario):
+        """[inicio, fin) de los datos que lee la consulta en el escenario."""
+        if self.day:
+            start = datetime(scenario.year_from, *self.day)
+            return start, start + timedelta(days=1)
+        return scenario.window
+
+
+BENCHMARK_QUERIES = [
+    BenchmarkQuery(
+        'Q1', "Contar todos los registros del {desc}",
+        "SELECT COUNT(*) AS total FROM {src}",
+        "SELECT SUM(n) AS total FROM {monthly} WHERE month >= '{start}' AND month < '{end}'",
+    ),
+    BenchmarkQuery(
+        'Q2', "Promedio de valores por mes en el {desc}",
+        """
+        SELECT DATE_TRUNC('month', dt) AS month, COUNT(*) AS num_registros,
+               AVG(value) AS avg_value, MIN(value) AS min_value, MAX(value) AS max_value
+        FROM {src}
+        GROUP BY DATE_TRUNC('month', dt)
+        ORDER BY month
+        """,
+        """
+        SELECT month, SUM(n) AS num_registros, SUM(sum) / SUM(n) AS avg_value,
+               MIN(min) AS min_value, MAX(max) AS max_value
+        FROM {monthly} WHERE month >= '{start}' AND month < '{end}'
+        GROUP BY month
+        ORDER BY month
+        """,
+    ),
+    BenchmarkQuery(
+        'Q4', "Top 10 celdas H3 con mayor valor promedio en el {desc}",
+        """
+        SELECT h3_index, COUNT(*) AS num_mediciones, AVG(value) AS avg_value, MAX(value) AS max_value
+        FROM {src}
+        GROUP BY h3_index
+        ORDER BY avg_value DESC
+        LIMIT 10
+        """,
+        """
+        SELECT h3_index, SUM(n) AS num_mediciones, SUM(sum) / SUM(n) AS avg_value, MAX(max) AS max_value
+        FROM {monthly} WHERE month >= '{start}' AND month < '{end}'
+        GROUP BY h3_index
+        ORDER BY avg_value DESC
+        LIMIT 10
+        """,
+    ),
+    BenchmarkQuery(
+        'Q5', "Registros de una fecha específica ({year}-07-15)",
+        "SELECT COUNT(*) AS total, AVG(value) AS avg_value FROM {src}",
+        """
+        SELECT COALESCE(SUM(n), 0) AS total, SUM(sum) / SUM(n) AS avg_value
+        FROM {daily} WHERE day >= '{start}' AND day < '{end}'
+        """,
+        day=(7, 15),
+    ),
+    BenchmarkQuery(
+        'Q6', "Rango de fechas disponibles en el {desc}",
+        """
+        SELECT MIN(dt) AS fecha_min, MAX(dt) AS fecha_max,
+               COUNT(DISTINCT DATE_TRUNC('year', dt)) AS num_years
+        FROM {src}
+        """,
+        """
+        SELECT MIN(dt) AS fecha_min, MAX(dt) AS fecha_max,
+               COUNT(DISTINCT DATE_TRUNC('year', dt)) AS num_years
+        FROM {hourly} WHERE dt >= '{start}' AND dt < '{end}'
+        """,
+    ),
+    BenchmarkQuery(
+        'Q7', "Estadísticas generales por año ({desc})",
+        """
+        SELECT DATE_TRUNC('year', dt) AS year, COUNT(*) AS num_registros,
+               AVG(value) AS avg_value, STDDEV(value) AS stddev_value
+        FROM {src}
+        GROUP BY DATE_TRUNC('year', dt)
+        ORDER BY year
+        """,
+        """
+        SELECT DATE_TRUNC('year', month::timestamp) AS year, SUM(n) AS num_registros,
+               SUM(sum) / SUM(n) AS avg_value,
+               SQRT(GREATEST(SUM(sum_sq) - SUM(sum) ^ 2 / SUM(n), 0) / NULLIF(SUM(n) - 1, 0)) AS stddev_value
+        FROM {monthly} WHERE month >= '{start}' AND month < '{end}'
+        GROUP BY DATE_TRUNC('year', month::timestamp)
+        ORDER BY year
+        """,
+    ),
+    BenchmarkQuery(
+        'Q8', "Patrón horario de NO2 en el {desc}",
+        """
+        SELECT EXTRACT(HOUR FROM dt) AS hora, COUNT(*) AS num_mediciones,
+               AVG(value) AS no2_promedio, MAX(value) AS no2_maximo, MIN(value) AS no2_minimo
+        FROM {src}
+        GROUP BY EXTRACT(HOUR FROM dt)
+        ORDER BY hora
+        """,
+        """
+        SELECT EXTRACT(HOUR FROM dt) AS hora, SUM(n) AS num_mediciones,
+               SUM(sum) / SUM(n) AS no2_promedio, MAX(max) AS no2_maximo, MIN(min) AS no2_minimo
+        FROM {hourly} WHERE dt >= '{start}' AND dt < '{end}'
+        GROUP BY EXTRACT(HOUR FROM dt)
+        ORDER BY hora
+        """,
+    ),
+    BenchmarkQuery(
+        'Q9', "Días con mayor contaminación promedio en el {desc}",
+        """
+        SELECT EXTRACT(MONTH FROM dt) AS mes, EXTRACT(DAY FROM dt) AS dia, COUNT(*) AS mediciones,
+               AVG(value) AS no2_promedio, MAX(value) AS no2_maximo
+        FROM {src}
+        GROUP BY EXTRACT(MONTH FROM dt), EXTRACT(DAY FROM dt)
+        ORDER BY no2_promedio DESC
+        LIMIT 10
+        """,
+        """
+        SELECT EXTRACT(MONTH FROM dt) AS mes, EXTRACT(DAY FROM dt) AS dia, SUM(n) AS mediciones,
+               SUM(sum) / SUM(n) AS no2_promedio, MAX(max) AS no2_maximo
+        FROM {hourly} WHERE dt >= '{start}' AND dt < '{end}'
+        GROUP BY EXTRACT(MONTH FROM dt), EXTRACT(DAY FROM dt)
+        ORDER BY no2_promedio DESC
+        LIMIT 10
+        """,
+    ),
+    BenchmarkQuery(
+        'Q10', "Percentiles de NO2 en el {desc}",
+        """
+        SELECT PERCENTILE_CONT(0.25) WITHIN GROUP (ORDER BY value) AS p25,
+               PERCENTILE_CONT(0.50) WITHIN GROUP (ORDER BY value) AS p50_mediana,
+               PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY value) AS p75,
+               PERCENTILE_CONT(0.90) WITHIN GROUP (ORDER BY value) AS p90,
+               PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY value) AS p95,
+               PERCENTILE_CONT(0.99) WITHIN GROUP (ORDER BY value) AS p99
+        FROM {src}
+        """,
+    ),
+]
+
+
+def select_queries(ids=None):
+    """Consultas por id ('Q1', 'Q4', ...) en el orden de BENCHMARK_QUERIES; todas si ids es None."""
+    if not ids:
+        return list(BENCHMARK_QUERIES)
+    known = {q.id: q for q in BENCHMARK_QUERIES}
+    unknown = [i for i in ids if i not in known]
+    if unknown:
+        raise ValueError(f"Consultas desconocidas: {unknown}. Opciones: {list(known)}")
+    return [q for q in BENCHMARK_QUERIES if q.id in ids]
@@ -0,0 +1,166 @@
+"""
+Caché de coberturas H3 por configuración de estaciones.
+
+Las celdas dentro del convex hull de las estaciones solo cambian cuando cambia el conjunto de
+estaciones que reportan. H3CoverCache guarda, por (frozenset de códigos de estación, h3_res),
+las celdas, sus centros en EPSG:3857 y opcionalmente los polígonos de los hexágonos, en memoria
+(LRU) y en disco (.npz), de modo que solo la primera hora de cada configuración paga la geometría.
+"""
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+from pyproj import Transformer
+from shapely.geometry import Polygon
+
+from functions_03_convexhull import (
+    build_h3_cells_in_polygon, h3_cell_to_boundary, h3_cell_to_latlng, make_clip_polygon_convex,
+)
+from functions_h3index import h3_to_uint64
+
+
+@dataclass
+class CellCover:
+    """Cobertura H3 de una configuración de estaciones."""
+    cells: list              # índices H3 (str), ordenados
+    cx: np.ndarray           # centros EPSG:3857
+    cy: np.ndarray
+    boundaries: np.ndarray = None  # (n, k, 2) lon/lat, relleno con NaN; None si no se han calculado
+    _polygons: list = field(default=None, repr=False)
+    _ids: np.ndarray = field(default=None, repr=False)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def cell_ids(self):
+        """Índices H3 como uint64 (para Parquet/PostgreSQL), calculados una sola vez."""
+        if self._ids is None:
+            self._ids = h3_to_uint64(self.cells)
+        return self._ids
+
+    def polygons(self):
+        """Polígonos shapely (lon, lat, anillo cerrado) de cada celda, calculados una sola vez."""
+        if self._polygons is None:
+            if self.boundaries is None:
+                self.boundaries = _cell_boundaries(self.cells)
+            self._polygons = [_ring_polygon(ring[~np.isnan(ring[:, 0])].tolist()) for ring in self.boundaries]
+        return self._polygons
+
+
+def _ring_polygon(ring):
+    # cerrar anillo si es necesario
+    if ring[0] != ring[-1]:
+        ring.append(ring[0])
+    return Polygon(ring)
+
+
+def cell_polygons(cells):
+    """Polígonos shapely (lon, lat) de una lista de celdas H3."""
+    return [_ring_polygon([(lng, lat) for (lat, lng) in h3_cell_to_boundary(c)]) for c in cells]
+
+
+def _cell_boundaries(cells):
+    rings = [[(lng, lat) for (lat, lng) in h3_cell_to_boundary(c)] for c in cells]
+    k = max((len(r) for r in rings), default=0)
+    out = np.full((len(rings), k, 2), np.nan)
+    for i, r in enumerate(rings):
+        out[i, :len(r)] = r
+    return out
+
+
+def build_cell_cover(gdf_points, h3_res, with_boundaries=False):
+    """Calcula la cobertura H3 del convex hull de las estaciones (columnas lon, lat)."""
+    clip_poly_wgs84 = make_clip_polygon_convex(gdf_points)
+    cells, _ = build_h3_cells_in_polygon(clip_poly_wgs84, h3_res)
+
+    centers = np.array([h3_cell_to_latlng(c) for c in cells], dtype=np.float64).reshape(-1, 2)  # (lat, lon)
+    wgs84_to_3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+    cx, cy = wgs84_to_3857.transform(centers[:, 1], centers[:, 0])
+
+    boundaries = _cell_boundaries(cells) if with_boundaries else None
+    return CellCover(list(cells), np.asarray(cx), np.asarray(cy), boundaries)
+
+
+class H3CoverCache:
+    """Caché LRU en memoria + persistencia en disco de CellCover.
+
+    La clave es (frozenset de códigos de estación, h3_res). En disco el nombre del fichero incluye
+    además las coordenadas de las estaciones, así que un cambio en el XLS invalida la entrada.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=64, with_boundaries=False):
+        self.cache_dir = cache_dir
+        self.max_entries = max(1, int(max_entries))
+        self.with_boundaries = with_boundaries
+        self._mem = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, gdf_points, h3_res):
+        rows = sorted(zip(gdf_points['sta'].astype(int), gdf_points['lon'].round(7), gdf_points['lat'].round(7)))
+        digest = hashlib.sha1(repr((rows, int(h3_res))).encode()).hexdigest()[:20]
+        return os.path.join(self.cache_dir, f"cover_res{h3_res}_{digest}.npz")
+
+    def _load(self, path):
+        with np.load(path, allow_pickle=False) as npz:
+            boundaries = npz['boundaries'] if 'boundaries' in npz.files else None
+            return CellCover(npz['cells'].tolist(), npz['cx'], npz['cy'], boundaries)
+
+    def _save(self, path, cover):
+        arrays = {'cells': np.asarray(cover.cells, dtype='U16'), 'cx': cover.cx, 'cy': cover.cy}
+        if cover.boundaries is not None:
+            arrays['boundaries'] = cover.boundaries
+        # Escritura atómica: varios workers pueden compartir el directorio
+        tmp_path = path + f'.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def get(self, gdf_points, h3_res):
+        """CellCover de las estaciones de gdf_points (columnas sta, lon, lat) a resolución h3_res."""
+        key = (frozenset(int(s) for s in gdf_points['sta']), int(h3_res))
+        cover = self._mem.get(key)
+        if cover is not None:
+            self.hits += 1
+            self._mem.move_to_end(key)
+            return cover
+
+        self.misses += 1
+        path = self._disk_path(gdf_points, h3_res) if self.cache_dir else None
+        if path and os.path.isfile(path):
+            try:
+                cover = self._load(path)
+                if self.with_boundaries and cover.boundaries is None:
+                    cover.boundaries = _cell_boundaries(cover.cells)
+                    self._save(path, cover)
+            except Exception as e:
+                logging.warning(f"WARNING: Ignoring unreadable H3 cover cache {path}: {e}")
+                cover = None
+
+        if cover is None:
+            cover = build_cell_cover(gdf_points, h3_res, with_boundaries=self.with_boundaries)
+            if path:
+                try:
+                    self._save(path, cover)
+                except OSError as e:
+                    logging.warning(f"WARNING: Could not write H3 cover cache {path}: {e}")
+
+        self._mem[key] = cover
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+        return cover
+
+
+# Caché compartida del proceso (solo memoria) para llamadas sueltas
+_DEFAULT_CACHE = None
+
+
+def get_cover_cache():
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = H3CoverCache()
+    return _DEFAULT_CACHE
@@ -0,0 +1,65 @@
+"""
+Almacenamiento de índices H3 como enteros.
+
+Un índice H3 es un entero de 64 bits que normalmente se escribe como texto hex de 15 caracteres
+('89390ca0083ffff'). Guardarlo como entero reduce el tamaño de fila y abarata joins y group-bys:
+
+    Parquet / Arrow / DuckDB  uint64 (UBIGINT)
+    PostgreSQL                BIGINT (el bit 63 de un índice H3 es siempre 0, cabe con signo)
+
+Este módulo reúne la conversión en Python (NumPy) y las expresiones SQL equivalentes para que
+los lectores puedan pasar de un modo a otro.
+
+Uso:
+    from functions_h3index import h3_to_uint64, h3_from_uint64, duckdb_h3_to_text
+    ids = h3_to_uint64(df['h3_index'])
+    sql = f"SELECT {duckdb_h3_to_text('h3_index')} AS h3_index, value FROM read_parquet(...)"
+"""
+import numpy as np
+
+# Modos de almacenamiento de h3_index
+H3_STORAGE_MODES = ('text', 'uint64')
+
+
+def h3_to_uint64(cells):
+    """Índices H3 en texto (hex) -> array uint64 (misma codificación que h3.str_to_int)."""
+    return np.fromiter((int(c, 16) for c in cells), dtype=np.uint64, count=len(cells))
+
+
+def h3_from_uint64(ids):
+    """Array de índices H3 uint64 -> lista de textos hex (como h3.int_to_str)."""
+    return [format(int(i), 'x') for i in ids]
+
+
+def h3_literal(cell, uint64=False):
+    """Literal SQL para comparar h3_index con una celda dada en texto, según el modo de almacenamiento."""
+    return str(int(cell, 16)) if uint64 else f"'{cell}'"
+
+
+# --- Expresiones SQL (expr es una columna o expresión) ---
+
+def duckdb_h3_to_uint64(expr):
+    """DuckDB: texto hex -> UBIGINT."""
+    return f"('0x' || {expr})::UBIGINT"
+
+
+def duckdb_h3_to_text(expr):
+    """DuckDB: UBIGINT -> texto hex en minúsculas."""
+    return f"lower(hex({expr}))"
+
+
+def pg_h3_to_bigint(expr):
+    """PostgreSQL: texto hex -> BIGINT."""
+    return f"('x' || lpad({expr}, 16, '0'))::bit(64)::bigint"
+
+
+def pg_h3_to_text(expr):
+    """PostgreSQL: BIGINT -> texto hex en minúsculas."""
+    return f"to_hex({expr})"
+
+
+def pg_h3_column_type(mode):
+    """Tipo SQL de h3_index en PostgreSQL para el modo 'text' o 'uint64'."""
+    if mode not in H3_STORAGE_MODES:
+        raise ValueError(f"Modo de h3_index desconocido: {mode!r}. Opciones: {H3_STORAGE_MODES}")
+    return 'BIGINT' if mode == 'uint64' else 'TEXT'
@@ -0,0 +1,512 @@
+"""
+Escritura directa de las exportaciones horarias a Parquet particionado (hive year=YYYY/month=MM).
+
+En lugar de un CSV + GeoJSON por hora que luego 05_from_csv_to_geoparquet.py vuelve a leer,
+MonthPartitionWriter acumula en memoria los resultados de cada mes y los escribe como una tabla
+Arrow con tipos fijos:
+
+    h3_index  uint64     (h3.str_to_int del índice hex)
+    datetime  timestamp  (la hora Hk del día d es d + k horas: H24 -> 00:00 del día siguiente)
+    value     float32
+
+Cada fila va en la partición del mes de su datetime (la H24 del último día, 00:00 del día 1, en
+la del mes siguiente); 05_from_csv_to_geoparquet.py sigue el mismo convenio.
+
+Cada escritor escribe su propio fichero part-<tag>.parquet dentro de la partición, así que
+varios workers (uno por mes) pueden escribir en el mismo árbol sin pisarse.
+
+ParquetWriteOptions es la etapa de escritura común (04, 05 y 05_optimize_parquet.py): ordena cada
+fichero por (datetime, h3_index) o (h3_index, datetime) para que las estadísticas min/max de cada
+row group permitan saltarse el resto del fichero, y fija tamaño de row group, diccionario,
+compresión ZSTD y, opcionalmente, bloom filters sobre h3_index. StreamingParquetWriter aplica
+esas mismas opciones escribiendo por lotes, con memoria acotada (05_from_csv_to_geoparquet.py).
+PartitionManifest guarda qué ficheros de entrada produjeron cada partición para que 05 solo
+reconvierta los meses cuyas entradas han cambiado.
+
+Uso:
+    from functions_parquet import MonthPartitionWriter
+    writer = MonthPartitionWriter('/Volumes/MV/carto/madno2Parquet', tag='200501')
+    writer.add(datetime(2005, 1, 1, 1), cover.cell_ids(), values)
+    writer.close()
+"""
+import glob
+import hashlib
+import inspect
+import json
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+H3_PARQUET_SCHEMA = pa.schema([
+    ('h3_index', pa.uint64()),
+    ('datetime', pa.timestamp('us')),
+    ('value', pa.float32()),
+])
+
+PARQUET_COMPRESSION = 'zstd'
+
+# Orden dentro de cada fichero: 'time' para consultas por rango de horas (snapshots),
+# 'cell' para series temporales de una celda; 'none' conserva el orden de llegada
+PARQUET_SORT_ORDERS = {
+    'time': [('datetime', 'ascending'), ('h3_index', 'ascending')],
+    'cell': [('h3_index', 'ascending'), ('datetime', 'ascending')],
+    'none': None,
+}
+
+
+def _supports_bloom_filters():
+    return 'bloom_filter_options' in inspect.signature(pq.write_table).parameters
+
+
+@dataclass(frozen=True)
+class ParquetWriteOptions:
+    """Opciones de escritura de los Parquet de puntos H3."""
+    sort: str = 'time'                  # clave de PARQUET_SORT_ORDERS
+    row_group_size: int = 131072        # filas por row group (= estadística min/max por bloque)
+    compression: str = PARQUET_COMPRESSION
+    compression_level: int = None       # None: nivel por defecto del códec
+    use_dictionary: object = True       # True/False o lista de columnas
+    bloom_filter: bool = False          # bloom filter sobre h3_index (pyarrow >= 19)
+    bloom_filter_fpp: float = 0.05
+    write_page_index: bool = True       # estadísticas también por página
+
+    def __post_init__(self):
+        if self.sort not in PARQUET_SORT_ORDERS:
+            raise ValueError(f"Orden Parquet desconocido: {self.sort!r}. Opciones: {sorted(PARQUET_SORT_ORDERS)}")
+        if self.bloom_filter and not _supports_bloom_filters():
+            raise ValueError(f"pyarrow {pa.__version__} no escribe bloom filters; actualiza pyarrow o quita --parquet-bloom-filter")
+
+    def prepare(self, table):
+        """Ordena la tabla según el orden configurado."""
+        order = PARQUET_SORT_ORDERS[self.sort]
+        return table.sort_by(order) if order else table
+
+    def write_kwargs(self, table, ndv=None):
+        """Argumentos de pq.write_table / pq.ParquetWriter para una tabla ya ordenada.
+
+        ndv: celdas distintas para dimensionar el bloom filter (por defecto, las de la tabla).
+        """
+        kwargs = dict(
+            row_group_size=self.row_group_size,
+            compression=self.compression,
+            compression_level=self.compression_level,
+            use_dictionary=self.use_dictionary,
+            write_statistics=True,
+            write_page_index=self.write_page_index,
+        )
+        order = PARQUET_SORT_ORDERS[self.sort]
+        if order:
+            kwargs['sorting_columns'] = pq.SortingColumn.from_ordering(table.schema, order)
+        if self.bloom_filter and 'h3_index' in table.schema.names:
+            # NDV = celdas distintas del fichero (suelen ser miles, no millones)
+            if ndv is None:
+                ndv = len(pc.unique(table['h3_index']))
+            kwargs['bloom_filter_options'] = {'h3_index': {'ndv': max(1, ndv), 'fpp': self.bloom_filter_fpp}}
+        return kwargs
+
+    def write(self, table, path):
+        """Ordena y escribe la tabla en path de forma atómica."""
+        table = self.prepare(table)
+        write_table_atomic(table, path, **self.write_kwargs(table))
+        return table.num_rows
+
+
+def add_parquet_arguments(parser):
+    """Añade a un argparse las opciones de ParquetWriteOptions (--parquet-sort, --row-group-size, ...)."""
+    defaults = ParquetWriteOptions()
+    group = parser.add_argument_group("Parquet")
+    group.add_argument("--parquet-sort", choices=sorted(PARQUET_SORT_ORDERS), default=defaults.sort,
+                       help="Orden dentro de cada fichero: time=(datetime,h3_index), cell=(h3_index,datetime) (defecto=time)")
+    group.add_argument("--row-group-size", type=int, default=defaults.row_group_size,
+                       help=f"Filas por row group (defecto={defaults.row_group_size})")
+    group.add_argument("--parquet-compression", default=defaults.compression,
+                       help=f"Códec: zstd, snappy, gzip, none... (defecto={defaults.compression})")
+    group.add_argument("--parquet-compression-level", type=int, default=None, help="Nivel del códec (defecto: el del códec)")
+    group.add_argument("--parquet-dictionary", default="all",
+                       help="Columnas con diccionario separadas por coma, 'all' o 'none' (defecto=all)")
+    group.add_argument("--parquet-bloom-filter", action="store_true", help="Escribe bloom filter sobre h3_index")
+    return group
+
+
+def parquet_options_from_args(args):
+    """ParquetWriteOptions a partir de los argumentos de add_parquet_arguments."""
+    if args.parquet_dictionary == "all":
+        use_dictionary = True
+    elif args.parquet_dictionary == "none":
+        use_dictionary = False
+    else:
+        use_dictionary = [c.strip() for c in args.parquet_dictionary.split(",") if c.strip()]
+    return ParquetWriteOptions(
+        sort=args.parquet_sort,
+        row_group_size=args.row_group_size,
+        compression=args.parquet_compression,
+        compression_level=args.parquet_compression_level,
+        use_dictionary=use_dictionary,
+        bloom_filter=args.parquet_bloom_filter,
+    )
+
+
+def partition_dir(root, year, month):
+    """Directorio de la partición hive de un mes (mismo formato que 05: month con dos dígitos)."""
+    return os.path.join(root, f"year={year}", f"month={month:02d}")
+
+
+def partition_months(start, end):
+    """(year, month) de las particiones con filas de datetime en [start, end) (cada fila está en la de su mes)."""
+    if end <= start:
+        return []
+    last = end - timedelta(microseconds=1)
+    year, month = start.year, start.month
+    months = []
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def iter_partitions(root):
+    """(year, month, dir) de cada partición hive year=YYYY/month=MM del árbol, en orden."""
+    for month_dir in sorted(glob.glob(os.path.join(root, "year=*", "month=*"))):
+        if os.path.isdir(month_dir):
+            year = os.path.basename(os.path.dirname(month_dir)).split("=", 1)[1]
+            month = os.path.basename(month_dir).split("=", 1)[1]
+            yield year, month, month_dir
+
+
+def write_table_atomic(table, path, **write_options):
+    """Escribe la tabla en un temporal y lo renombra: un lector nunca ve un Parquet a medias."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        pq.write_table(table, tmp_path, **write_options)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class MonthPartitionWriter:
+    """Acumula filas (h3_index, datetime, value) por mes y las escribe como Parquet tipado.
+
+    add() recibe una hora completa (todas sus celdas); el mes de destino sale de la propia marca
+    de tiempo. close() escribe cada mes acumulado en <root>/year=YYYY/month=MM/part-<tag>.parquet.
+    """
+
+    def __init__(self, root, tag, options: ParquetWriteOptions = None):
+        self.root = root
+        self.tag = tag
+        self.options = options or ParquetWriteOptions()
+        self._buffers = {}   # (year, month) -> listas de arrays por columna
+        self.rows_written = 0
+        self.files_written = []
+
+    def part_path(self, year, month):
+        return os.path.join(partition_dir(self.root, year, month), f"part-{self.tag}.parquet")
+
+    def add(self, ts: datetime, h3_ids, values):
+        """Añade una hora: h3_ids (uint64) y values con la misma longitud."""
+        h3_ids = np.asarray(h3_ids, dtype=np.uint64)
+        values = np.asarray(values, dtype=np.float32)
+        if len(h3_ids) != len(values):
+            raise ValueError(f"h3_ids ({len(h3_ids)}) y values ({len(values)}) deben tener la misma longitud")
+        buf = self._buffers.setdefault((ts.year, ts.month), {'h3_index': [], 'datetime': [], 'value': []})
+        buf['h3_index'].append(h3_ids)
+        buf['datetime'].append(np.full(len(h3_ids), np.datetime64(ts, 'us')))
+        buf['value'].append(values)
+
+    def months(self):
+        return sorted(self._buffers)
+
+    def flush(self, year, month):
+        """Escribe el mes acumulado y libera su memoria. Devuelve la ruta escrita (o None si vacío)."""
+        buf = self._buffers.pop((year, month), None)
+        if not buf or not buf['h3_index']:
+            return None
+        table = pa.table({col: pa.array(np.concatenate(parts), type=H3_PARQUET_SCHEMA.field(col).type)
+                          for col, parts in buf.items()}, schema=H3_PARQUET_SCHEMA)
+        path = self.part_path(year, month)
+        self.rows_written += self.options.write(table, path)
+        self.files_written.append(path)
+        return path
+
+    def close(self):
+        """Escribe todos los meses pendientes. Devuelve la lista de ficheros escritos."""
+        for year, month in self.months():
+            self.flush(year, month)
+        return self.files_written
+
+
+class StreamingParquetWriter:
+    """Escribe un Parquet por lotes con memoria acotada (pq.ParquetWriter incremental).
+
+    write(table) acumula filas hasta completar un row group y lo vuelca al fichero. Con
+    sort='time' (o 'none') cada row group se ordena por separado: los lotes deben llegar en
+    orden cronológico, como las horas de un mes. Con sort='cell' el orden global no se puede
+    conseguir en una pasada: los lotes se acumulan hasta max_rows filas, que se ordenan y se
+    vuelcan como un tramo ordenado (run) a un Parquet temporal, y close() mezcla los tramos
+    (k-way merge) leyéndolos una sola vez por bloques. Si todo cabe en max_rows no hay
+    temporales. En ambos casos la memoria queda acotada por row_group_size y max_rows, no por
+    el tamaño del mes.
+
+    El fichero final se escribe en un temporal y se renombra en close(), igual que
+    write_table_atomic.
+    """
+
+    def __init__(self, path, schema, options: ParquetWriteOptions = None, max_rows=2_000_000):
+        self.path = path
+        self.schema = schema
+        self.options = options or ParquetWriteOptions()
+        self.max_rows = max(max_rows, self.options.row_group_size)
+        self.rows_written = 0
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._spill = self.options.sort == 'cell'
+        self._runs = []      # temporales con tramos ordenados (solo sort='cell')
+        self._writer = None
+        self._pending = []
+        self._pending_rows = 0
+        self._cells = None   # celdas distintas vistas (solo sort='cell')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _open(self, sample, ndv=None):
+        kwargs = self.options.write_kwargs(sample, ndv)
+        kwargs.pop('row_group_size')
+        self._writer = pq.ParquetWriter(self._tmp_path, self.schema, **kwargs)
+
+    def _write_row_group(self, table):
+        table = self.options.prepare(table)
+        if self._writer is None:
+            # NDV del bloom filter: todas las celdas del fichero, no solo las del primer bloque
+            self._open(table, ndv=len(self._cells) if self._cells is not None else None)
+        self._writer.write_table(table, row_group_size=self.options.row_group_size)
+        self.rows_written += table.num_rows
+
+    def _flush_pending(self, final=False):
+        if not self._pending:
+            return
+        table = pa.concat_tables(self._pending).combine_chunks()
+        self._pending, self._pending_rows = [], 0
+        size = self.options.row_group_size
+        full = (table.num_rows // size) * size
+        if final:
+            full = table.num_rows
+        if full:
+            self._write_row_group(table.slice(0, full))
+        if full < table.num_rows:
+            rest = table.slice(full)
+            self._pending, self._pending_rows = [rest], rest.num_rows
+
+    def write(self, table):
+        """Añade un lote (pa.Table o pa.RecordBatch con el esquema del escritor)."""
+        if isinstance(table, pa.RecordBatch):
+            table = pa.Table.from_batches([table])
+        table = table.select(self.schema.names).cast(self.schema)
+        if not table.num_rows:
+            return
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        if self._spill:
+            cells = pc.unique(table['h3_index'])
+            self._cells = cells if self._cells is None else pc.unique(pa.concat_arrays([self._cells, cells]))
+            if self._pending_rows >= self.max_rows:
+                self._spill_run()
+        elif self._pending_rows >= self.options.row_group_size:
+            self._flush_pending()
+
+    def _spill_run(self):
+        """Ordena lo acumulado y lo vuelca como un tramo ordenado a un temporal."""
+        table = self.options.prepare(pa.concat_tables(self._pending))
+        self._pending, self._pending_rows = [], 0
+        run = f"{self.path}.{os.getpid()}.run{len(self._runs)}"
+        self._runs.append(run)
+        pq.write_table(table, run, compression='lz4', row_group_size=self.options.row_group_size)
+
+    def _merge_runs(self):
+        """Mezcla los tramos ordenados en el fichero final leyendo cada uno una sola vez."""
+        order = PARQUET_SORT_ORDERS[self.options.sort]
+        batch_rows = max(1024, self.max_rows // len(self._runs))
+        readers = [pq.ParquetFile(run).iter_batches(batch_size=batch_rows) for run in self._runs]
+        buffers = [None] * len(readers)
+        while True:
+            for i, reader in enumerate(readers):
+                while reader is not None and (buffers[i] is None or not buffers[i].num_rows):
+                    batch = next(reader, None)
+                    if batch is None:
+                        readers[i] = reader = None
+                        buffers[i] = None
+                    else:
+                        buffers[i] = pa.Table.from_batches([batch])
+            active = [i for i, b in enumerate(buffers) if b is not None]
+            if not active:
+                break
+            # Todo lo que no supere la menor de las últimas claves de los bloques ya está en su sitio
+            bound = min(tuple(buffers[i][col][-1].as_py() for col, _ in order) for i in active)
+            chunks = []
+            for i in active:
+                n = pc.sum(_le_key(buffers[i], order, bound)).as_py() or 0
+                chunks.append(buffers[i].slice(0, n))
+                buffers[i] = buffers[i].slice(n)
+            chunk = self.options.prepare(pa.concat_tables(chunks))
+            self._pending.append(chunk)
+            self._pending_rows += chunk.num_rows
+            if self._pending_rows >= self.options.row_group_size:
+                self._flush_pending()
+        self._flush_pending(final=True)
+
+    def close(self):
+        """Vuelca lo pendiente y renombra el fichero final. Devuelve las filas escritas."""
+        try:
+            if self._runs:
+                if self._pending:
+                    self._spill_run()
+                self._merge_runs()
+            else:
+                self._flush_pending(final=True)
+            if self._writer is None:
+                return 0
+            self._writer.close()
+            self._writer = None
+            os.replace(self._tmp_path, self.path)
+            return self.rows_written
+        finally:
+            self.abort()
+
+    def abort(self):
+        """Cierra y borra los temporales sin tocar el fichero final."""
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+        self._pending = []
+        for tmp in [self._tmp_path] + self._runs:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._runs = []
+
+
+def _le_key(table, order, bound):
+    """Máscara de las filas cuya clave (columnas de order, ascendentes) es <= bound."""
+    mask = None
+    for (col, _), value in reversed(list(zip(order, bound))):
+        scalar = pa.scalar(value, type=table.schema.field(col).type)
+        if mask is None:
+            mask = pc.less_equal(table[col], scalar)
+        else:
+            mask = pc.or_(pc.less(table[col], scalar), pc.and_(pc.equal(table[col], scalar), mask))
+    return mask
+
+
+MANIFEST_NAME = '_manifest.json'
+
+
+def file_fingerprint(path, use_hash=False, previous=None):
+    """Huella de un fichero de entrada: tamaño y mtime, y opcionalmente su SHA-1.
+
+    Si previous (la huella anterior) coincide en tamaño y mtime se reutiliza su hash sin
+    volver a leer el fichero.
+    """
+    st = os.stat(path)
+    fp = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if use_hash:
+        if previous and previous.get('sha1') and previous.get('size') == fp['size'] \
+                and previous.get('mtime_ns') == fp['mtime_ns']:
+            fp['sha1'] = previous['sha1']
+        else:
+            h = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+            fp['sha1'] = h.hexdigest()
+    return fp
+
+
+def _same_fingerprint(old, new):
+    # Con hash, un fichero reescrito con el mismo contenido (mtime distinto) no cuenta como cambio
+    if 'sha1' in old and 'sha1' in new:
+        return old['sha1'] == new['sha1'] and old['size'] == new['size']
+    return old.get('size') == new['size'] and old.get('mtime_ns') == new['mtime_ns']
+
+
+class PartitionManifest:
+    """Manifiesto de un árbol year=/month=: entradas y ajustes con los que se generó cada partición.
+
+    Se guarda como <root>/_manifest.json (los lectores de Parquet ignoran ficheros que empiezan
+    por '_'). Cada entrada:
+
+        "year=2005/month=01": {
+            "inputs": {"points_20050101_01_res9.csv": {"size": ..., "mtime_ns": ...}, ...},
+            "settings": {...},          # p.ej. h3_uint64 y ParquetWriteOptions
+            "output": "year=2005/month=01/data.parquet",
+            "rows": ..., "converted_at": "2025-01-31T10:00:00"
+        }
+    """
+
+    def __init__(self, root, name=MANIFEST_NAME):
+        self.root = root
+        self.path = os.path.join(root, name)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f).get('partitions', {})
+
+    @staticmethod
+    def key(year, month):
+        return f"year={int(year)}/month={int(month):02d}"
+
+    def fingerprint_inputs(self, key, files, use_hash=False, base=None):
+        """Huellas de los ficheros de entrada de una partición.
+
+        Se identifican por nombre de fichero o, con base, por su ruta relativa a base.
+        """
+        previous = self.entries.get(key, {}).get('inputs', {})
+        names = [os.path.relpath(f, base) if base else os.path.basename(f) for f in files]
+        return {name: file_fingerprint(f, use_hash, previous.get(name)) for name, f in zip(names, files)}
+
+    def is_current(self, key, inputs, settings):
+        """True si la partición existe y se generó con exactamente estas entradas y ajustes."""
+        entry = self.entries.get(key)
+        if not entry or entry.get('settings') != settings:
+            return False
+        if not os.path.exists(os.path.join(self.root, entry.get('output', ''))):
+            return False
+        old = entry.get('inputs', {})
+        return old.keys() == inputs.keys() and all(_same_fingerprint(old[n], fp) for n, fp in inputs.items())
+
+    def record(self, key, inputs, settings, output_file, **info):
+        self.entries[key] = dict(inputs=inputs, settings=settings,
+                                 output=os.path.relpath(output_file, self.root),
+                                 converted_at=datetime.now().isoformat(timespec='seconds'), **info)
+
+    def forget(self, key):
+        self.entries.pop(key, None)
+
+    def converted_since(self, timestamp):
+        """Claves de las particiones convertidas en o después de timestamp (ISO 8601)."""
+        return sorted(k for k, e in self.entries.items() if e.get('converted_at', '') >= timestamp)
+
+    def save(self):
+        """Escribe el manifiesto de forma atómica (temporal + rename)."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'partitions': self.entries}, f, indent=1, sort_keys=True, default=str)
+        os.replace(tmp_path, self.path)
+
+
+def parquet_settings(options: ParquetWriteOptions, **extra):
+    """Ajustes de escritura serializables para el manifiesto (un cambio obliga a reconvertir)."""
+    settings = asdict(options)
+    settings.update(extra)
+    return json.loads(json.dumps(settings, default=str))
@@ -0,0 +1,200 @@
+"""
+Capa de consulta persistente sobre el árbol Parquet year=YYYY/month=MM con DuckDB.
+
+ParquetQueryService mantiene una única conexión DuckDB y, por partición, la lista de ficheros
+(se lista cada year=/month= una sola vez). Cada consulta recibe un rango de tiempo [start, end)
+que se traduce en la lista explícita de particiones que pueden contenerlo
+(functions_parquet.partition_months), en lugar de read_parquet('**/*.parquet') más un filtro
+sobre year/month: DuckDB no tiene que listar todo el árbol ni abrir el pie de cada fichero, y el
+filtro por datetime que se añade dentro del rango poda además row groups por estadísticas.
+Filtros que no se pueden empujar a las particiones (la hora del día, EXTRACT(HOUR ...)) se
+aplican después, sobre los pocos ficheros ya seleccionados.
+
+Funciones tipadas (devuelven pandas.DataFrame; h3_index siempre como texto hex aunque el árbol
+lo guarde como uint64):
+
+    cell_series(cell, start, end, hour=None)    datetime, value
+    snapshot(at)                                h3_index, value
+    top_cells(start, end, n=10)                 h3_index, num_mediciones, avg_value, max_value
+    daily_stats(start, end, cell=None)          day, num_mediciones, avg_value, min_value, max_value, stddev_value
+    hourly_profile(start, end)                  hora, num_mediciones, avg_value, max_value
+
+Son la base de 06_query_parquet_example.py y de una futura API: el servicio se crea una vez y se
+reutiliza entre peticiones (no es seguro usar la misma instancia desde varios hilos a la vez;
+client() devuelve otra sesión sobre la misma base y la misma caché de ficheros).
+
+Uso:
+    from functions_parquet_query import ParquetQueryService
+    with ParquetQueryService('/Volumes/MV/carto/madno2Parquet') as service:
+        df = service.cell_series('89390ca0083ffff', datetime(2010, 12, 1), datetime(2011, 1, 1), hour=15)
+"""
+import copy
+import glob
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from functions_h3index import duckdb_h3_to_text
+from functions_parquet import iter_partitions, partition_dir, partition_months
+
+
+class ParquetQueryService:
+    """Conexión DuckDB persistente y listado de ficheros cacheado por partición."""
+
+    def __init__(self, root, h3_uint64=None, threads=None, memory_limit=None):
+        """root: raíz del árbol. h3_uint64: tipo de h3_index en los ficheros (None: se detecta)."""
+        self.root = root
+        self.threads, self.memory_limit = threads, memory_limit
+        self._h3_uint64 = h3_uint64
+        self._files = {}
+        self.conn = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        import duckdb
+        if self.conn is None:
+            self.conn = duckdb.connect()
+            if self.threads:
+                self.conn.execute(f"SET threads = {int(self.threads)}")
+            if self.memory_limit:
+                self.conn.execute(f"SET memory_limit = '{self.memory_limit}'")
+        return self
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def client(self):
+        """Otra sesión (cursor) sobre la misma base DuckDB, para usar desde otro hilo."""
+        other = copy.copy(self)
+        other.conn = self.open().conn.cursor()
+        return other
+
+    # --- Particiones ---
+
+    def partition_files(self, year, month):
+        """Ficheros .parquet de una partición (listados una vez y cacheados)."""
+        key = (year, month)
+        if key not in self._files:
+            self._files[key] = sorted(glob.glob(os.path.join(partition_dir(self.root, year, month), '*.parquet')))
+        return self._files[key]
+
+    def refresh(self):
+        """Olvida los listados cacheados (tras regenerar o añadir particiones)."""
+        self._files.clear()
+
+    def files_for_range(self, start, end):
+        """Ficheros de las particiones que pueden contener datetime en [start, end)."""
+        return [f for ym in partition_months(start, end) for f in self.partition_files(*ym)]
+
+    def time_span(self):
+        """[inicio, fin) que cubre todo el árbol: del día 1 de la primera partición al día 1 tras la última."""
+        months = [(int(y), int(m)) for y, m, _ in iter_partitions(self.root)]
+        if not months:
+            now = datetime.now()
+            return now, now
+        (y0, m0), (y1, m1) = months[0], months[-1]
+        end = datetime(y1 + 1, 1, 1) if m1 == 12 else datetime(y1, m1 + 1, 1)
+        return datetime(y0, m0, 1), end
+
+    @property
+    def h3_uint64(self):
+        """True si h3_index está guardado como uint64 (detectado en el primer fichero del árbol)."""
+        if self._h3_uint64 is None:
+            first = next(iter(sorted(glob.glob(os.path.join(self.root, 'year=*', 'month=*', '*.parquet')))), None)
+            if first is None:
+                return False
+            self._h3_uint64 = pa.types.is_unsigned_integer(pq.read_schema(first).field('h3_index').type)
+        return self._h3_uint64
+
+    # --- SQL ---
+
+    def _source(self, files):
+        if not files:
+            # Relación vacía con los tipos de los ficheros: el DataFrame sale vacío pero con sus columnas y dtypes
+            h3_type = 'UBIGINT' if self.h3_uint64 else 'VARCHAR'
+            return f"(SELECT NULL::{h3_type} AS h3_index, NULL::TIMESTAMP AS datetime, NULL::FLOAT AS value WHERE false)"
+        file_list = ', '.join("'" + f.replace("'", "''") + "'" for f in files)
+        return f"read_parquet([{file_list}], hive_partitioning = false, union_by_name = true)"
+
+    def _h3_param(self, cell):
+        return int(cell, 16) if self.h3_uint64 else cell
+
+    def _h3_select(self):
+        return f"{duckdb_h3_to_text('h3_index')} AS h3_index" if self.h3_uint64 else "h3_index"
+
+    def query(self, sql, start, end, params=()):
+        """Ejecuta `sql` con {src} = ficheros de [start, end); los dos primeros parámetros son start y end."""
+        src = self._source(self.files_for_range(start, end))
+        return self.conn.execute(sql.format(src=src), [start, end, *params]).df()
+
+    # --- Consultas tipadas ---
+
+    def cell_series(self, cell: str, start: datetime, end: datetime, hour: int = None) -> pd.DataFrame:
+        """Serie horaria de una celda en [start, end); con hour, solo esa hora del día (0-23)."""
+        hour_filter = "AND hour(datetime) = ?" if hour is not None else ""
+        params = [self._h3_param(cell)] + ([hour] if hour is not None else [])
+        sql = f"""
+            SELECT datetime, value
+            FROM {{src}}
+            WHERE datetime >= ? AND datetime < ? AND h3_index = ? {hour_filter}
+            ORDER BY datetime
+        """
+        return self.query(sql, start, end, params)
+
+    def snapshot(self, at: datetime) -> pd.DataFrame:
+        """Valor de todas las celdas en la hora `at` (una sola partición)."""
+        sql = f"""
+            SELECT {self._h3_select()}, value
+            FROM {{src}}
+            WHERE datetime >= ? AND datetime < ?
+            ORDER BY h3_index
+        """
+        return self.query(sql, at, at + timedelta(hours=1))
+
+    def top_cells(self, start: datetime, end: datetime, n: int = 10) -> pd.DataFrame:
+        """Las n celdas con mayor media en [start, end)."""
+        sql = f"""
+            SELECT {self._h3_select()}, COUNT(*) AS num_mediciones, AVG(value) AS avg_value, MAX(value) AS max_value
+            FROM {{src}}
+            WHERE datetime >= ? AND datetime < ?
+            GROUP BY h3_index
+            ORDER BY avg_value DESC
+            LIMIT ?
+        """
+        return self.query(sql, start, end, [int(n)])
+
+    def daily_stats(self, start: datetime, end: datetime, cell: str = None) -> pd.DataFrame:
+        """Estadísticas por día natural en [start, end), de toda la zona o de una celda."""
+        cell_filter = "AND h3_index = ?" if cell else ""
+        params = [self._h3_param(cell)] if cell else []
+        sql = f"""
+            SELECT CAST(datetime AS DATE) AS day, COUNT(*) AS num_mediciones, AVG(value) AS avg_value,
+                   MIN(value) AS min_value, MAX(value) AS max_value, STDDEV(value) AS stddev_value
+            FROM {{src}}
+            WHERE datetime >= ? AND datetime < ? {cell_filter}
+            GROUP BY day
+            ORDER BY day
+        """
+        return self.query(sql, start, end, params)
+
+    def hourly_profile(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """Media por hora del día (0-23) de todas las celdas en [start, end)."""
+        sql = """
+            SELECT hour(datetime) AS hora, COUNT(*) AS num_mediciones, AVG(value) AS avg_value, MAX(value) AS max_value
+            FROM {src}
+            WHERE datetime >= ? AND datetime < ?
+            GROUP BY hora
+            ORDER BY hora
+        """
+        return self.query(sql, start, end)
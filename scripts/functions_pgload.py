@@ -0,0 +1,694 @@
+"""
+Carga masiva de puntos H3 (h3_index, datetime, value) en PostgreSQL.
+
+En lugar de un COPY + INSERT ... ON CONFLICT + commit por cada CSV horario (~8.760 transacciones
+por año), cada lote (un mes de CSV o una partición Parquet year=/month=) se envía en un único
+COPY a una tabla de staging UNLOGGED y se fusiona con la tabla final en una sola sentencia:
+
+    TRUNCATE stage;  COPY stage FROM STDIN;  INSERT INTO tabla SELECT ... FROM stage ON CONFLICT ...;  COMMIT
+
+Las particiones Parquet (05_from_csv_to_geoparquet.py, 04 --format parquet) se leen con pyarrow
+por lotes y se envían en formato binario de COPY (encode_binary_copy), sin pasar por CSV: el
+servidor no parsea texto y los CSV horarios dejan de ser necesarios para cargar la base de datos.
+
+Los lotes se reparten entre N conexiones en paralelo (un hilo por conexión, cada una con su
+propia tabla de staging {table}_stage_<n>).
+
+Carga inicial (mode='initial'): con la tabla vacía se quitan la PRIMARY KEY y el índice por dt
+(drop_indexes), cada lote entra con un COPY directo a la tabla (o staging + INSERT sin
+ON CONFLICT si hay que convertir h3_index) y al final build_indexes crea la PK y el índice
+(btree o BRIN) de una vez. El modo 'upsert' sigue siendo el de las cargas incrementales.
+
+La tabla puede declararse particionada por rango de dt (PARTITION BY RANGE, una partición
+por año o por mes): ensure_partitions crea las particiones de los lotes antes de cargar.
+
+Checkpoints: cada lote registra en {schema}.load_checkpoint (en la misma transacción que sus
+filas) su clave y la huella de sus ficheros, así que una carga interrumpida se reanuda saltando
+los lotes ya confirmados; si un fichero cambia, su lote se vuelve a cargar.
+
+Las conexiones salen de un ThreadedConnectionPool (make_pool), opcionalmente a través de un
+túnel SSH (open_system_ssh_tunnel). El cargador de línea de comandos es 06_loadIntoDb.py.
+
+Uso:
+    from functions_pgload import csv_batches, bulk_load, make_pool
+    pool = make_pool('localhost', 5432, 'gis', 'gis', '...', size=4)
+    results = bulk_load(pool, csv_batches(paths), 'madno', 'h3_points', workers=4)
+"""
+import glob
+import hashlib
+import io
+import json
+import os
+import queue
+import re
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import numpy as np
+import psycopg2
+import psycopg2.pool
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from functions_h3index import pg_h3_column_type, pg_h3_to_bigint, pg_h3_to_text
+from functions_parquet import file_fingerprint, iter_partitions
+
+_CSV_MONTH_RE = re.compile(r'points_(\d{4})(\d{2})\d{2}_')
+
+LOAD_MODES = ('upsert', 'initial')
+PARTITION_LAYOUTS = ('none', 'year', 'month')
+DT_INDEX_METHODS = ('btree', 'brin')
+
+DDL_SCHEMA_AND_TABLE = """
+CREATE SCHEMA IF NOT EXISTS {schema};
+
+CREATE TABLE IF NOT EXISTS {schema}.{table} (
+  h3_index {h3_type} NOT NULL,
+  dt       TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+  value    DOUBLE PRECISION NOT NULL,
+  PRIMARY KEY (h3_index, dt)
+){partition_clause};
+
+CREATE INDEX IF NOT EXISTS {table}_dt_idx ON {schema}.{table} USING {dt_index} (dt);
+"""
+
+DDL_CHECKPOINT = """
+CREATE TABLE IF NOT EXISTS {schema}.load_checkpoint (
+  target      TEXT NOT NULL,
+  batch       TEXT NOT NULL,
+  fingerprint TEXT NOT NULL,
+  rows        BIGINT,
+  bytes       BIGINT,
+  seconds     DOUBLE PRECISION,
+  mode        TEXT,
+  loaded_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (target, batch)
+);
+ALTER TABLE {schema}.load_checkpoint ADD COLUMN IF NOT EXISTS mode TEXT;
+"""
+
+DDL_STAGE = """
+CREATE UNLOGGED TABLE IF NOT EXISTS {schema}.{stage} (
+  h3_index {h3_type},
+  dt       TIMESTAMP WITHOUT TIME ZONE,
+  value    DOUBLE PRECISION
+);
+TRUNCATE {schema}.{stage};
+"""
+
+
+@dataclass
+class LoadBatch:
+    """Un lote de carga: los ficheros de un mes (CSV), de una partición (Parquet) o un solo CSV."""
+    year: int
+    month: int
+    files: list
+    kind: str = 'csv'         # 'csv' | 'parquet'
+    h3_source: str = 'hex'    # 'hex' (texto) | 'bigint' (uint64 en Parquet)
+    nbytes: int = field(default=0)
+    name: str = ''            # clave explícita (modo por fichero: el nombre del CSV)
+
+    @property
+    def label(self):
+        return self.name or f"{self.year}-{self.month:02d}"
+
+    @property
+    def key(self):
+        """Clave del lote en load_checkpoint."""
+        return f"{self.kind}:{self.label}"
+
+    def fingerprint(self):
+        """Huella de los ficheros del lote (nombre, tamaño y mtime)."""
+        parts = sorted((os.path.basename(f), file_fingerprint(f)) for f in self.files)
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+# --- Lectores para COPY (objetos con read(size) que psycopg2.copy_expert va consumiendo) ---
+
+class _ChunkReader(io.RawIOBase):
+    """Adapta un generador de bloques de bytes a un fichero de solo lectura."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b''
+        self.bytes_sent = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while not self._buf:
+            try:
+                self._buf = next(self._chunks)
+            except StopIteration:
+                return b''
+        if size is None or size < 0:
+            size = len(self._buf)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        self.bytes_sent += len(data)
+        return data
+
+
+def _csv_chunks(paths, block_size=1 << 20):
+    """Concatena varios CSV sin sus cabeceras (cada fichero termina en salto de línea)."""
+    for path in paths:
+        with open(path, 'rb') as f:
+            f.readline()
+            last = b'\n'
+            for block in iter(lambda: f.read(block_size), b''):
+                last = block[-1:]
+                yield block
+            if last != b'\n':
+                yield b'\n'
+
+
+# Formato binario de COPY: cabecera, una tupla por fila (nº de campos + longitud y valor de cada
+# campo, big-endian) y el terminador -1. timestamp = microsegundos desde 2000-01-01.
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + (0).to_bytes(4, 'big') + (0).to_bytes(4, 'big')
+PGCOPY_TRAILER = (-1).to_bytes(2, 'big', signed=True)
+_PG_EPOCH_US = 946684800 * 1_000_000
+
+
+def encode_binary_copy(h3_index, dt, value):
+    """Codifica columnas Arrow (h3_index, datetime, value) como tuplas de COPY binario.
+
+    h3_index entero (uint64/int64) -> BIGINT; texto -> TEXT. Sin nulos (la tabla es NOT NULL).
+    """
+    n = len(value)
+    if h3_index.null_count or dt.null_count or value.null_count:
+        raise ValueError("COPY binario: h3_index, datetime y value no admiten nulos")
+    if pa.types.is_integer(h3_index.type):
+        h3_dtype, h3_len = '>i8', 8
+        h3_values = np.asarray(h3_index.cast(pa.uint64()).to_numpy(zero_copy_only=False)).view(np.int64)
+    else:
+        h3_text = pc.cast(h3_index, pa.string())
+        lengths = pc.utf8_length(h3_text)
+        h3_len = pc.max(lengths).as_py() if n else 0
+        if n and pc.min(lengths).as_py() != h3_len:
+            # Índices de distinta longitud (no pasa con H3 de una misma resolución): fila a fila
+            return b''.join(encode_binary_copy(h3_index.slice(i, 1), dt.slice(i, 1), value.slice(i, 1))
+                            for i in range(n))
+        h3_dtype = f'S{h3_len}'
+        h3_values = np.asarray(h3_text.to_numpy(zero_copy_only=False), dtype=h3_dtype)
+
+    dt_us = np.asarray(pc.cast(dt, pa.timestamp('us')).cast(pa.int64()).to_numpy(zero_copy_only=False))
+    rows = np.empty(n, dtype=[('nfields', '>i2'),
+                              ('h3_len', '>i4'), ('h3', h3_dtype),
+                              ('dt_len', '>i4'), ('dt', '>i8'),
+                              ('v_len', '>i4'), ('v', '>f8')])
+    rows['nfields'] = 3
+    rows['h3_len'] = h3_len
+    rows['h3'] = h3_values
+    rows['dt_len'] = 8
+    rows['dt'] = dt_us - _PG_EPOCH_US
+    rows['v_len'] = 8
+    if pa.types.is_float32(value.type):
+        # Vía texto (representación más corta) para que 45.14 float32 llegue como 45.14 y no como
+        # 45.13999938..., igual que al cargar desde CSV
+        value = pc.cast(value, pa.string())
+    rows['v'] = np.asarray(pc.cast(value, pa.float64()).to_numpy(zero_copy_only=False))
+    return rows.tobytes()
+
+
+def _parquet_binary_chunks(paths, batch_size=262144):
+    """Lee varios Parquet por lotes y los emite como un único flujo de COPY binario."""
+    yield PGCOPY_HEADER
+    for path in paths:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=['h3_index', 'datetime', 'value']):
+            yield encode_binary_copy(batch.column('h3_index'), batch.column('datetime'), batch.column('value'))
+    yield PGCOPY_TRAILER
+
+
+def batch_reader(batch):
+    """Lector del lote para COPY ... FROM STDIN (binario para Parquet, CSV para CSV)."""
+    if batch.kind == 'parquet':
+        return _ChunkReader(_parquet_binary_chunks(batch.files))
+    return _ChunkReader(_csv_chunks(batch.files))
+
+
+def copy_options(batch):
+    """Opciones de COPY según el origen del lote."""
+    return "(FORMAT binary)" if batch.kind == 'parquet' else "(FORMAT csv)"
+
+
+# --- Descubrimiento de lotes ---
+
+def csv_batches(paths):
+    """Agrupa CSV points_YYYYMMDD_HH_res*.csv por mes -> lista de LoadBatch en orden."""
+    months = defaultdict(list)
+    for path in paths:
+        m = _CSV_MONTH_RE.search(os.path.basename(path))
+        if not m:
+            raise ValueError(f"No se reconoce la fecha en el nombre del CSV: {path}")
+        months[(int(m.group(1)), int(m.group(2)))].append(path)
+    return [LoadBatch(y, mo, sorted(files), 'csv', 'hex', sum(os.path.getsize(f) for f in files))
+            for (y, mo), files in sorted(months.items())]
+
+
+def csv_month(path):
+    """(year, month) del primer datetime de un CSV, para los que no llevan la fecha en el nombre."""
+    table = pacsv.read_csv(path, convert_options=pacsv.ConvertOptions(
+        include_columns=['datetime'], column_types={'datetime': pa.string()}))
+    first = pc.min(table['datetime']).as_py() if table.num_rows else None
+    m = re.match(r'(\d{4})-(\d{2})', first or '')
+    if not m:
+        raise ValueError(f"No se puede fechar el CSV {path}: ni el nombre (points_YYYYMMDD_HH_...) "
+                         f"ni la columna datetime dan su mes")
+    return int(m.group(1)), int(m.group(2))
+
+
+def file_batches(paths):
+    """Una LoadBatch por CSV (modo por fichero: una transacción por hora, como los cargadores antiguos).
+
+    El mes del lote (particiones y rollups) sale del nombre o, si no lo lleva, de su columna datetime.
+    """
+    batches = []
+    for path in sorted(paths):
+        m = _CSV_MONTH_RE.search(os.path.basename(path))
+        year, month = (int(m.group(1)), int(m.group(2))) if m else csv_month(path)
+        batches.append(LoadBatch(year, month, [path], 'csv', 'hex', os.path.getsize(path), os.path.basename(path)))
+    return batches
+
+
+def iter_csv_paths(input_path: str, glob_pattern: str | None):
+    if glob_pattern:
+        for p in sorted(glob.glob(glob_pattern)):
+            if os.path.isfile(p):
+                yield p
+        return
+    if os.path.isdir(input_path):
+        for p in sorted(glob.glob(os.path.join(input_path, "*.csv"))):
+            if os.path.isfile(p):
+                yield p
+    elif os.path.isfile(input_path):
+        yield input_path
+    else:
+        raise FileNotFoundError(f"No existe la ruta: {input_path}")
+
+
+def parquet_batches(root, years=None):
+    """Una LoadBatch por partición year=/month= del árbol Parquet (opcionalmente solo ciertos años).
+
+    El COPY binario de un lote lleva un único tipo de h3_index, así que se comprueba el esquema de
+    todos los ficheros: una partición que mezcle texto hex y uint64 es un error.
+    """
+    batches = []
+    mixed = []
+    for year, month, month_dir in iter_partitions(root):
+        if years and int(year) not in years:
+            continue
+        files = sorted(glob.glob(os.path.join(month_dir, '*.parquet')))
+        if not files:
+            continue
+        sources = {f: 'bigint' if pa.types.is_integer(pq.read_schema(f).field('h3_index').type) else 'hex'
+                   for f in files}
+        if len(set(sources.values())) > 1:
+            mixed.append(f"{month_dir} (" + ", ".join(f"{os.path.basename(f)}={s}" for f, s in sources.items()) + ")")
+            continue
+        batches.append(LoadBatch(int(year), int(month), files, 'parquet', sources[files[0]],
+                                 sum(os.path.getsize(f) for f in files)))
+    if mixed:
+        raise ValueError("Particiones con h3_index de distinto tipo (texto hex y uint64): " + "; ".join(mixed)
+                         + ". Unifícalas con scripts/05_optimize_parquet.py --in-place --h3-uint64")
+    return batches
+
+
+# --- Conexiones ---
+
+def make_pool(host, port, dbname, user, password, size=4):
+    """Pool de conexiones para los hilos de carga (una por worker más la de control)."""
+    return psycopg2.pool.ThreadedConnectionPool(1, size, host=host, port=port, dbname=dbname,
+                                                user=user, password=password)
+
+
+def _rollback(conn):
+    """Deshace la transacción abierta. False si la conexión está cerrada o rota."""
+    if conn.closed:
+        return False
+    try:
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def pooled_conn(pool):
+    """Conexión del pool; se devuelve al salir (con rollback si quedó una transacción abierta)."""
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn)
+
+
+@contextmanager
+def open_system_ssh_tunnel(ssh_host: str, ssh_port: int, ssh_user: str,
+                            ssh_password: str | None,
+                            remote_pg_host: str, remote_pg_port: int):
+    """
+    Abre un túnel SSH usando el binario del sistema `ssh`. Si `sshpass` está disponible y
+    se proporciona `ssh_password`, se usará para evitar prompts interactivos.
+    Devuelve (local_host, local_port).
+    """
+    if not shutil.which("ssh"):
+        raise RuntimeError("No se encontró el binario 'ssh' en PATH.")
+
+    # Reserva un puerto local libre
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        _, local_port = s.getsockname()
+    local_host = "127.0.0.1"
+
+    base_ssh = [
+        "ssh",
+        "-N",
+        "-L", f"{local_host}:{local_port}:{remote_pg_host}:{remote_pg_port}",
+        "-p", str(ssh_port),
+        "-o", "ExitOnForwardFailure=yes",
+        "-o", "ServerAliveInterval=30",
+        "-o", "StrictHostKeyChecking=no",
+        f"{ssh_user}@{ssh_host}",
+    ]
+
+    # Si hay password y sshpass disponible, úsalo
+    if ssh_password and shutil.which("sshpass"):
+        cmd = ["sshpass", "-p", ssh_password] + base_ssh
+    else:
+        cmd = base_ssh
+
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        # Espera hasta que el puerto esté levantado o se agote el tiempo
+        deadline = time.time() + 15
+        last_err = None
+        while time.time() < deadline:
+            try:
+                with socket.create_connection((local_host, local_port), timeout=0.3):
+                    break
+            except Exception as e:
+                last_err = e
+                time.sleep(0.2)
+        else:
+            stderr = b""
+            try:
+                stderr = proc.stderr.read(4000) or b""
+            except Exception:
+                pass
+            raise RuntimeError(f"No se pudo establecer el túnel SSH en {local_host}:{local_port}. Detalle: {last_err}\n{stderr.decode(errors='ignore')}")
+
+        yield (local_host, local_port)
+    finally:
+        if proc and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+# --- Tabla destino ---
+
+def ensure_schema_and_table(cur, schema: str, table: str, h3_mode: str = "text",
+                            partition_by: str = "none", dt_index: str = "btree"):
+    h3_type = pg_h3_column_type(h3_mode)
+    # Particionada: una partición por año o mes de dt (se crean con ensure_partitions antes de cargar)
+    partition_clause = "" if partition_by == "none" else " PARTITION BY RANGE (dt)"
+    cur.execute(DDL_SCHEMA_AND_TABLE.format(schema=schema, table=table, h3_type=h3_type,
+                                            partition_clause=partition_clause, dt_index=dt_index))
+
+    # Si la tabla ya existía, su h3_index debe coincidir con el modo pedido
+    # (un BIGINT insertado en una columna TEXT se guardaría como texto decimal)
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s AND column_name = 'h3_index'
+    """, (schema, table))
+    row = cur.fetchone()
+    if row and row[0].lower() != h3_type.lower():
+        raise RuntimeError(
+            f"{schema}.{table}.h3_index es {row[0]} pero --h3-mode {h3_mode} requiere {h3_type}. "
+            f"Migra la tabla con scripts/06_migrate_h3_index_bigint.py o usa el modo correspondiente.")
+
+    if is_partitioned(cur, schema, table) != (partition_by != "none"):
+        raise RuntimeError(
+            f"{schema}.{table} {'está' if partition_by == 'none' else 'no está'} particionada por dt: "
+            f"usa el --partition-by de la tabla (o recréala con el que quieras).")
+
+
+# --- Checkpoints ---
+
+def ensure_checkpoint_table(cur, schema):
+    cur.execute(DDL_CHECKPOINT.format(schema=schema))
+
+
+def committed_batches(cur, schema, target):
+    """{clave de lote: huella} de los lotes ya confirmados para la tabla target (schema.table)."""
+    cur.execute(f"SELECT batch, fingerprint FROM {schema}.load_checkpoint WHERE target = %s", (target,))
+    return dict(cur.fetchall())
+
+
+def checkpoint_modes(cur, schema, target):
+    """Modos de carga ('initial', 'upsert') con los que se confirmaron los lotes de target."""
+    cur.execute(f"SELECT DISTINCT COALESCE(mode, 'upsert') FROM {schema}.load_checkpoint WHERE target = %s",
+                (target,))
+    return {row[0] for row in cur.fetchall()}
+
+
+def reset_checkpoints(cur, schema, target):
+    cur.execute(f"DELETE FROM {schema}.load_checkpoint WHERE target = %s", (target,))
+
+
+def pending_batches(batches, committed):
+    """Lotes que faltan: sin checkpoint o con ficheros cambiados desde entonces."""
+    return [b for b in batches if committed.get(b.key) != b.fingerprint()]
+
+
+def _record_checkpoint(cur, schema, target, batch, rows, nbytes, seconds, mode):
+    cur.execute(f"""
+        INSERT INTO {schema}.load_checkpoint (target, batch, fingerprint, rows, bytes, seconds, mode)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (target, batch) DO UPDATE
+        SET fingerprint = EXCLUDED.fingerprint, rows = EXCLUDED.rows, bytes = EXCLUDED.bytes,
+            seconds = EXCLUDED.seconds, mode = EXCLUDED.mode, loaded_at = now();
+    """, (target, batch.key, batch.fingerprint(), rows, nbytes, seconds, mode))
+
+
+# --- Particiones e índices ---
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def partition_bounds(partition_by, year, month):
+    """(sufijo, inicio, fin) de la partición de dt que contiene year/month."""
+    if partition_by == 'year':
+        return f"y{year}", f"{year}-01-01", f"{year + 1}-01-01"
+    if partition_by == 'month':
+        ny, nm = _next_month(year, month)
+        return f"y{year}m{month:02d}", f"{year}-{month:02d}-01", f"{ny}-{nm:02d}-01"
+    raise ValueError(f"Particionado desconocido: {partition_by!r}. Opciones: {PARTITION_LAYOUTS}")
+
+
+def ensure_partitions(cur, schema, table, partition_by, batches):
+    """Crea las particiones que necesitan los lotes (su mes y el siguiente: H24 del último día)."""
+    months = set()
+    for batch in batches:
+        months.add((batch.year, batch.month))
+        months.add(_next_month(batch.year, batch.month))
+    created = []
+    for suffix, start, end in sorted({partition_bounds(partition_by, y, m) for y, m in months}):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.{table}_{suffix}
+            PARTITION OF {schema}.{table} FOR VALUES FROM ('{start}') TO ('{end}');
+        """)
+        created.append(f"{table}_{suffix}")
+    return created
+
+
+def is_partitioned(cur, schema, table):
+    """True si la tabla existe y está declarada PARTITION BY."""
+    cur.execute("""
+        SELECT c.relkind = 'p' FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+    """, (schema, table))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def has_primary_key(cur, schema, table):
+    """True si la tabla tiene PRIMARY KEY (una carga inicial sin terminar no la tiene)."""
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM pg_constraint c JOIN pg_class r ON r.oid = c.conrelid
+                       JOIN pg_namespace n ON n.oid = r.relnamespace
+                       WHERE n.nspname = %s AND r.relname = %s AND c.contype = 'p')
+    """, (schema, table))
+    return cur.fetchone()[0]
+
+
+def drop_indexes(cur, schema, table):
+    """Quita la PRIMARY KEY y el índice por dt antes de una carga inicial."""
+    cur.execute(f"ALTER TABLE {schema}.{table} DROP CONSTRAINT IF EXISTS {table}_pkey;")
+    cur.execute(f"DROP INDEX IF EXISTS {schema}.{table}_dt_idx;")
+
+
+def build_indexes(cur, schema, table, dt_index='btree', maintenance_work_mem=None):
+    """Crea la PRIMARY KEY (h3_index, dt) y el índice por dt tras la carga inicial, y analiza la tabla."""
+    if dt_index not in DT_INDEX_METHODS:
+        raise ValueError(f"Índice por dt desconocido: {dt_index!r}. Opciones: {DT_INDEX_METHODS}")
+    if maintenance_work_mem:
+        cur.execute("SELECT set_config('maintenance_work_mem', %s, false);", (maintenance_work_mem,))
+    cur.execute(f"ALTER TABLE {schema}.{table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (h3_index, dt);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_dt_idx ON {schema}.{table} USING {dt_index} (dt);")
+    cur.execute(f"ANALYZE {schema}.{table};")
+
+
+# --- SQL ---
+
+def stage_name(table, worker):
+    return f"{table}_stage_{worker}"
+
+
+def _h3_expr(h3_mode, h3_source):
+    if h3_mode == 'uint64' and h3_source == 'hex':
+        return pg_h3_to_bigint('h3_index')
+    if h3_mode == 'text' and h3_source == 'bigint':
+        return pg_h3_to_text('h3_index')
+    return 'h3_index'
+
+
+def merge_sql(schema, table, stage, h3_mode='text', h3_source='hex', upsert=True):
+    """INSERT desde la tabla de staging, convirtiendo h3_index si hace falta.
+
+    Con upsert=False (carga inicial, sin PK) no lleva ON CONFLICT.
+    """
+    sql = f"""
+        INSERT INTO {schema}.{table} AS t (h3_index, dt, value)
+        SELECT {_h3_expr(h3_mode, h3_source)}, dt, value
+        FROM {schema}.{stage}
+    """
+    if upsert:
+        sql += """
+        ON CONFLICT (h3_index, dt) DO UPDATE
+        SET value = EXCLUDED.value
+    """
+    return sql + ";"
+
+
+def load_batch(conn, schema, table, stage, batch, h3_mode='text', mode='upsert', checkpoint=True):
+    """Carga un lote en una transacción. Devuelve (filas, bytes enviados por COPY).
+
+    upsert:  TRUNCATE + COPY a staging + INSERT ... ON CONFLICT.
+    initial: COPY directo a la tabla (o staging + INSERT si h3_index necesita conversión).
+    Con checkpoint, la fila de load_checkpoint se confirma en la misma transacción.
+    """
+    t0 = time.time()
+    h3_type = 'BIGINT' if batch.h3_source == 'bigint' else 'TEXT'
+    # El COPY binario exige el tipo exacto de cada columna: una staging por tipo de origen
+    stage = f"{stage}_{h3_type.lower()}"
+    reader = batch_reader(batch)
+    with conn.cursor() as cur:
+        if mode == 'initial' and _h3_expr(h3_mode, batch.h3_source) == 'h3_index':
+            cur.copy_expert(f"COPY {schema}.{table} (h3_index, dt, value) FROM STDIN WITH {copy_options(batch)}", reader)
+            rows = cur.rowcount
+        else:
+            cur.execute(DDL_STAGE.format(schema=schema, stage=stage, h3_type=h3_type))
+            cur.copy_expert(f"COPY {schema}.{stage} (h3_index, dt, value) FROM STDIN WITH {copy_options(batch)}", reader)
+            rows = cur.rowcount
+            cur.execute(merge_sql(schema, table, stage, h3_mode, batch.h3_source, upsert=(mode == 'upsert')))
+            cur.execute(f"TRUNCATE {schema}.{stage};")
+        if checkpoint:
+            _record_checkpoint(cur, schema, f"{schema}.{table}", batch, rows, reader.bytes_sent, time.time() - t0,
+                               mode)
+    conn.commit()
+    return rows, reader.bytes_sent
+
+
+def bulk_load(pool, batches, schema, table, h3_mode='text', workers=4, on_done=None, mode='upsert',
+              checkpoint=True):
+    """Carga los lotes repartidos entre `workers` conexiones del pool (make_pool).
+
+    mode: 'upsert' (merge con ON CONFLICT) o 'initial' (tabla vacía y sin índices, ver drop_indexes).
+    checkpoint: registra cada lote confirmado en {schema}.load_checkpoint (ensure_checkpoint_table).
+    on_done(result) se llama al terminar cada lote (p.ej. para actualizar una barra de progreso).
+    Devuelve una lista de dicts: label, rows, bytes, seconds, error.
+    """
+    pending = queue.Queue()
+    for batch in batches:
+        pending.put(batch)
+    results = []
+    lock = threading.Lock()
+
+    def worker(n):
+        stage = stage_name(table, n)
+        conn = None
+        try:
+            while True:
+                try:
+                    batch = pending.get_nowait()
+                except queue.Empty:
+                    break
+                t0 = time.time()
+                result = {'label': batch.label, 'rows': 0, 'bytes': 0, 'input_bytes': batch.nbytes, 'error': None}
+                try:
+                    if conn is None:
+                        conn = pool.getconn()
+                    result['rows'], result['bytes'] = load_batch(conn, schema, table, stage, batch, h3_mode,
+                                                                 mode, checkpoint)
+                except Exception as e:
+                    result['error'] = str(e).strip()
+                    if conn is not None and not _rollback(conn):
+                        # Conexión perdida: se descarta y el siguiente lote pide otra al pool
+                        pool.putconn(conn, close=True)
+                        conn = None
+                result['seconds'] = time.time() - t0
+                with lock:
+                    results.append(result)
+                    if on_done:
+                        on_done(result)
+            if conn is None:
+                conn = pool.getconn()
+            # Las tablas de staging son por worker: otra conexión también puede borrarlas
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {schema}.{stage}_bigint, {schema}.{stage}_text;")
+            conn.commit()
+        finally:
+            if conn is not None:
+                if not conn.closed:
+                    _rollback(conn)
+                pool.putconn(conn, close=bool(conn.closed))
+
+    if mode not in LOAD_MODES:
+        raise ValueError(f"Modo de carga desconocido: {mode!r}. Opciones: {LOAD_MODES}")
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for fut in [ex.submit(worker, n) for n in range(max(1, min(workers, pending.qsize())))]:
+            fut.result()
+    return results
+
+
+def throughput_report(results, elapsed, skipped=0):
+    """Resumen de la carga: lotes, filas, MB enviados y ritmo (filas/s, MB/s) sobre el tiempo total."""
+    ok = [r for r in results if not r['error']]
+    rows = sum(r['rows'] for r in ok)
+    sent_mb = sum(r['bytes'] for r in ok) / 1024**2
+    input_mb = sum(r['input_bytes'] for r in ok) / 1024**2
+    elapsed = max(elapsed, 1e-9)
+    busy = sum(r['seconds'] for r in ok)
+    lines = [
+        f"Lotes: OK={len(ok)}, FAIL={len(results) - len(ok)}, ya cargados (checkpoint)={skipped}",
+        f"Filas: {rows:,} en {elapsed:.1f} s -> {rows / elapsed:,.0f} filas/s",
+        f"Datos: {sent_mb:,.1f} MB por COPY ({input_mb:,.1f} MB de entrada) -> {sent_mb / elapsed:,.2f} MB/s",
+    ]
+    if ok:
+        lines.append(f"Por lote: {busy / len(ok):.2f} s de media, {rows / max(busy, 1e-9):,.0f} filas/s por conexión")
+    return "\n".join(lines)
@@ -0,0 +1,133 @@
+"""
+Tablas de rollup en PostgreSQL derivadas de la tabla horaria {schema}.{table} (h3_index, dt, value).
+
+Las consultas de 10_benchmarking.py (medias mensuales, top de celdas, conteos por año, patrón
+horario) recorren millones de filas horarias. Los rollups guardan los mismos resultados ya
+agregados y se refrescan de forma incremental tras cada carga (06_loadIntoDb.py):
+
+    {table}_cell_daily    h3_index, day DATE,    n, sum, sum_sq, min, max   PK (h3_index, day)
+    {table}_cell_monthly  h3_index, month DATE,  n, sum, sum_sq, min, max   PK (h3_index, month)
+    {table}_city_hourly   dt TIMESTAMP,          n, sum, sum_sq, min, max   PK (dt)
+
+Con n, sum y sum_sq se combinan periodos de forma exacta: media = SUM(sum) / SUM(n) y
+desviación típica muestral = sqrt((SUM(sum_sq) - SUM(sum)^2 / SUM(n)) / (SUM(n) - 1)).
+Los percentiles no se pueden recomponer y siguen necesitando las filas horarias.
+
+Son tablas y no MATERIALIZED VIEW porque REFRESH MATERIALIZED VIEW recalcula la vista entera;
+aquí se recalculan solo los meses naturales afectados por la carga (DELETE + INSERT ... SELECT
+del rango de dt del mes, en una transacción por mes). Un lote de CSV del mes M incluye la hora
+00:00 del día 1 del mes siguiente (H24), así que también se refresca el mes M+1.
+
+Uso:
+    from functions_rollups import ensure_rollup_tables, refresh_rollups
+    ensure_rollup_tables(cur, 'madno', 'h3_points', 'text')
+    refresh_rollups(conn, 'madno', 'h3_points', [(2024, 1), (2024, 2)])
+"""
+import time
+from datetime import date
+
+from functions_h3index import pg_h3_column_type
+
+# rollup -> (sufijo de la tabla, columnas clave, expresiones de la clave sobre la tabla horaria)
+ROLLUPS = {
+    'cell_daily': ('_cell_daily', "h3_index {h3_type} NOT NULL, day DATE NOT NULL",
+                   "h3_index, day", "h3_index, dt::date"),
+    'cell_monthly': ('_cell_monthly', "h3_index {h3_type} NOT NULL, month DATE NOT NULL",
+                     "h3_index, month", "h3_index, date_trunc('month', dt)::date"),
+    'city_hourly': ('_city_hourly', "dt TIMESTAMP WITHOUT TIME ZONE NOT NULL",
+                    "dt", "dt"),
+}
+
+# Columna del periodo de cada rollup (para borrar el rango de un mes)
+_PERIOD_COLUMN = {'cell_daily': 'day', 'cell_monthly': 'month', 'city_hourly': 'dt'}
+
+DDL_ROLLUP = """
+CREATE TABLE IF NOT EXISTS {schema}.{name} (
+  {key_columns},
+  n      INTEGER NOT NULL,
+  sum    DOUBLE PRECISION NOT NULL,
+  sum_sq DOUBLE PRECISION NOT NULL,
+  min    DOUBLE PRECISION NOT NULL,
+  max    DOUBLE PRECISION NOT NULL,
+  PRIMARY KEY ({key})
+);
+"""
+
+DDL_PERIOD_INDEX = "CREATE INDEX IF NOT EXISTS {name}_{period}_idx ON {schema}.{name} ({period});"
+
+REFRESH_ROLLUP = """
+DELETE FROM {schema}.{name} WHERE {period} >= %(start)s AND {period} < %(end)s;
+INSERT INTO {schema}.{name} ({key}, n, sum, sum_sq, min, max)
+SELECT {key_expr}, count(*), sum(value), sum(value * value), min(value), max(value)
+FROM {schema}.{table}
+WHERE dt >= %(start)s AND dt < %(end)s
+GROUP BY {key_expr};
+"""
+
+
+def rollup_table(table, rollup):
+    """Nombre de la tabla de un rollup: h3_points + cell_daily -> h3_points_cell_daily."""
+    return f"{table}{ROLLUPS[rollup][0]}"
+
+
+def ensure_rollup_tables(cur, schema, table, h3_mode='text'):
+    """Crea (si no existen) las tablas de rollup con el mismo tipo de h3_index que la tabla horaria."""
+    h3_type = pg_h3_column_type(h3_mode)
+    for rollup, (_, key_columns, key, _) in ROLLUPS.items():
+        name, period = rollup_table(table, rollup), _PERIOD_COLUMN[rollup]
+        cur.execute(DDL_ROLLUP.format(schema=schema, name=name, key_columns=key_columns.format(h3_type=h3_type), key=key))
+        if key != period:
+            # La PK empieza por h3_index: índice aparte para filtrar y refrescar por fecha
+            cur.execute(DDL_PERIOD_INDEX.format(schema=schema, name=name, period=period))
+
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def affected_months(batches):
+    """Meses naturales a refrescar tras cargar unos lotes: el de cada lote y el siguiente (H24)."""
+    months = set()
+    for batch in batches:
+        months.add((batch.year, batch.month))
+        months.add(_next_month(batch.year, batch.month))
+    return sorted(months)
+
+
+def table_months(cur, schema, table):
+    """Todos los meses entre el primer y el último dt de la tabla horaria (para reconstruir)."""
+    cur.execute(f"SELECT min(dt), max(dt) FROM {schema}.{table}")
+    first, last = cur.fetchone()
+    if first is None:
+        return []
+    months, ym = [], (first.year, first.month)
+    while ym <= (last.year, last.month):
+        months.append(ym)
+        ym = _next_month(*ym)
+    return months
+
+
+def refresh_rollups(conn, schema, table, months, rollups=None, on_month=None):
+    """Recalcula los rollups de los meses indicados, cada mes en su propia transacción.
+
+    months: lista de (year, month). on_month(year, month, seconds) se llama tras cada mes.
+    Devuelve los segundos totales.
+    """
+    t0 = time.time()
+    for year, month in months:
+        t1 = time.time()
+        params = {'start': date(year, month, 1), 'end': date(*_next_month(year, month), 1)}
+        with conn.cursor() as cur:
+            for rollup in rollups or ROLLUPS:
+                _, _, key, key_expr = ROLLUPS[rollup]
+                cur.execute(REFRESH_ROLLUP.format(schema=schema, table=table, name=rollup_table(table, rollup),
+                                                  period=_PERIOD_COLUMN[rollup], key=key, key_expr=key_expr),
+                            params)
+        conn.commit()
+        if on_month:
+            on_month(year, month, time.time() - t1)
+    with conn.cursor() as cur:
+        for rollup in rollups or ROLLUPS:
+            cur.execute(f"ANALYZE {schema}.{rollup_table(table, rollup)};")
+    conn.commit()
+    return time.time() - t0
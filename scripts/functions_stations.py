@@ -0,0 +1,141 @@
+"""
+Registro de estaciones de la red de calidad del aire.
+
+Lee informacion_estaciones_red_calidad_aire.xls una sola vez y lo guarda como tabla de arrays
+NumPy (código, lon/lat, ETRS89 x/y, EPSG:3857 x/y y fecha de alta). La tabla se persiste en un
+sidecar .npz junto al XLS que se reutiliza mientras el XLS no cambie (mtime/tamaño), y además
+se memoiza en el proceso, así que leerla en cada hora cuesta prácticamente nada.
+
+Uso:
+    from functions_stations import load_station_table
+    stations = load_station_table('informacion_estaciones_red_calidad_aire.xls')
+    lon, lat = stations.lonlat(df['ESTACION'].values)
+"""
+import logging
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+SIDECAR_SUFFIX = '.stations.npz'
+
+# Columnas del sidecar (mismo orden que los campos de StationTable)
+_FIELDS = ('code', 'lon', 'lat', 'x_etrs89', 'y_etrs89', 'x_3857', 'y_3857', 'fecha_alta')
+
+# Memo en proceso: ruta absoluta del XLS -> (firma del XLS, tabla)
+_TABLE_CACHE = {}
+
+
+@dataclass(frozen=True)
+class StationTable:
+    """Tabla de estaciones ordenada por código corto (CODIGO_CORTO)."""
+    code: np.ndarray        # int32
+    lon: np.ndarray         # float64, WGS84
+    lat: np.ndarray         # float64, WGS84
+    x_etrs89: np.ndarray    # float64, ETRS89 / UTM 30N
+    y_etrs89: np.ndarray    # float64
+    x_3857: np.ndarray      # float64, Web Mercator
+    y_3857: np.ndarray      # float64
+    fecha_alta: np.ndarray  # datetime64[D]
+
+    def __len__(self):
+        return len(self.code)
+
+    def positions(self, codes):
+        """Posición de cada código en la tabla (-1 si la estación no existe)."""
+        codes = np.asarray(codes, dtype=np.int64)
+        pos = np.searchsorted(self.code, codes)
+        pos = np.clip(pos, 0, max(len(self.code) - 1, 0))
+        found = self.code[pos] == codes if len(self.code) else np.zeros(len(codes), dtype=bool)
+        return np.where(found, pos, -1)
+
+    def _take(self, values, codes):
+        pos = self.positions(codes)
+        out = values[np.maximum(pos, 0)].astype(np.float64)
+        out[pos < 0] = np.nan
+        return out
+
+    def lonlat(self, codes):
+        """(lon, lat) de cada código; NaN para estaciones desconocidas."""
+        return self._take(self.lon, codes), self._take(self.lat, codes)
+
+    def xy_3857(self, codes):
+        """(x, y) en EPSG:3857 de cada código; NaN para estaciones desconocidas."""
+        return self._take(self.x_3857, codes), self._take(self.y_3857, codes)
+
+    def as_dict(self):
+        """{CODIGO_CORTO: [lon, lat]}, el formato del antiguo estaciones_dict."""
+        return {int(c): [float(lo), float(la)] for c, lo, la in zip(self.code, self.lon, self.lat)}
+
+
+def _xls_signature(estaciones_xls):
+    st = os.stat(estaciones_xls)
+    return np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+
+
+def _parse_xls(estaciones_xls):
+    """Parsea el XLS de estaciones (hoja 'Hoja1') a una StationTable."""
+    import pandas as pd
+    from pyproj import Transformer
+
+    logging.info(f"Parsing station table from {estaciones_xls}...")
+    estaciones = pd.read_excel(estaciones_xls, sheet_name='Hoja1')
+    estaciones = estaciones.dropna(subset=['CODIGO_CORTO', 'LONGITUD', 'LATITUD'])
+    estaciones = estaciones.sort_values('CODIGO_CORTO')
+
+    lon = estaciones['LONGITUD'].to_numpy(dtype=np.float64)
+    lat = estaciones['LATITUD'].to_numpy(dtype=np.float64)
+    to3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+    x_3857, y_3857 = to3857.transform(lon, lat)
+
+    return StationTable(
+        code=estaciones['CODIGO_CORTO'].to_numpy(dtype=np.int32),
+        lon=lon,
+        lat=lat,
+        x_etrs89=estaciones['COORDENADA_X_ETRS89'].to_numpy(dtype=np.float64),
+        y_etrs89=estaciones['COORDENADA_Y_ETRS89'].to_numpy(dtype=np.float64),
+        x_3857=np.asarray(x_3857, dtype=np.float64),
+        y_3857=np.asarray(y_3857, dtype=np.float64),
+        fecha_alta=pd.to_datetime(estaciones['Fecha alta']).to_numpy().astype('datetime64[D]'),
+    )
+
+
+def sidecar_path(estaciones_xls):
+    return estaciones_xls + SIDECAR_SUFFIX
+
+
+def load_station_table(estaciones_xls, use_sidecar=True):
+    """Devuelve la StationTable del XLS, reutilizando el memo del proceso y el sidecar .npz.
+
+    El sidecar se regenera si no existe o si el mtime/tamaño del XLS ha cambiado.
+    """
+    key = os.path.abspath(estaciones_xls)
+    signature = _xls_signature(estaciones_xls)
+
+    cached = _TABLE_CACHE.get(key)
+    if cached is not None and np.array_equal(cached[0], signature):
+        return cached[1]
+
+    table = None
+    npz_path = sidecar_path(estaciones_xls)
+    if use_sidecar and os.path.isfile(npz_path):
+        try:
+            with np.load(npz_path, allow_pickle=False) as npz:
+                if np.array_equal(npz['xls_signature'], signature):
+                    table = StationTable(**{f: npz[f] for f in _FIELDS})
+        except Exception as e:
+            logging.warning(f"WARNING: Ignoring unreadable station sidecar {npz_path}: {e}")
+
+    if table is None:
+        table = _parse_xls(estaciones_xls)
+        if use_sidecar:
+            try:
+                # Escritura atómica: otros procesos pueden estar leyendo el sidecar
+                tmp_path = npz_path + f'.{os.getpid()}.tmp.npz'
+                np.savez(tmp_path, xls_signature=signature, **{f: getattr(table, f) for f in _FIELDS})
+                os.replace(tmp_path, npz_path)
+            except OSError as e:
+                logging.warning(f"WARNING: Could not write station sidecar {npz_path}: {e}")
+
+    _TABLE_CACHE[key] = (signature, table)
+    return table
@@ -0,0 +1,164 @@
+"""
+Datos sintéticos de NO2 horario por celda H3 con la misma forma que el árbol Parquet real.
+
+Sirve para reproducir benchmarks y ejemplos sin /Volumes/MV/carto/madno2Parquet ni el servidor:
+
+- Celdas: las de la envolvente convexa de las estaciones de la red de Madrid (STUDY_AREA),
+  seleccionadas con build_h3_cells_in_polygon, la misma función que usa la exportación
+  (03_export_h3_points_convexhull.py), así que el conjunto de celdas por resolución es el real:
+  44 (res 7), 289 (res 8), 1.903 (res 9), 13.037 (res 10), ~90.500 (res 11).
+- Valores (µg/m³): nivel de fondo por celda, más alto en el centro; ciclo anual con máximo en
+  invierno; ciclo diario con picos de tráfico a las 8-9 h y 20-21 h y fines de semana más
+  limpios; una tendencia descendente interanual; un factor meteorológico común a toda la ciudad
+  (AR(1) horario, log-normal) y ruido por celda.
+- Convenio horario de la exportación (MonthPartitionWriter): cada hora va en la partición de su
+  mes, así que la del mes M contiene de las 00:00 del día 1 (H24 del último día del mes
+  anterior) a las 23:00 del último día.
+
+Cada mes usa su propia semilla (seed, año, mes): se puede generar en paralelo o por partes y el
+resultado es siempre el mismo.
+
+Uso:
+    from functions_synthetic import SyntheticNO2
+    model = SyntheticNO2(h3_res=9, seed=42)
+    for ts, values in model.month_hours(2005, 1):   # values alineados con model.cells
+        ...
+    write_month('/tmp/madno2Synthetic', model, 2005, 1)   # year=2005/month=01/part-synthetic.parquet
+"""
+import math
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+from shapely.geometry import Polygon
+
+from functions_03_convexhull import build_h3_cells_in_polygon, h3_cell_to_latlng
+from functions_h3index import h3_to_uint64
+from functions_parquet import H3_PARQUET_SCHEMA, StreamingParquetWriter, partition_dir
+
+# Envolvente convexa (lon, lat) de las estaciones de informacion_estaciones_red_calidad_aire.xls
+STUDY_AREA = [
+    (-3.71332, 40.34715), (-3.74734, 40.41936), (-3.77461, 40.51807), (-3.68973, 40.50055),
+    (-3.58003, 40.47692), (-3.58056, 40.46236), (-3.61214, 40.37301),
+]
+CITY_CENTER = (-3.7038, 40.4168)   # Puerta del Sol
+TREND_REFERENCE_YEAR = 2001
+
+
+def study_area_cells(h3_res, polygon=STUDY_AREA):
+    """Celdas H3 (texto, ordenadas) del polígono (lon, lat), con el mismo muestreo que la exportación."""
+    cells, _ = build_h3_cells_in_polygon(Polygon(polygon), h3_res)
+    return sorted(cells)
+
+
+def month_hours(year, month):
+    """Horas de la partición (year, month): de las 00:00 del día 1 a las 23:00 del último día."""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    n = int((end - start).total_seconds() // 3600)
+    return [start + timedelta(hours=k) for k in range(n)]
+
+
+def diurnal_profile(hours, weekend):
+    """Factor diario (media ~1): picos de tráfico por la mañana y la tarde, más suaves en fin de semana."""
+    hours = np.asarray(hours, dtype=np.float64)
+    morning = np.exp(-((hours - 8.5) / 1.8) ** 2) * np.where(weekend, 0.25, 0.55)
+    evening = np.exp(-((hours - 20.5) / 2.5) ** 2) * np.where(weekend, 0.45, 0.6)
+    night = -0.25 * np.exp(-((hours - 4.0) / 2.0) ** 2)
+    midday = -0.15 * np.exp(-((hours - 15.0) / 2.5) ** 2)
+    return 0.85 + morning + evening + night + midday
+
+
+def seasonal_profile(day_of_year):
+    """Factor anual: máximo a mediados de enero (+30 %) y mínimo en verano (-30 %)."""
+    return 1.0 + 0.3 * np.cos(2 * math.pi * (np.asarray(day_of_year, dtype=np.float64) - 15) / 365.25)
+
+
+class SyntheticNO2:
+    """Generador determinista de NO2 horario para las celdas de STUDY_AREA a una resolución."""
+
+    def __init__(self, h3_res=9, seed=42, polygon=STUDY_AREA, trend_per_year=-0.015,
+                 weather_sigma=0.25, weather_rho=0.97, cell_noise=0.08):
+        self.h3_res = h3_res
+        self.seed = seed
+        self.trend_per_year = trend_per_year
+        self.weather_sigma = weather_sigma
+        self.weather_rho = weather_rho
+        self.cell_noise = cell_noise
+
+        cells = study_area_cells(h3_res, polygon)
+        if not cells:
+            raise ValueError(f"La zona de estudio no contiene celdas a resolución {h3_res}")
+        self.cells = h3_to_uint64(cells)
+
+        # Fondo por celda: ~50 µg/m³ en el centro, ~25 en la periferia, con variación local estable
+        lat, lon = np.array([h3_cell_to_latlng(c) for c in cells]).T
+        dx = (lon - CITY_CENTER[0]) * 111.32 * math.cos(math.radians(CITY_CENTER[1]))
+        dy = (lat - CITY_CENTER[1]) * 110.57
+        dist_km = np.hypot(dx, dy)
+        rng = np.random.default_rng([seed, h3_res])
+        self.base = 25.0 + 25.0 * np.exp(-(dist_km / 5.0) ** 2) + rng.normal(0.0, 2.0, len(cells))
+
+    @property
+    def n_cells(self):
+        return len(self.cells)
+
+    def month_hours(self, year, month):
+        """Genera (datetime, valores float32 alineados con self.cells) para cada hora de la partición."""
+        rng = np.random.default_rng([self.seed, self.h3_res, year, month])
+        hours = month_hours(year, month)
+        when = np.array(hours, dtype='datetime64[h]')
+        hour_of_day = np.array([ts.hour for ts in hours])
+        weekend = np.array([ts.weekday() >= 5 for ts in hours])
+        day_of_year = np.array([ts.timetuple().tm_yday for ts in hours])
+
+        # Meteorología común a la ciudad: AR(1) horario en escala logarítmica
+        shocks = rng.normal(0.0, self.weather_sigma * math.sqrt(1 - self.weather_rho ** 2), len(hours))
+        weather = np.empty(len(hours))
+        weather[0] = rng.normal(0.0, self.weather_sigma)
+        for k in range(1, len(hours)):
+            weather[k] = self.weather_rho * weather[k - 1] + shocks[k]
+
+        years = (when.astype('datetime64[Y]').astype(int) + 1970) - TREND_REFERENCE_YEAR
+        city = (diurnal_profile(hour_of_day, weekend) * seasonal_profile(day_of_year)
+                * (1 + self.trend_per_year) ** years * np.exp(weather - self.weather_sigma ** 2 / 2))
+
+        for k, ts in enumerate(hours):
+            noise = rng.lognormal(-self.cell_noise ** 2 / 2, self.cell_noise, self.n_cells)
+            values = np.maximum(self.base * city[k] * noise, 0.5)
+            yield ts, np.round(values, 3).astype(np.float32)
+
+    def month_rows(self, year, month):
+        """Filas de la partición: n_cells × horas del mes."""
+        return self.n_cells * len(month_hours(year, month))
+
+
+def write_month(root, model, year, month, options=None, tag='synthetic', max_rows=2_000_000):
+    """Escribe la partición (year, month) del modelo en <root>/year=YYYY/month=MM/part-<tag>.parquet.
+
+    Se escribe por días (24 horas × celdas) con StreamingParquetWriter: la memoria no depende de la
+    resolución ni de la longitud del mes. Devuelve las filas escritas.
+    """
+    path = os.path.join(partition_dir(root, year, month), f"part-{tag}.parquet")
+    hours_per_chunk = 24
+    with StreamingParquetWriter(path, H3_PARQUET_SCHEMA, options, max_rows=max_rows) as writer:
+        stamps, chunks = [], []
+        for ts, values in model.month_hours(year, month):
+            stamps.append(ts)
+            chunks.append(values)
+            if len(stamps) == hours_per_chunk:
+                writer.write(_hours_table(model.cells, stamps, chunks))
+                stamps, chunks = [], []
+        if stamps:
+            writer.write(_hours_table(model.cells, stamps, chunks))
+    return writer.rows_written
+
+
+def _hours_table(cells, stamps, chunks):
+    n = len(cells)
+    return pa.table({
+        'h3_index': pa.array(np.tile(cells, len(stamps)), pa.uint64()),
+        'datetime': pa.array(np.repeat(np.array(stamps, dtype='datetime64[us]'), n), pa.timestamp('us')),
+        'value': pa.array(np.concatenate(chunks), pa.float32()),
+    }, schema=H3_PARQUET_SCHEMA)